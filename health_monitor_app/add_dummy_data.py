@@ -3,7 +3,8 @@ import os
 import random
 from datetime import datetime, timedelta
 from app import create_app, db
-from app.models import User, HealthData
+from app.models import User, HealthData, UserDataVersion
+from app.health_data import rollups, snapshots
 
 def get_mood_for_stress_level(stress_level):
     """Select appropriate mood based on stress level"""
@@ -127,6 +128,12 @@ def create_dummy_data():
                 db.session.add(health_data)
                 print(f"Added record {i+1}/25 - Date: {record_date.strftime('%Y-%m-%d %H:%M')}")
             
+            # Bulk inserts bypass the write hooks, so rebuild the derived tables
+            db.session.flush()
+            rollups.rebuild(user.id)
+            snapshots.rebuild(user.id)
+            UserDataVersion.bump(user.id)
+
             print("Committing records to database...")
             db.session.commit()
             
@@ -6,11 +6,70 @@ instance and registers all necessary configurations and blueprints.
 """
 
 import os
-import logging
-from logging.handlers import RotatingFileHandler
 from flask import Flask
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+from .extensions import db, login, chart_cache, chart_renderer, write_queue, baseline_index, request_metrics
+from .log_pipeline import configure_logging
+from .slow_queries import install_slow_query_log
+from .sqlite_profile import configure_engine_options, install_profile
+
+
+class SchemaUpgradeError(RuntimeError):
+    """Raised when an existing database cannot be brought up to the current schema."""
+
+
+def _check_duplicate_records(app):
+    """
+    Refuse to start while duplicate health records block the unique (user, date) index.
+
+    Writes upsert on (user_id, date) and fail without the index. The
+    duplicates are not removed here: ``flask db dedupe`` lists and removes
+    them, with ALLOW_DUPLICATE_RECORDS set so the app starts for it.
+
+    Args:
+        app: Flask application instance
+
+    Raises:
+        SchemaUpgradeError: If duplicates remain and ALLOW_DUPLICATE_RECORDS is not set
+    """
+    from .health_data.writes import count_duplicates
+
+    try:
+        counts = count_duplicates()
+    finally:
+        db.session.remove()
+    message = (f"{sum(count for _, count in counts)} duplicate health records of {len(counts)} users "
+               "keep (user_id, date) from being made unique")
+    if not app.config['ALLOW_DUPLICATE_RECORDS']:
+        raise SchemaUpgradeError(
+            f"{message}; remove them with 'HEALTH_MONITOR_ALLOW_DUPLICATES=1 flask --app run db dedupe'"
+        )
+    app.logger.warning(f"{message}; run 'flask db dedupe' to remove them")
+
+
+def _backfill_rollups(app):
+    """
+    Build the rollups of records added before the rollup tables existed.
+
+    Args:
+        app: Flask application instance
+    """
+    from .health_data import rollups
+
+    try:
+        user_ids = rollups.backfill()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+    if user_ids:
+        app.logger.info(f"Built the health data rollups of {len(user_ids)} users")
 
-from .extensions import db, login
 
 def create_app(test_config=None):
     """
@@ -29,7 +88,85 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(app.instance_path, 'health_monitor.db'),
-        SQLALCHEMY_TRACK_MODIFICATIONS=False
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # History page: 'keyset' (cursor) or 'offset' (page number) pagination
+        HISTORY_PAGINATION='keyset',
+        HISTORY_PER_PAGE=10,
+        HISTORY_SHOW_TOTAL=True,
+        HISTORY_COUNT_CACHE_SECONDS=60,
+        # Number of days plotted in the history page preview charts
+        HISTORY_PREVIEW_DAYS=90,
+        # Sync API: changes per page by default and at most (?limit=)
+        SYNC_PAGE_SIZE=500,
+        SYNC_MAX_PAGE_SIZE=5000,
+        # Rendered chart cache: in-process LRU size and optional disk tier
+        CHART_CACHE_SIZE=256,
+        CHART_CACHE_DISK=False,
+        CHART_CACHE_DISK_MAX_ENTRIES=2048,
+        # 'client' draws charts with Chart.js from /api/series, 'server' links PNG routes
+        CHART_RENDER_MODE='client',
+        # Browser cache lifetime of chart images, whose URLs change when data does
+        CHART_IMAGE_MAX_AGE=86400,
+        # Chart rendering pool: worker processes (0 renders inline), renders
+        # allowed to wait for a worker, and seconds to wait for each render
+        CHART_RENDER_WORKERS=2,
+        CHART_RENDER_QUEUE_SIZE=16,
+        CHART_RENDER_TIMEOUT=10.0,
+        # 'spawn' workers re-import the main module (e.g. run.py), which
+        # must only build the app under if __name__ == '__main__'
+        CHART_RENDER_START_METHOD='spawn',
+        # Graph and dashboard data: 'day' reads the daily rollups, 'raw' every record
+        GRAPH_RESOLUTION='day',
+        # Sample store: most buckets a graph downsamples samples to, and most
+        # samples accepted per POST to /api/samples
+        SAMPLE_GRAPH_POINTS=720,
+        SAMPLE_MAX_APPEND=50000,
+        # SQLite pragmas applied to every connection (None keeps SQLite's
+        # default); cache_size is in KiB when negative, busy_timeout in ms
+        SQLITE_JOURNAL_MODE='wal',
+        SQLITE_SYNCHRONOUS='normal',
+        SQLITE_CACHE_SIZE=-32768,
+        SQLITE_MMAP_SIZE=128 * 1024 * 1024,
+        SQLITE_BUSY_TIMEOUT=5000,
+        SQLITE_TEMP_STORE='memory',
+        # Pooled connections to an SQLite file (0 opens one per checkout)
+        SQLITE_POOL_SIZE=5,
+        # Write queue: commit writes in groups on one writer thread, letting
+        # a group gather for up to WRITE_QUEUE_WINDOW_MS under load; callers
+        # wait at most WRITE_QUEUE_TIMEOUT seconds (False commits in the request)
+        WRITE_QUEUE_ENABLED=True,
+        WRITE_QUEUE_MAX_BATCH=64,
+        WRITE_QUEUE_WINDOW_MS=5,
+        WRITE_QUEUE_TIMEOUT=10.0,
+        # Seconds between checks of the baseline table for changes made by
+        # other processes (None only reloads after this process's writes)
+        BASELINE_CHECK_SECONDS=60,
+        # Per-endpoint request, SQL, template and chart timings served at
+        # /metrics to scrapers sending METRICS_TOKEN as a Bearer token
+        # (without a token, /metrics is not served)
+        METRICS_ENABLED=True,
+        METRICS_TOKEN=None,
+        # Statements taking SLOW_QUERY_MS or longer are logged with the
+        # number and types of their parameters and SQLite query plan, each
+        # at most once per SLOW_QUERY_LOG_INTERVAL seconds (None disables
+        # the log); SLOW_QUERY_LOG_PARAMETERS also logs the values, which
+        # hold health data and user IDs
+        SLOW_QUERY_MS=100,
+        SLOW_QUERY_LOG_INTERVAL=60,
+        SLOW_QUERY_EXPLAIN=True,
+        SLOW_QUERY_LOG_PARAMETERS=False,
+        # Log file written by a background thread (outside debug mode), as
+        # 'json' lines or 'text'; records beyond LOG_QUEUE_SIZE waiting to
+        # be written are dropped. LOG_REQUESTS logs each request's latency
+        LOG_FILE='logs/health_monitor.log',
+        LOG_FORMAT='json',
+        LOG_MAX_BYTES=10 * 1024 * 1024,
+        LOG_BACKUP_COUNT=10,
+        LOG_QUEUE_SIZE=10000,
+        LOG_REQUESTS=True,
+        # Start even though duplicate health records keep (user_id, date)
+        # from being made unique, so 'flask db dedupe' can remove them
+        ALLOW_DUPLICATE_RECORDS=os.environ.get('HEALTH_MONITOR_ALLOW_DUPLICATES') == '1'
     )
     
     # Ensure the instance folder exists
@@ -43,13 +180,48 @@ def create_app(test_config=None):
         app.config.from_mapping(test_config)
     
     # Initialize extensions with app
+    configure_engine_options(app)
     db.init_app(app)
     login.init_app(app)
+    chart_cache.init_app(app)
+    chart_renderer.init_app(app)
+    write_queue.init_app(app)
+    baseline_index.init_app(app)
+    request_metrics.init_app(app)
     
     # Ensure database tables exist
     with app.app_context():
+        install_profile(db.engine, app.config)
+        install_slow_query_log(db.engine, app.config)
         try:
             db.create_all()
+            # create_all() skips tables that already exist, so add any
+            # columns and indexes introduced after the table was first created
+            inspector = inspect(db.engine)
+            unique_records = True
+            for table in db.metadata.sorted_tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        spec = CreateColumn(column).compile(dialect=db.engine.dialect)
+                        with db.engine.begin() as connection:
+                            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {spec}')
+                for index in table.indexes:
+                    try:
+                        index.create(bind=db.engine, checkfirst=True)
+                    except IntegrityError:
+                        # Duplicate records keep the unique index from being built
+                        if table.name != 'health_data':
+                            raise
+                        _check_duplicate_records(app)
+                        unique_records = False
+            # Replaced by ux_health_data_user_date, once that could be built
+            if unique_records:
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql('DROP INDEX IF EXISTS ix_health_data_user_date')
+            _backfill_rollups(app)
+        except SchemaUpgradeError:
+            raise
         except Exception as e:
             app.logger.error(f"Error creating database tables: {e}")
     
@@ -62,20 +234,16 @@ def create_app(test_config=None):
     app.register_blueprint(health_data_blueprint)
     
     # Register main routes
-    from . import routes
-    app.register_blueprint(routes.main)
+    from .main import main as main_blueprint
+    app.register_blueprint(main_blueprint)
+
+    # Register CLI commands
+    from . import cli
+    cli.init_app(app)
     
     # Setup logging
+    configure_logging(app)
     if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/health_monitor.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
         app.logger.info('Health Monitor startup')
         
     return app 
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""
+In-memory index of the demographic baselines.
+
+MetadataBaseline is a small reference table that db_setup.py seeds once,
+but the dashboard reads several baselines on every load. The index loads
+the whole table into a dictionary keyed by (gender, age group) and then
+metric, with the metadata JSON already parsed, so a lookup is a couple
+of dictionary accesses. It is rebuilt when the table changes: right away
+when this process commits baselines written through the ORM, and within
+BASELINE_CHECK_SECONDS when another process (such as db_setup.py) does,
+by comparing the table's rows with those the index was built from.
+"""
+
+import json
+import threading
+import time
+import weakref
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from flask import Flask, current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+# Baselines of one demographic: metric -> read-only baseline
+Baselines = Mapping[str, Mapping[str, Any]]
+
+_EMPTY: Baselines = MappingProxyType({})
+
+
+class _IndexState:
+    """One application's loaded baselines."""
+
+    def __init__(self, check_seconds: Optional[float]):
+        self.check_seconds = check_seconds
+        self.entries: Dict[Tuple[str, str], Baselines] = {}
+        self.rows_hash: Optional[int] = None
+        self.checked_at = float('-inf')
+        self.stale = True
+        self.loads = 0
+        self.lock = threading.Lock()
+
+
+class BaselineIndex:
+    """
+    Cached lookups of MetadataBaseline rows by gender, age and metric.
+
+    Baselines are returned as read-only mappings shared between callers,
+    with the keys get_baseline() always returned: avg, min and max plus
+    the parsed metadata.
+
+    Args:
+        db: Database extension the baselines are read with
+        app: Flask application instance (optional)
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+        self._states: 'weakref.WeakSet[_IndexState]' = weakref.WeakSet()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Set up an empty index for the application; it loads on first use.
+
+        Uses BASELINE_CHECK_SECONDS: how often the table is compared with
+        the index for changes made by other processes (None never checks).
+
+        Args:
+            app: Flask application instance
+        """
+        state = _IndexState(app.config.get('BASELINE_CHECK_SECONDS', 60))
+        self._states.add(state)
+        app.extensions['baseline_index'] = state
+        if not self._listening:
+            from .models import MetadataBaseline
+
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(MetadataBaseline, name, _mark_session)
+            event.listen(Session, 'after_commit', self._after_commit)
+            self._listening = True
+
+    def for_demographic(self, gender: Optional[str], age: Optional[int]) -> Baselines:
+        """
+        Look up every baseline of a demographic.
+
+        Args:
+            gender: User gender
+            age: User age in years
+
+        Returns:
+            Mapping of metric type to baseline, empty if the gender or age
+            is unknown or has no baselines
+        """
+        if not gender or age is None:
+            return _EMPTY
+        from .models import MetadataBaseline
+
+        entries = self._entries()
+        return entries.get((gender, MetadataBaseline.age_group_for(age)), _EMPTY)
+
+    def get(self, gender: Optional[str], age: Optional[int], metric_type: str) -> Optional[Mapping[str, Any]]:
+        """
+        Look up one baseline.
+
+        Args:
+            gender: User gender
+            age: User age in years
+            metric_type: Type of health metric
+
+        Returns:
+            Read-only baseline, or None if not found
+        """
+        return self.for_demographic(gender, age).get(metric_type)
+
+    def reload(self) -> None:
+        """Rebuild the current application's index on its next use."""
+        current_app.extensions['baseline_index'].stale = True
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the current application's index counters.
+
+        Returns:
+            Dictionary with demographics, baselines and loads
+        """
+        state = current_app.extensions['baseline_index']
+        return {
+            'demographics': len(state.entries),
+            'baselines': sum(len(baselines) for baselines in state.entries.values()),
+            'loads': state.loads
+        }
+
+    def _entries(self) -> Dict[Tuple[str, str], Baselines]:
+        state: _IndexState = current_app.extensions['baseline_index']
+        if _due(state):
+            with state.lock:
+                if _due(state):
+                    self._refresh(state)
+        return state.entries
+
+    def _refresh(self, state: _IndexState) -> None:
+        # Caller holds the state's lock. Reading the whole table is cheap;
+        # building the index is only redone when the rows differ
+        from .models import MetadataBaseline
+
+        stale, state.stale = state.stale, False
+        table = MetadataBaseline.__table__
+        rows = self.db.session.execute(select(table).order_by(table.c.id)).all()
+        rows_hash = hash(tuple(tuple(row) for row in rows))
+        if stale or rows_hash != state.rows_hash:
+            state.entries = _build(rows)
+            state.rows_hash = rows_hash
+            state.loads += 1
+        state.checked_at = time.monotonic()
+
+    def _after_commit(self, session: Session) -> None:
+        # Baselines were committed in this process; which app's database
+        # they went to is not known here, so all indexes reload
+        if session.info.pop('baselines_changed', False):
+            for state in list(self._states):
+                state.stale = True
+
+
+def _mark_session(mapper: Any, connection: Any, target: Any) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info['baselines_changed'] = True
+
+
+def _due(state: _IndexState) -> bool:
+    if state.stale:
+        return True
+    return state.check_seconds is not None and time.monotonic() - state.checked_at >= state.check_seconds
+
+
+def _build(rows: Any) -> Dict[Tuple[str, str], Baselines]:
+    entries: Dict[Tuple[str, str], Dict[str, Mapping[str, Any]]] = {}
+    for row in rows:
+        baseline = {'avg': row.avg_value, 'min': row.min_value, 'max': row.max_value}
+        if row.metadata_json:
+            try:
+                baseline.update(json.loads(row.metadata_json))
+            except json.JSONDecodeError:
+                pass
+        # Like the query it replaces, the first row of a duplicate wins
+        entries.setdefault((row.gender, row.age_group), {}).setdefault(
+            row.metric_type, MappingProxyType(baseline)
+        )
+    return {key: MappingProxyType(baselines) for key, baselines in entries.items()}
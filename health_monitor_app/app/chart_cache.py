@@ -0,0 +1,297 @@
+"""
+Rendered chart cache for the Health Monitor application.
+
+Rendering a chart with matplotlib and encoding it as PNG is the most
+expensive part of the graph, history and dashboard pages. This module
+caches the PNG bytes keyed by everything that determines the image,
+including a per-user data version that is bumped on every write, so a
+cached chart is never served after the underlying data has changed.
+Keys also carry CHART_VERSION, so charts drawn by older rendering code
+are not served either, and the user's creation time, so a user ID that
+SQLite hands out again after a deletion cannot match the charts of the
+account that had it before.
+
+The cache has a bounded in-process LRU tier and an optional on-disk tier
+under the instance folder that survives restarts and is shared between
+worker processes. Charts are served to browsers as PNG responses with a
+strong ETag derived from the same key, so unchanged charts revalidate
+with a 304 without being rendered or even looked up.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from flask import Flask, Response, abort, current_app, request
+
+from .chart_render import ChartRenderTimeout
+
+if TYPE_CHECKING:
+    from .models import User
+
+# Version of the chart rendering code; bump it whenever a change alters
+# the images, so cached charts and browsers' copies are drawn again
+CHART_VERSION = 1
+
+# Cache key: (CHART_VERSION, user_id, user salt, kind, parameter,
+# time_period, reference_date, data_version)
+ChartKey = Tuple[int, int, str, str, str, str, str, int]
+
+
+def chart_key(user: 'User', kind: str, parameter: str, time_period: str,
+              reference_date: date, data_version: int) -> ChartKey:
+    """
+    Build the cache key for a rendered chart.
+
+    Args:
+        user: Owner of the charted data; their ID and creation time are
+            part of the key
+        kind: Chart family ('graph', 'preview', 'dashboard')
+        parameter: Health parameter being charted
+        time_period: Period covered by the chart ('week', '90d', ...)
+        reference_date: Date the period is anchored to
+        data_version: The user's current data version
+
+    Returns:
+        Hashable cache key
+    """
+    salt = user.created_at.isoformat() if user.created_at else ''
+    return (CHART_VERSION, user.id, salt, kind, parameter, time_period, reference_date.isoformat(),
+            data_version)
+
+
+def chart_etag(key: ChartKey) -> str:
+    """
+    Derive a strong entity tag for a chart from its cache key.
+
+    The tag covers the whole key, so it changes with CHART_VERSION and
+    differs between users who had the same ID.
+
+    Args:
+        key: Cache key from chart_key()
+
+    Returns:
+        Opaque ETag value (without quotes)
+    """
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def chart_response(key: ChartKey, render: Callable[[], bytes]) -> Response:
+    """
+    Serve a chart as a cacheable PNG response.
+
+    A request whose If-None-Match matches the chart's ETag is answered with
+    304 before anything is rendered. Charts with nothing to draw are 404s,
+    and a render that times out is a 503 the browser may retry.
+    Responses are private to the user and may be reused by the browser for
+    CHART_IMAGE_MAX_AGE seconds; pages put the data version in chart URLs,
+    so a write produces a new URL rather than a stale cached image.
+
+    Args:
+        key: Cache key from chart_key()
+        render: Zero-argument callable producing the PNG bytes
+
+    Returns:
+        PNG or 304 Not Modified response
+    """
+    etag = chart_etag(key)
+    max_age = current_app.config.get('CHART_IMAGE_MAX_AGE', 86400)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            png = current_app.extensions['chart_cache'].get_or_render(key, render)
+        except ChartRenderTimeout as e:
+            current_app.logger.warning(f"Chart render timed out: {e}")
+            response = Response('Chart rendering timed out', status=503, mimetype='text/plain')
+            response.retry_after = 1
+            response.cache_control.no_store = True
+            return response
+        if not png:
+            abort(404)
+        response = Response(png, mimetype='image/png')
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+class ChartCache:
+    """
+    Two-tier cache of rendered chart PNGs.
+
+    Empty bytes are a valid cached value and mean "nothing to draw", so
+    callers can cache the absence of a chart as well.
+
+    Attributes:
+        max_entries: Capacity of the in-process LRU tier
+        disk_dir: Directory of the on-disk tier, or None if disabled
+        max_disk_entries: Number of files the on-disk tier is pruned back to
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.max_entries = 256
+        self.disk_dir: Optional[str] = None
+        self.max_disk_entries = 2048
+        self._entries: 'OrderedDict[ChartKey, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes_since_prune = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configure the cache from application settings.
+
+        Uses CHART_CACHE_SIZE, CHART_CACHE_DISK and CHART_CACHE_DISK_MAX_ENTRIES.
+
+        Args:
+            app: Flask application instance
+        """
+        self.max_entries = app.config.get('CHART_CACHE_SIZE', 256)
+        self.max_disk_entries = app.config.get('CHART_CACHE_DISK_MAX_ENTRIES', 2048)
+        self.disk_dir = None
+        if app.config.get('CHART_CACHE_DISK'):
+            self.disk_dir = os.path.join(app.instance_path, 'chart_cache')
+            os.makedirs(self.disk_dir, exist_ok=True)
+        self.clear()
+        app.extensions['chart_cache'] = self
+
+    def get(self, key: ChartKey) -> Optional[bytes]:
+        """
+        Look up a rendered chart.
+
+        Args:
+            key: Cache key from chart_key()
+
+        Returns:
+            PNG bytes (possibly empty), or None on a miss
+        """
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+
+        png = self._read_disk(key)
+        with self._lock:
+            if png is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, png)
+        return png
+
+    def set(self, key: ChartKey, png: bytes) -> None:
+        """
+        Store a rendered chart in both tiers.
+
+        Args:
+            key: Cache key from chart_key()
+            png: PNG bytes, or empty bytes for "nothing to draw"
+        """
+        with self._lock:
+            self._store(key, png)
+        self._write_disk(key, png)
+
+    def get_or_render(self, key: ChartKey, render: Callable[[], bytes]) -> bytes:
+        """
+        Return a cached chart, rendering and storing it on a miss.
+
+        Args:
+            key: Cache key from chart_key()
+            render: Zero-argument callable producing the PNG bytes
+
+        Returns:
+            PNG bytes
+        """
+        png = self.get(key)
+        if png is None:
+            png = render()
+            self.set(key, png)
+        return png
+
+    def clear(self) -> None:
+        """Drop all in-process entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return cache counters.
+
+        Returns:
+            Dictionary with entries, hits, disk_hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _store(self, key: ChartKey, png: bytes) -> None:
+        # Caller holds the lock
+        self._entries[key] = png
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: ChartKey) -> str:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, f'{digest}.png')
+
+    def _read_disk(self, key: ChartKey) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: ChartKey, png: bytes) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        self._disk_writes_since_prune += 1
+        if self._disk_writes_since_prune >= max(1, self.max_disk_entries // 10):
+            self._disk_writes_since_prune = 0
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        # Remove the least recently written files beyond the size limit
+        try:
+            entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith('.png')]
+        except OSError:
+            return
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,378 @@
+"""
+Chart rendering service for the Health Monitor application.
+
+Charts are described by small, picklable specs (plain NumPy arrays plus
+styling) and drawn with matplotlib's object-oriented ``Figure`` /
+``FigureCanvasAgg`` API, which keeps no global state, unlike ``pyplot``.
+Rendering runs in a pool of worker processes so charts are drawn in
+parallel without holding the request threads' GIL. The number of renders
+waiting for the pool is bounded; when the pool is disabled, full or
+broken the chart is drawn inline in the calling thread, and a render that
+exceeds its timeout raises ChartRenderTimeout.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class ChartRenderTimeout(Exception):
+    """Raised when a chart is not rendered within CHART_RENDER_TIMEOUT."""
+
+
+@dataclass(frozen=True)
+class SeriesSpec:
+    """
+    One plotted series.
+
+    Attributes:
+        x: Dates as a datetime64 array
+        y: Values as a float64 array, NaN where missing
+        color: Matplotlib color
+        label: Legend label
+        style: 'line', 'points' (line with markers) or 'bar'
+    """
+    x: np.ndarray
+    y: np.ndarray
+    color: str
+    label: Optional[str] = None
+    style: str = 'line'
+
+    @staticmethod
+    def from_frame(df: pd.DataFrame, column: str, color: str,
+                   label: Optional[str] = None, style: str = 'line') -> 'SeriesSpec':
+        """
+        Build a series from a DataFrame's ``date`` column and a value column.
+
+        Args:
+            df: DataFrame with a ``date`` column
+            column: Value column to plot
+            color: Matplotlib color
+            label: Legend label
+            style: 'line', 'points' or 'bar'
+
+        Returns:
+            SeriesSpec holding copies of the data as plain NumPy arrays
+        """
+        x = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+        y = pd.to_numeric(df[column]).to_numpy(dtype=np.float64, na_value=np.nan)
+        return SeriesSpec(x, y, color, label, style)
+
+
+@dataclass(frozen=True)
+class ChartSpec:
+    """
+    Everything needed to draw a chart, independent of the application.
+
+    Attributes:
+        series: Series to plot
+        figsize: Figure size in inches
+        dpi: Output resolution
+        title: Chart title
+        title_size: Title font size (matplotlib default if None)
+        tick_size: Tick label font size (matplotlib default if None)
+        xlabel: X-axis label
+        ylabel: Y-axis label
+        legend: Whether to draw a legend
+        grid: Whether to draw a light grid
+        rotate_dates: Whether to slant the date labels
+    """
+    series: Tuple[SeriesSpec, ...]
+    figsize: Tuple[float, float] = (10, 6)
+    dpi: int = 100
+    title: Optional[str] = None
+    title_size: Optional[float] = None
+    tick_size: Optional[float] = None
+    xlabel: Optional[str] = None
+    ylabel: Optional[str] = None
+    legend: bool = False
+    grid: bool = False
+    rotate_dates: bool = False
+
+
+def draw_chart(spec: ChartSpec) -> bytes:
+    """
+    Draw a chart to PNG bytes.
+
+    Safe to call from any thread or process: the figure is private to the
+    call and nothing is registered with pyplot.
+
+    Args:
+        spec: Chart description
+
+    Returns:
+        PNG image bytes
+    """
+    fig = Figure(figsize=spec.figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    for series in spec.series:
+        if series.style == 'bar':
+            ax.bar(series.x, series.y, color=series.color, label=series.label)
+        else:
+            fmt = 'o-' if series.style == 'points' else '-'
+            ax.plot(series.x, series.y, fmt, color=series.color, label=series.label)
+
+    if spec.title:
+        ax.set_title(spec.title, fontsize=spec.title_size)
+    if spec.tick_size:
+        ax.tick_params(axis='both', which='both', labelsize=spec.tick_size)
+    if spec.xlabel:
+        ax.set_xlabel(spec.xlabel)
+    if spec.ylabel:
+        ax.set_ylabel(spec.ylabel)
+    if spec.grid:
+        ax.grid(True, alpha=0.3)
+    if spec.legend:
+        ax.legend()
+    if spec.rotate_dates:
+        fig.autofmt_xdate()
+    fig.tight_layout()
+
+    img = BytesIO()
+    fig.savefig(img, format='png', dpi=spec.dpi)
+    return img.getvalue()
+
+
+class ChartRenderer:
+    """
+    Renders chart specs in a pool of worker processes.
+
+    The pool is started on first use. At most ``queue_size`` renders may
+    be submitted and not yet finished; beyond that, and whenever the pool
+    is disabled or has broken, charts are drawn inline instead.
+
+    Attributes:
+        workers: Number of worker processes (0 renders everything inline)
+        queue_size: Maximum number of renders outstanding in the pool
+        timeout: Seconds to wait for a pooled render
+        start_method: multiprocessing start method for the workers
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.workers = 0
+        self.queue_size = 16
+        self.timeout = 10.0
+        self.start_method = 'spawn'
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._atexit_registered = False
+        self.pooled = 0
+        self.inline = 0
+        self.rejected = 0
+        self.timeouts = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configure the renderer from application settings.
+
+        Uses CHART_RENDER_WORKERS, CHART_RENDER_QUEUE_SIZE,
+        CHART_RENDER_TIMEOUT and CHART_RENDER_START_METHOD.
+
+        Args:
+            app: Flask application instance
+        """
+        self.shutdown()
+        self.workers = app.config.get('CHART_RENDER_WORKERS', 2)
+        self.queue_size = app.config.get('CHART_RENDER_QUEUE_SIZE', 16)
+        self.timeout = app.config.get('CHART_RENDER_TIMEOUT', 10.0)
+        self.start_method = app.config.get('CHART_RENDER_START_METHOD', 'spawn')
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        app.extensions['chart_renderer'] = self
+
+    def render(self, spec: ChartSpec) -> bytes:
+        """
+        Render a chart, in the pool when possible.
+
+        Args:
+            spec: Chart description
+
+        Returns:
+            PNG image bytes
+
+        Raises:
+            ChartRenderTimeout: If the pooled render takes too long
+        """
+        with timed('chart'):
+            future = self.submit(spec)
+            if future is None:
+                return self._render_inline(spec)
+            return self._result(future, spec)
+
+    def render_many(self, specs: Sequence[ChartSpec]) -> List[bytes]:
+        """
+        Render several charts concurrently.
+
+        All specs are submitted before waiting on any of them, so the
+        charts are drawn in parallel up to the number of workers.
+
+        Args:
+            specs: Chart descriptions
+
+        Returns:
+            PNG image bytes for each spec, in order
+
+        Raises:
+            ChartRenderTimeout: If a pooled render takes too long
+        """
+        with timed('chart'):
+            futures = [self.submit(spec) for spec in specs]
+            return [self._result(future, spec) if future is not None else self._render_inline(spec)
+                    for future, spec in zip(futures, specs)]
+
+    def submit(self, spec: ChartSpec, key: Optional[Hashable] = None,
+               on_done: Optional[Callable[[bytes], None]] = None) -> Optional[Future]:
+        """
+        Start rendering a chart in the pool without waiting for it.
+
+        Args:
+            spec: Chart description
+            key: Optional key under which the render can be joined with wait()
+            on_done: Optional callback receiving the PNG bytes on success
+
+        Returns:
+            Future for the PNG bytes, or None if the pool is disabled, full
+            or unavailable
+        """
+        if self.workers <= 0:
+            return None
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            return None
+
+        try:
+            future = self._executor().submit(draw_chart, spec)
+        except (BrokenProcessPool, RuntimeError, OSError) as e:
+            slots.release()
+            logger.warning(f"Chart render pool unavailable: {e}")
+            self._reset()
+            return None
+
+        self.pooled += 1
+        future.add_done_callback(lambda _: slots.release())
+        if on_done is not None:
+            future.add_done_callback(lambda f: self._deliver(f, on_done))
+        if key is not None:
+            with self._lock:
+                self._inflight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def wait(self, key: Hashable) -> Optional[bytes]:
+        """
+        Wait for a render started with submit(..., key=key).
+
+        Args:
+            key: Key passed to submit()
+
+        Returns:
+            PNG image bytes, or None if no such render is in flight or it failed
+
+        Raises:
+            ChartRenderTimeout: If the render takes too long
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is None:
+            return None
+        try:
+            return self._result(future, None)
+        except ChartRenderTimeout:
+            raise
+        except Exception as e:
+            logger.warning(f"Pooled chart render failed: {e}")
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return renderer counters.
+
+        Returns:
+            Dictionary with pooled, inline, rejected, timeouts and in_flight
+        """
+        with self._lock:
+            in_flight = len(self._inflight)
+        return {
+            'pooled': self.pooled,
+            'inline': self.inline,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'in_flight': in_flight
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, cancelling renders not yet started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._inflight.clear()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+                if not self._atexit_registered:
+                    atexit.register(self.shutdown)
+                    self._atexit_registered = True
+            return self._pool
+
+    def _reset(self) -> None:
+        # Drop a broken pool; the next submit() starts a fresh one
+        self.shutdown()
+
+    def _result(self, future: Future, spec: Optional[ChartSpec]) -> Optional[bytes]:
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # A running render cannot be interrupted; its worker frees up
+            # when it finishes and the result is discarded
+            future.cancel()
+            self.timeouts += 1
+            raise ChartRenderTimeout(f"Chart render exceeded {self.timeout}s")
+        except BrokenProcessPool as e:
+            logger.warning(f"Chart render pool broke, rendering inline: {e}")
+            self._reset()
+            return self._render_inline(spec) if spec is not None else None
+
+    def _render_inline(self, spec: ChartSpec) -> bytes:
+        self.inline += 1
+        return draw_chart(spec)
+
+    def _deliver(self, future: Future, on_done: Callable[[bytes], None]) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            on_done(future.result())
+        except Exception as e:
+            logger.warning(f"Chart render callback failed: {e}")
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
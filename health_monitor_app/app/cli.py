@@ -0,0 +1,178 @@
+"""
+Command line interface for the Health Monitor application.
+
+Registers maintenance commands under ``flask db`` and data commands
+under ``flask data``.
+"""
+
+from contextlib import ExitStack
+from typing import Optional
+
+import click
+from flask import Flask
+from flask.cli import AppGroup
+
+from .extensions import db
+
+db_cli = AppGroup('db', help='Database maintenance commands.')
+data_cli = AppGroup('data', help='Health data import commands.')
+
+
+@db_cli.command('rebuild-rollups')
+@click.option('--user', 'user_id', type=int, default=None,
+              help='Only rebuild this user ID (default: all users).')
+def rebuild_rollups_command(user_id: Optional[int]) -> None:
+    """Recompute the rollups and latest-value snapshots from the raw health data."""
+    from .health_data import rollups, snapshots
+    from .models import UserDataVersion
+
+    try:
+        written = rollups.rebuild(user_id)
+        written['user_latest_snapshot'] = snapshots.rebuild(user_id)
+        # Cached charts were drawn from the old rollups
+        if user_id is not None:
+            UserDataVersion.bump(user_id)
+        else:
+            for (uid,) in db.session.query(UserDataVersion.user_id).all():
+                UserDataVersion.bump(uid)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for table, rows in written.items():
+        click.echo(f'{table}: {rows} rows')
+
+
+@db_cli.command('dedupe')
+@click.option('--dry-run', is_flag=True, help='Only list the duplicates.')
+def dedupe_command(dry_run: bool) -> None:
+    """
+    Remove duplicate health records and make (user, date) unique.
+
+    Of the records a user has with the same date, the most recently added
+    one is kept, as an upsert would have left it. Every record removed is
+    listed (and logged). The old non-unique index is then replaced by the
+    unique one the ingestion upserts need, and the rollups and snapshots
+    of the affected users are rebuilt.
+    """
+    from .health_data.writes import duplicate_records, remove_duplicates
+
+    records = duplicate_records()
+    for user_id, record_id, record_date in records:
+        click.echo(f'user {user_id}: record {record_id} at {record_date}')
+    click.echo(f'{len(records)} duplicate records of {len({user_id for user_id, _, _ in records})} users')
+    if dry_run:
+        return
+
+    try:
+        remove_duplicates()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    click.echo('Duplicates removed; health records are now unique per user and date')
+
+
+@db_cli.command('explain-hot')
+@click.option('--user', 'user_id', type=int, default=None,
+              help='Run the queries for this user ID (default: the first user with health data).')
+def explain_hot_command(user_id: Optional[int]) -> None:
+    """
+    Print the query plans of the hot queries and fail on full table scans.
+
+    Runs the queries behind the history page, the graphs and the
+    dashboard's latest values, and exits with status 1 if SQLite reads
+    any table without an index for them.
+    """
+    from .models import HealthData, User
+    from .slow_queries import explain_hot_queries
+
+    if user_id is None:
+        user_id = (db.session.query(HealthData.user_id).order_by(HealthData.user_id).limit(1).scalar()
+                   or db.session.query(User.id).order_by(User.id).limit(1).scalar())
+    if user_id is None:
+        raise click.ClickException('No users to run the queries for')
+
+    try:
+        plans = explain_hot_queries(user_id)
+        # The dashboard query creates a missing snapshot
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    failures = 0
+    for query_plan in plans:
+        failures += bool(query_plan.full_scans)
+        click.echo(f'{"FULL SCAN" if query_plan.full_scans else "ok"}  {query_plan.query}: {query_plan.statement}')
+        for step in query_plan.plan:
+            click.echo(f'    {step}')
+    click.echo(f'{len(plans)} statements, {failures} with full table scans')
+    if failures:
+        raise SystemExit(1)
+
+
+@data_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'user_id', type=int, required=True, help='ID of the user the records belong to.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'apple_health', 'fitbit']), default=None,
+              help='File format (default: from the file name).')
+@click.option('--no-samples', is_flag=True,
+              help='Do not keep wearable heart rate and oxygen readings in the sample store.')
+def import_command(path: str, user_id: int, fmt: Optional[str], no_samples: bool) -> None:
+    """
+    Bulk import health data from a CSV or NDJSON file, or a wearable export.
+
+    Apple Health exports (export.xml or export.zip) and Fitbit exports
+    (heart_rate-*.json and similar files, or a zip of them) are imported
+    as one record per day, with a progress bar.
+    """
+    from .health_data.importer import detect_format, import_file
+    from .health_data.wearables import WEARABLE_FORMATS, detect_wearable_format, import_wearable
+    from .models import User
+
+    if db.session.get(User, user_id) is None:
+        raise click.BadParameter(f'No user with ID {user_id}.', param_hint='--user')
+    if fmt is None:
+        with open(path, 'rb') as stream:
+            fmt = detect_wearable_format(path, stream) or detect_format(path)
+    if fmt is None:
+        raise click.BadParameter('Cannot tell the format from the file name.', param_hint='--format')
+
+    if fmt in WEARABLE_FORMATS:
+        with open(path, 'rb') as stream, ExitStack() as stack:
+            bar = []
+
+            def progress(done: int, total: int) -> None:
+                if not bar:
+                    bar.append(stack.enter_context(click.progressbar(length=total, label='Reading export')))
+                bar[0].update(done - bar[0].pos)
+
+            try:
+                result = import_wearable(user_id, stream, fmt, path, progress, samples=not no_samples)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            try:
+                result = import_file(user_id, stream, fmt)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+    for line, message in result.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    if result.rejected > len(result.errors):
+        click.echo(f'... {result.rejected - len(result.errors)} more errors', err=True)
+    if fmt in WEARABLE_FORMATS:
+        click.echo(f'{result.readings} readings ({result.samples} kept as samples) over '
+                   f'{result.imported + result.rejected} days')
+    click.echo(f'{result.imported} rows imported ({result.replaced} replaced), {result.rejected} rejected')
+
+
+def init_app(app: Flask) -> None:
+    """
+    Register the CLI commands with the application.
+
+    Args:
+        app: Flask application instance
+    """
+    app.cli.add_command(db_cli)
+    app.cli.add_command(data_cli)
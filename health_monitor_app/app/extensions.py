@@ -7,9 +7,20 @@ This module initializes all Flask extensions used by the application.
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 
+from .baselines import BaselineIndex
+from .chart_cache import ChartCache
+from .chart_render import ChartRenderer
+from .metrics import RequestMetrics
+from .write_queue import WriteQueue
+
 # Initialize extensions
 db = SQLAlchemy()
 login = LoginManager()
+chart_cache = ChartCache()
+chart_renderer = ChartRenderer()
+write_queue = WriteQueue(db)
+baseline_index = BaselineIndex(db)
+request_metrics = RequestMetrics()
 
 # Configure extensions - ensure these match blueprint endpoint names exactly
 login.login_view = 'auth.login'
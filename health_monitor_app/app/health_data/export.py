@@ -0,0 +1,179 @@
+"""
+Streaming export of health data for the Health Monitor application.
+
+A user's full history is read from a Core ``select()`` in batches of
+``EXPORT_BATCH_SIZE`` rows and encoded batch by batch, so the response
+is produced by a generator and memory stays bounded however long the
+history is. CSV and NDJSON use the import column names and re-import
+unchanged; Parquet (written one row group per batch) needs the optional
+``pyarrow`` package.
+"""
+
+import csv
+import io
+import json
+from typing import Callable, Dict, Iterator, List, NamedTuple, Sequence
+
+import numpy as np
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.engine import Row
+
+from ..extensions import db
+from ..models import HealthData
+from .importer import IMPORT_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet export is only offered when pyarrow is installed
+    pa = pq = None
+
+# Rows read from the cursor and encoded together (one Parquet row group)
+EXPORT_BATCH_SIZE = 10000
+
+# Exported columns, in the order the importer documents them
+EXPORT_COLUMNS = ('date', *IMPORT_FIELDS)
+
+
+class ExportFormat(NamedTuple):
+    """How one export format is served."""
+    mimetype: str
+    extension: str
+    encode: Callable[[Iterator[Sequence[Row]]], Iterator[bytes]]
+
+
+def iter_batches(user_id: int) -> Iterator[Sequence[Row]]:
+    """
+    Stream a user's records, oldest first, in batches.
+
+    Dates are returned as stored, e.g. ``'2024-01-31 08:00:00.000000'``.
+
+    Args:
+        user_id: ID of the user to export
+
+    Yields:
+        Lists of up to EXPORT_BATCH_SIZE rows with the EXPORT_COLUMNS
+    """
+    stmt = select(
+        type_coerce(HealthData.date, String),
+        *(getattr(HealthData, name) for name in IMPORT_FIELDS)
+    ).where(HealthData.user_id == user_id).order_by(HealthData.date.asc())
+    # Executed on the connection, as Core: ORM execution would buffer every row
+    result = db.session.connection().execution_options(stream_results=True).execute(stmt)
+    yield from result.partitions(EXPORT_BATCH_SIZE)
+
+
+def encode_csv(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    """Encode batches of rows as CSV with a header row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        # None is written as an empty field
+        writer.writerows(batch)
+        yield _drain(buffer).encode('utf-8')
+    yield _drain(buffer).encode('utf-8')
+
+
+def encode_ndjson(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    """Encode batches of rows as one JSON object per line, leaving out missing values."""
+    for batch in batches:
+        lines = [
+            json.dumps({name: value for name, value in zip(EXPORT_COLUMNS, row) if value is not None})
+            for row in batch
+        ]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def encode_parquet(batches: Iterator[Sequence[Row]]) -> Iterator[bytes]:
+    """Encode batches of rows as a Parquet file with one row group per batch."""
+    schema = pa.schema([(name, _parquet_type(name)) for name in EXPORT_COLUMNS])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for batch in batches:
+            columns = list(zip(*batch))
+            dates = np.array(columns[0], dtype='datetime64[us]')
+            arrays = [pa.array(dates, type=schema.field('date').type)]
+            arrays.extend(
+                pa.array(values, type=schema.field(name).type)
+                for name, values in zip(EXPORT_COLUMNS[1:], columns[1:])
+            )
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    # Closing the writer adds the footer
+    yield sink.drain()
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    'csv': ExportFormat('text/csv', 'csv', encode_csv),
+    'ndjson': ExportFormat('application/x-ndjson', 'ndjson', encode_ndjson),
+    'parquet': ExportFormat('application/vnd.apache.parquet', 'parquet', encode_parquet)
+}
+
+
+def available_formats() -> List[str]:
+    """
+    List the export formats that can be served.
+
+    Returns:
+        Format names, without 'parquet' if pyarrow is not installed
+    """
+    return [name for name in EXPORT_FORMATS if name != 'parquet' or pq is not None]
+
+
+def export_stream(user_id: int, fmt: str) -> Iterator[bytes]:
+    """
+    Stream a user's full history encoded in the given format.
+
+    Args:
+        user_id: ID of the user to export
+        fmt: One of available_formats()
+
+    Returns:
+        Iterator of encoded chunks, suitable for a streamed Response
+    """
+    return EXPORT_FORMATS[fmt].encode(iter_batches(user_id))
+
+
+def _drain(buffer: io.StringIO) -> str:
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
+
+
+def _parquet_type(name: str) -> 'pa.DataType':
+    if name == 'date':
+        return pa.timestamp('us')
+    kind = IMPORT_FIELDS[name].kind
+    if kind == 'int':
+        return pa.int64()
+    if kind == 'float':
+        return pa.float64()
+    return pa.string()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file that hands what the Parquet writer wrote back to the
+    # generator, so each row group leaves the process as soon as it is done
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
@@ -1,6 +1,9 @@
+from uuid import uuid4
+
 from flask_wtf import FlaskForm
-from wtforms import StringField, FloatField, IntegerField, TextAreaField, SelectField, SubmitField
-from wtforms.validators import DataRequired, Optional, NumberRange
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import StringField, FloatField, HiddenField, IntegerField, TextAreaField, SelectField, SubmitField
+from wtforms.validators import DataRequired, Length, Optional, NumberRange
 
 class HealthDataForm(FlaskForm):
     # Vital signs
@@ -54,4 +57,23 @@ class HealthDataForm(FlaskForm):
     # Notes
     notes = TextAreaField('Notes', validators=[Optional()])
     
-    submit = SubmitField('Save') 
\ No newline at end of file
+    # Identifies this submission, so a resubmitted form is not saved twice
+    idempotency_key = HiddenField(default=lambda: uuid4().hex, validators=[Optional(), Length(max=64)])
+    
+    submit = SubmitField('Save')
+
+
+class ImportForm(FlaskForm):
+    file = FileField('Data File', validators=[
+        FileRequired(), FileAllowed(['csv', 'ndjson', 'jsonl', 'json', 'xml', 'zip'],
+                                    'CSV, NDJSON, Apple Health or Fitbit export files only.')
+    ])
+    format = SelectField('Format', choices=[
+        ('auto', 'Detect from file name'),
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON (one JSON object per line)'),
+        ('apple_health', 'Apple Health export (export.xml or export.zip)'),
+        ('fitbit', 'Fitbit export (JSON files or a zip of them)')
+    ])
+
+    submit = SubmitField('Import')
@@ -0,0 +1,385 @@
+"""
+Bulk import of health data for the Health Monitor application.
+
+CSV and NDJSON files are parsed as a stream in chunks of
+``IMPORT_BATCH_SIZE`` rows. Each chunk is validated column by column
+against the ranges declared on ``HealthDataForm``, so an import accepts
+exactly what the add form does, and its valid rows are upserted with one
+``executemany()`` and committed together with the derived state, as one
+write of the write queue. A row
+whose date the user already has a record for replaces that record, so
+importing the same file twice changes nothing. Invalid rows are reported
+by line number and skipped; they never abort the rest of the file.
+"""
+
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+from operator import itemgetter
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.exc import SQLAlchemyError
+from wtforms import FloatField, IntegerField, SelectField, TextAreaField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import NumberRange
+
+from ..extensions import db, write_queue
+from ..models import HealthData
+from ..security import sanitize_input
+from .forms import HealthDataForm
+from .writes import next_change_seq, on_records_imported, upsert_statement
+
+# Rows validated, inserted and committed together
+IMPORT_BATCH_SIZE = 20000
+
+# Per-row errors kept for the report (all rejected rows are counted)
+IMPORT_MAX_ERRORS = 100
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# Parsed rows of one chunk: a DataFrame of object columns, the line number
+# of each row and the (line, message) of rows that could not be parsed
+Chunk = Tuple[pd.DataFrame, np.ndarray, List[Tuple[int, str]]]
+
+
+class ImportField(NamedTuple):
+    """Validation rule for one imported column, taken from HealthDataForm."""
+    kind: str  # 'int', 'float', 'choice' or 'text'
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    choices: Tuple[str, ...] = ()
+
+
+@dataclass
+class ImportResult:
+    """Outcome of an import: counts and the first per-row errors."""
+    imported: int = 0
+    rejected: int = 0
+    replaced: int = 0  # imported rows that overwrote a record with the same date
+    readings: int = 0  # wearable readings aggregated into the imported rows
+    samples: int = 0  # wearable readings also kept in the sample store
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+    def reject(self, line: int, message: str) -> None:
+        """Record a rejected row, keeping at most IMPORT_MAX_ERRORS messages."""
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+def _form_fields() -> Dict[str, ImportField]:
+    fields = {}
+    for name, unbound in vars(HealthDataForm).items():
+        if not isinstance(unbound, UnboundField):
+            continue
+        validators = unbound.kwargs.get('validators', ())
+        bounds = next((v for v in validators if isinstance(v, NumberRange)), None)
+        if issubclass(unbound.field_class, (IntegerField, FloatField)):
+            kind = 'int' if issubclass(unbound.field_class, IntegerField) else 'float'
+            fields[name] = ImportField(kind, bounds.min if bounds else None, bounds.max if bounds else None)
+        elif issubclass(unbound.field_class, SelectField):
+            choices = tuple(value for value, _ in unbound.kwargs.get('choices', ()) if value)
+            fields[name] = ImportField('choice', choices=choices)
+        elif issubclass(unbound.field_class, TextAreaField):
+            fields[name] = ImportField('text')
+    return fields
+
+
+# HealthData columns accepted besides 'date', in form order
+IMPORT_FIELDS = _form_fields()
+
+_FIELD_ERRORS = {
+    'int': 'Not a valid integer value.',
+    'float': 'Not a valid float value.',
+    'choice': 'Not a valid choice.'
+}
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """
+    Guess an import format from a file name.
+
+    Args:
+        filename: Name of the uploaded or local file
+
+    Returns:
+        'csv', 'ndjson' or None if the extension is not recognised
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('ndjson', 'jsonl', 'json'):
+        return 'ndjson'
+    return None
+
+
+def import_file(user_id: int, stream: IO[str], fmt: str) -> ImportResult:
+    """
+    Import health data for a user from a CSV or NDJSON text stream.
+
+    Every row needs a ``date``; the other recognised columns are the
+    HealthDataForm fields and may be empty. Unknown columns are ignored.
+    A row replaces the user's record with the same date, including one
+    from an earlier row of the file. Each chunk is committed on its own,
+    so rows imported before a failing chunk stay imported.
+
+    Args:
+        user_id: ID of the user the records belong to
+        stream: Text stream positioned at the start of the file
+        fmt: 'csv' or 'ndjson'
+
+    Returns:
+        ImportResult with the imported and rejected row counts
+
+    Raises:
+        ValueError: If the format is unknown or the CSV header has no date column
+    """
+    if fmt == 'csv':
+        chunks = _csv_chunks(stream)
+    elif fmt == 'ndjson':
+        chunks = _ndjson_chunks(stream)
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+    return import_chunks(user_id, chunks)
+
+
+def import_chunks(user_id: int, chunks: Iterable[Chunk], result: Optional[ImportResult] = None) -> ImportResult:
+    """
+    Validate and upsert chunks of parsed rows, committing each chunk.
+
+    Each chunk is written through the write queue, as one write of at
+    most IMPORT_BATCH_SIZE rows, so an import holds the database's write
+    lock for one chunk at a time and other users' writes go in between.
+
+    Args:
+        user_id: ID of the user the records belong to
+        chunks: (rows, line numbers, parse errors) per chunk, where rows is
+            a DataFrame of object columns named 'date' or after IMPORT_FIELDS
+        result: ImportResult to add the counts to (a new one if None)
+
+    Returns:
+        ImportResult with the imported and rejected row counts
+    """
+    result = result if result is not None else ImportResult()
+    for frame, lines, parse_errors in chunks:
+        for line, message in parse_errors:
+            result.reject(line, message)
+        if not len(frame):
+            continue
+        batch = _validate(frame, lines, result)
+        if batch is None:
+            continue
+        try:
+            replaced = write_queue.run(_write_batch, user_id, batch)
+            result.imported += len(batch.lines)
+            result.replaced += replaced + len(batch.lines) - len(batch.rows)
+        except SQLAlchemyError:
+            current_app.logger.exception('Import chunk for user %s failed', user_id)
+            for line in batch.lines:
+                result.reject(int(line), 'Row could not be saved.')
+    return result
+
+
+def _csv_chunks(stream: IO[str]) -> Iterator[Chunk]:
+    reader = csv.reader(stream)
+    header = [name.strip().lower() for name in next(reader, [])]
+    if 'date' not in header:
+        raise ValueError("The file needs a header row with a 'date' column.")
+    keep = [i for i, name in enumerate(header) if name == 'date' or name in IMPORT_FIELDS]
+    names = [header[i] for i in keep]
+    subset = len(keep) < len(header)
+
+    while True:
+        batch = [(reader.line_num, row) for row in islice(reader, IMPORT_BATCH_SIZE)]
+        if not batch:
+            break
+        # Blank lines come back as empty rows and are skipped silently
+        errors = [(line, f'Expected {len(header)} fields, found {len(row)}.')
+                  for line, row in batch if row and len(row) != len(header)]
+        batch = [(line, row) for line, row in batch if len(row) == len(header)]
+        rows = [[row[i] for i in keep] for _, row in batch] if subset else [row for _, row in batch]
+        yield pd.DataFrame(rows, columns=names, dtype=object), np.array([line for line, _ in batch]), errors
+
+
+def _ndjson_chunks(stream: IO[str]) -> Iterator[Chunk]:
+    records: List[dict] = []
+    lines: List[int] = []
+    errors: List[Tuple[int, str]] = []
+    for number, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            errors.append((number, 'Not valid JSON.'))
+            continue
+        if not isinstance(record, dict):
+            errors.append((number, 'Expected a JSON object.'))
+            continue
+        records.append(record)
+        lines.append(number)
+        if len(records) >= IMPORT_BATCH_SIZE:
+            yield _records_frame(records), np.array(lines), errors
+            records, lines, errors = [], [], []
+    if records or errors:
+        yield _records_frame(records), np.array(lines), errors
+
+
+def _records_frame(records: List[dict]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(records)
+    names = [name for name in frame.columns if name == 'date' or name in IMPORT_FIELDS]
+    return frame[names].astype(object)
+
+
+class _Batch(NamedTuple):
+    rows: List[tuple]  # insert tuples without the user_id, one per date
+    lines: np.ndarray  # every valid row, including ones a later row replaced
+    dates: np.ndarray  # per insert tuple from here on
+    numbers: Dict[str, np.ndarray]  # float values, NaN where missing
+
+
+def _validate(frame: pd.DataFrame, lines: np.ndarray, result: ImportResult) -> Optional[_Batch]:
+    # Adds the chunk's rejected rows to the result and returns its valid ones
+    size = len(frame)
+    failures: List[Tuple[np.ndarray, str]] = []
+
+    dates = _dates(frame['date']) if 'date' in frame else np.full(size, np.datetime64('NaT'), 'datetime64[us]')
+    failures.append((np.isnat(dates), 'date: A valid date is required.'))
+
+    columns: Dict[str, np.ndarray] = {}
+    numbers: Dict[str, np.ndarray] = {}
+    for name, rule in IMPORT_FIELDS.items():
+        if name not in frame:
+            columns[name] = np.full(size, None, dtype=object)
+            continue
+        column = frame[name]
+        if rule.kind in ('int', 'float'):
+            values = _numbers(column)
+            # Only cells that did not parse need a closer look: blank ones
+            # are missing values, anything else is invalid
+            present = ~np.isnan(values)
+            unparsed = np.flatnonzero(~present)
+            if len(unparsed):
+                present[unparsed] = (_text(column.iloc[unparsed]) != '').to_numpy()
+            invalid = present & ~np.isfinite(values)
+            if rule.kind == 'int':
+                invalid |= present & np.isfinite(values) & (values != np.round(values))
+            failures.append((invalid, f'{name}: {_FIELD_ERRORS[rule.kind]}'))
+            with np.errstate(invalid='ignore'):
+                out_of_range = present & ~invalid & ((values < rule.minimum) | (values > rule.maximum))
+            failures.append((out_of_range, f'{name}: Number must be between {rule.minimum} and {rule.maximum}.'))
+            columns[name] = _nullable(values, present & ~invalid, rule.kind == 'int')
+            numbers[name] = values
+        elif rule.kind == 'choice':
+            values = column.to_numpy()
+            unmatched = np.flatnonzero(~column.isin(rule.choices).to_numpy())
+            if len(unmatched):
+                values = values.copy()
+                values[unmatched] = _text(column.iloc[unmatched]).to_numpy()
+            present = values != ''
+            failures.append((present & ~np.isin(values, rule.choices), f'{name}: {_FIELD_ERRORS[rule.kind]}'))
+            columns[name] = np.where(present, values, None)
+        else:
+            text = _text(column)
+            notes = np.full(size, None, dtype=object)
+            for i in np.flatnonzero((text != '').to_numpy()):
+                notes[i] = sanitize_input(text.iat[i])
+            columns[name] = notes
+
+    rejected = np.zeros(size, dtype=bool)
+    for mask, _ in failures:
+        rejected |= mask
+    for i in np.flatnonzero(rejected):
+        result.reject(int(lines[i]), ' '.join(message for mask, message in failures if mask[i]))
+
+    valid = ~rejected
+    if not valid.any():
+        return None
+    valid_lines = lines[valid]
+    # Of several rows with the same date only the last is kept, as if
+    # each had been imported in turn
+    _, last = np.unique(dates[valid][::-1], return_index=True)
+    if len(last) < int(valid.sum()):
+        keep = np.flatnonzero(valid)[np.sort(len(valid_lines) - 1 - last)]
+        valid = np.zeros(size, dtype=bool)
+        valid[keep] = True
+    valid_dates = dates[valid]
+    # Stored like SQLAlchemy's SQLite DateTime: 'YYYY-MM-DD HH:MM:SS.ffffff'
+    date_text = [moment.isoformat(sep=' ', timespec='microseconds') for moment in valid_dates.astype(object)]
+    rows = list(zip(date_text, *(columns[name][valid] for name in IMPORT_FIELDS)))
+    return _Batch(rows, valid_lines, valid_dates, {name: values[valid] for name, values in numbers.items()})
+
+
+def _dates(column: pd.Series) -> np.ndarray:
+    # Naive UTC timestamps with NaT where a cell is not a date string;
+    # as with numbers, only cells that did not parse are stripped and retried
+    strings = column.where(column.map(type) == str)
+    dates = pd.to_datetime(strings, errors='coerce', utc=True).dt.tz_convert(None).to_numpy('datetime64[us]')
+    unparsed = np.flatnonzero(np.isnat(dates) & strings.notna().to_numpy())
+    if len(unparsed):
+        stripped = _text(strings.iloc[unparsed])
+        retried = pd.to_datetime(stripped.where(stripped != ''), errors='coerce', utc=True)
+        dates[unparsed] = retried.dt.tz_convert(None).to_numpy('datetime64[us]')
+    return dates
+
+
+def _text(column: pd.Series) -> pd.Series:
+    # Stripped strings with missing values as '', whatever the source type
+    return column.where(column.notna(), '').astype(str).str.strip()
+
+
+def _numbers(column: pd.Series) -> np.ndarray:
+    # Float values with NaN where a cell is not a number; a clean column
+    # converts in one cast, anything else goes through to_numeric()
+    try:
+        return column.to_numpy().astype(np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(column, errors='coerce').to_numpy(np.float64)
+
+
+def _nullable(values: np.ndarray, present: np.ndarray, integer: bool) -> np.ndarray:
+    # Object array of Python numbers with None where the value is missing,
+    # which is how the sqlite3 driver expects NULLs
+    out = np.full(len(values), None, dtype=object)
+    kept = values[present]
+    out[present] = (kept.astype(np.int64) if integer else kept).tolist()
+    return out
+
+
+def _write_batch(user_id: int, batch: _Batch) -> int:
+    # Write function for the write queue: upsert a validated chunk and
+    # update derived state, returning how many records it replaced
+    replaced = _existing(user_id, batch)
+    _insert(user_id, next_change_seq(user_id), batch.rows)
+    new = ~replaced
+    numbers = {name: values[new] for name, values in batch.numbers.items()}
+    on_records_imported(user_id, batch.dates[new], numbers, batch.dates[replaced].tolist())
+    return int(replaced.sum())
+
+
+def _existing(user_id: int, batch: _Batch) -> np.ndarray:
+    # Which of the batch's dates the user already has a record for, from
+    # one range scan of the (user_id, date) index
+    table = HealthData.__table__
+    query = select(type_coerce(table.c.date, String)).where(
+        table.c.user_id == user_id,
+        table.c.date.between(batch.dates.min().item(), batch.dates.max().item())
+    )
+    stored = db.session.connection().execute(query).scalars().all()
+    return np.isin([row[0] for row in batch.rows], stored)
+
+
+def _insert(user_id: int, change_seq: int, rows: List[tuple]) -> None:
+    names = ['user_id', 'date', *IMPORT_FIELDS, 'change_seq']
+    stmt = upsert_statement(tuple(IMPORT_FIELDS)).compile(dialect=db.engine.dialect, column_keys=names)
+    # Rows hold the values in `names` order; the statement's placeholders
+    # follow the table's column order, so reorder each row to match them
+    reorder = itemgetter(*(names.index(name) for name in stmt.positiontup))
+    db.session.connection().exec_driver_sql(
+        str(stmt), [reorder((user_id, *row, change_seq)) for row in rows]
+    )
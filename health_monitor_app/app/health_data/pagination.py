@@ -0,0 +1,207 @@
+"""
+Keyset pagination for the health data history page.
+
+Pages are addressed by opaque, signed cursors that encode the position
+``(date, id)`` of the row at the edge of the current page. Each page is
+a single indexed range scan, so deep pages cost the same as the first
+one, unlike OFFSET pagination which reads and discards every earlier row.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import and_, or_
+
+from ..extensions import db
+from ..models import HealthData
+
+# Cursor directions
+NEXT = 'n'
+PREV = 'p'
+
+# Cached record counts per user: user_id -> (count, expiry timestamp), least
+# recently used first and bounded to COUNT_CACHE_SIZE users
+COUNT_CACHE_SIZE = 1024
+_count_cache: 'OrderedDict[int, Tuple[int, float]]' = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+class KeysetPagination:
+    """
+    A page of history records addressed by cursors instead of page numbers.
+
+    Exposes the attributes ``history.html`` relies on (``items``,
+    ``has_prev``, ``has_next``, ``iter_pages``) plus the cursors for the
+    neighbouring pages.
+
+    Attributes:
+        items: Records on this page, newest first
+        per_page: Maximum number of records per page
+        next_cursor: Cursor for the following (older) page, if any
+        prev_cursor: Cursor for the preceding (newer) page, if any
+        total: Total number of records, or None if not computed
+    """
+
+    def __init__(self, items: List[HealthData], per_page: int,
+                 next_cursor: Optional[str], prev_cursor: Optional[str],
+                 total: Optional[int] = None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self) -> bool:
+        """Whether an older page exists."""
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        """Whether a newer page exists."""
+        return self.prev_cursor is not None
+
+    def iter_pages(self, **kwargs) -> Iterator[int]:
+        """Keyset pages have no numbers, so there are no page links."""
+        return iter(())
+
+
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='history-cursor')
+
+
+def encode_cursor(direction: str, record: HealthData) -> str:
+    """
+    Encode the position of a record as an opaque cursor.
+
+    Args:
+        direction: NEXT to page past the record, PREV to page before it
+        record: Record at the edge of the current page
+
+    Returns:
+        URL-safe signed cursor string
+    """
+    return _serializer().dumps([direction, record.date.isoformat(), record.id])
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, datetime, int]]:
+    """
+    Decode a cursor created by encode_cursor.
+
+    Args:
+        cursor: Cursor string from the request, may be None
+
+    Returns:
+        Tuple of (direction, date, id), or None if the cursor is missing,
+        tampered with or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        direction, date_text, record_id = _serializer().loads(cursor)
+        if direction not in (NEXT, PREV):
+            return None
+        return direction, datetime.fromisoformat(date_text), int(record_id)
+    except (BadSignature, ValueError, TypeError):
+        current_app.logger.warning("Invalid history cursor supplied")
+        return None
+
+
+def cached_record_count(user_id: int) -> int:
+    """
+    Count a user's records, caching the result for a short period.
+
+    The cache lifetime is HISTORY_COUNT_CACHE_SECONDS, and the write hooks
+    drop a user's count when they add or remove records. Counts cached by
+    other processes may stay stale for the lifetime, which is acceptable
+    for a count that is only displayed.
+
+    Args:
+        user_id: ID of the user
+
+    Returns:
+        Number of health records the user has
+    """
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(user_id)
+        if cached and cached[1] > now:
+            _count_cache.move_to_end(user_id)
+            return cached[0]
+
+    count = db.session.query(db.func.count(HealthData.id))\
+        .filter(HealthData.user_id == user_id).scalar()
+    ttl = current_app.config.get('HISTORY_COUNT_CACHE_SECONDS', 60)
+    with _count_cache_lock:
+        _count_cache[user_id] = (count, now + ttl)
+        _count_cache.move_to_end(user_id)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
+
+
+def invalidate_record_count(user_id: int) -> None:
+    """
+    Drop a user's cached record count after records were added or removed.
+
+    Args:
+        user_id: ID of the user
+    """
+    with _count_cache_lock:
+        _count_cache.pop(user_id, None)
+
+
+def paginate_history(user_id: int, cursor: Optional[str], per_page: int,
+                     with_total: bool = False) -> KeysetPagination:
+    """
+    Fetch one page of a user's records ordered by (date, id) descending.
+
+    Args:
+        user_id: ID of the user whose records to page through
+        cursor: Cursor from a previous page, or None for the newest page
+        per_page: Number of records per page
+        with_total: Whether to include the (cached) total record count
+
+    Returns:
+        KeysetPagination for the requested page
+    """
+    position = decode_cursor(cursor)
+    query = HealthData.query.filter(HealthData.user_id == user_id)
+    newest_first = (HealthData.date.desc(), HealthData.id.desc())
+
+    if position is None:
+        rows = query.order_by(*newest_first).limit(per_page + 1).all()
+        items = rows[:per_page]
+        more_older = len(rows) > per_page
+        more_newer = False
+    else:
+        direction, date, record_id = position
+        if direction == NEXT:
+            # Rows strictly older than the cursor; the redundant date bound
+            # keeps the scan on the (user_id, date) index
+            rows = query.filter(
+                HealthData.date <= date,
+                or_(HealthData.date < date, and_(HealthData.date == date, HealthData.id < record_id))
+            ).order_by(*newest_first).limit(per_page + 1).all()
+            items = rows[:per_page]
+            more_older = len(rows) > per_page
+            more_newer = True
+        else:
+            rows = query.filter(
+                HealthData.date >= date,
+                or_(HealthData.date > date, and_(HealthData.date == date, HealthData.id > record_id))
+            ).order_by(HealthData.date.asc(), HealthData.id.asc()).limit(per_page + 1).all()
+            items = list(reversed(rows[:per_page]))
+            more_older = True
+            more_newer = len(rows) > per_page
+
+    next_cursor = encode_cursor(NEXT, items[-1]) if items and more_older else None
+    prev_cursor = encode_cursor(PREV, items[0]) if items and more_newer else None
+    total = cached_record_count(user_id) if with_total else None
+
+    return KeysetPagination(items, per_page, next_cursor, prev_cursor, total)
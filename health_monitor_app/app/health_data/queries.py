@@ -0,0 +1,233 @@
+"""
+Query helpers for reading health data in the Health Monitor application.
+
+This module keeps the read paths used by graphs and previews scoped to
+the rows and columns they actually need, so request cost depends on the
+size of the requested window rather than on a user's whole history.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+from ..extensions import db
+from ..models import HealthData
+from .rollups import DAILY, WEEKLY, Rollup, fetch_rollup_series
+
+# Columns needed to draw each graph parameter, keyed by DataFrame column name
+PARAMETER_COLUMNS: Dict[str, Dict[str, InstrumentedAttribute]] = {
+    'weight': {'weight': HealthData.weight},
+    'blood_pressure': {
+        'systolic': HealthData.blood_pressure_systolic,
+        'diastolic': HealthData.blood_pressure_diastolic
+    },
+    'heart_rate': {'heart_rate': HealthData.heart_rate},
+    'steps': {'steps': HealthData.steps},
+    'sleep_duration': {'sleep_duration': HealthData.sleep_duration},
+    'water_intake': {'water_intake': HealthData.water_intake},
+    'calorie_intake': {'calorie_intake': HealthData.calorie_intake},
+    'stress_level': {'stress_level': HealthData.stress_level}
+}
+
+# Rows fetched from the cursor per chunk by load_series()
+LOAD_CHUNK_SIZE = 10000
+
+# Columns drawn as sparklines at the top of the history page
+PREVIEW_COLUMNS: Dict[str, InstrumentedAttribute] = {
+    'weight': HealthData.weight,
+    'heart_rate': HealthData.heart_rate,
+    'steps': HealthData.steps,
+    'sleep_duration': HealthData.sleep_duration
+}
+
+
+def has_health_data(user_id: int) -> bool:
+    """
+    Check whether a user has recorded any health data.
+
+    Args:
+        user_id: ID of the user to check
+
+    Returns:
+        True if at least one record exists, False otherwise
+    """
+    return db.session.query(HealthData.id)\
+        .filter(HealthData.user_id == user_id)\
+        .first() is not None
+
+
+@dataclass(frozen=True)
+class SeriesArrays:
+    """
+    A user's records over a window as plain, typed NumPy arrays.
+
+    Attributes:
+        dates: Record dates as a datetime64[ns] array, ascending
+        values: Column name to float64 array, NaN where the value is NULL
+    """
+    dates: np.ndarray
+    values: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Wrap the arrays in a DataFrame with a ``date`` column.
+
+        Returns:
+            DataFrame with ``date`` plus one float64 column per value array
+        """
+        return pd.DataFrame({'date': self.dates, **self.values})
+
+
+def load_series(user_id: int, columns: Dict[str, InstrumentedAttribute],
+                start_date: datetime, end_date: datetime) -> SeriesArrays:
+    """
+    Load the given columns for a user's records within a date range.
+
+    Runs a Core ``select()`` of just the requested columns, served by the
+    ``(user_id, date)`` index, and streams the rows in chunks into
+    preallocated NumPy arrays without creating ORM objects or per-row
+    datetime objects (dates are parsed by NumPy from SQLite's text form).
+
+    Args:
+        user_id: ID of the user whose data to load
+        columns: Mapping of column name to model column
+        start_date: Inclusive start of the window
+        end_date: Inclusive end of the window
+
+    Returns:
+        SeriesArrays ordered by date ascending
+    """
+    stmt = select(
+        type_coerce(HealthData.date, String),
+        *(column for column in columns.values())
+    ).where(
+        HealthData.user_id == user_id,
+        HealthData.date >= start_date,
+        HealthData.date <= end_date
+    ).order_by(HealthData.date.asc())
+
+    capacity = LOAD_CHUNK_SIZE
+    dates = np.empty(capacity, dtype='datetime64[ns]')
+    values = np.empty((len(columns), capacity), dtype=np.float64)
+    size = 0
+    # Executed on the connection, as Core: ORM execution would buffer every row
+    result = db.session.connection().execute(stmt)
+    for chunk in result.partitions(LOAD_CHUNK_SIZE):
+        end = size + len(chunk)
+        if end > capacity:
+            # Grow geometrically so large windows copy O(n) elements in total
+            capacity = max(end, capacity * 2)
+            dates = _grow(dates, size, capacity)
+            values = _grow(values, size, capacity)
+        fields = list(zip(*chunk))
+        dates[size:end] = np.array(fields[0], dtype='datetime64[ns]')
+        for i, field in enumerate(fields[1:]):
+            # None becomes NaN when converted to float64
+            values[i, size:end] = np.array(field, dtype=np.float64)
+        size = end
+
+    return SeriesArrays(dates[:size], {name: values[i, :size] for i, name in enumerate(columns)})
+
+
+def _grow(array: np.ndarray, used: int, capacity: int) -> np.ndarray:
+    # Reallocate along the last axis, keeping the first `used` entries
+    grown = np.empty((*array.shape[:-1], capacity), dtype=array.dtype)
+    grown[..., :used] = array[..., :used]
+    return grown
+
+
+def fetch_window(user_id: int, columns: Dict[str, InstrumentedAttribute],
+                 start_date: datetime, end_date: datetime) -> pd.DataFrame:
+    """
+    Load the given columns for a user's records within a date range.
+
+    Args:
+        user_id: ID of the user whose data to load
+        columns: Mapping of DataFrame column name to model column
+        start_date: Inclusive start of the window
+        end_date: Inclusive end of the window
+
+    Returns:
+        DataFrame with a ``date`` column plus one float64 column per
+        requested model column, ordered by date ascending
+    """
+    return load_series(user_id, columns, start_date, end_date).to_frame()
+
+
+def fetch_graph_window(user_id: int, columns: Dict[str, InstrumentedAttribute],
+                       start_date: datetime, end_date: datetime) -> pd.DataFrame:
+    """
+    Load a graph's data at the configured GRAPH_RESOLUTION.
+
+    With 'day' (the default) the window is read from the daily rollups,
+    so a quarter is at most 90 rows per metric however often the user
+    logs; 'raw' reads every record with ``fetch_window``.
+
+    Args:
+        user_id: ID of the user whose data to load
+        columns: Mapping of DataFrame column name to model column
+        start_date: Inclusive start of the window
+        end_date: Inclusive end of the window
+
+    Returns:
+        DataFrame with a ``date`` column plus one column per requested
+        model column (daily means at 'day' resolution, alongside the
+        rollup aggregate columns), ordered by date ascending
+    """
+    if current_app.config.get('GRAPH_RESOLUTION', 'day') == 'raw':
+        return fetch_window(user_id, columns, start_date, end_date)
+    return fetch_rollup_series(user_id, list(columns), start_date.date(), end_date.date())
+
+
+def daily_series_start(days: int, end_date: datetime, rollup: Rollup = DAILY) -> datetime:
+    """
+    Return the start of the window fetch_daily_series reads.
+
+    Args:
+        days: Number of days in the window, ending at ``end_date``
+        end_date: End of the window
+        rollup: DAILY, or WEEKLY, whose window starts with the week of the first day
+
+    Returns:
+        Midnight of the window's first day (or of the Monday of its week)
+    """
+    start = datetime.combine(end_date.date() - timedelta(days=days - 1), datetime.min.time())
+    if rollup is WEEKLY:
+        start = datetime.combine(WEEKLY.bucket(start), datetime.min.time())
+    return start
+
+
+def fetch_daily_series(user_id: int, columns: Dict[str, InstrumentedAttribute],
+                       days: int, end_date: Optional[datetime] = None,
+                       rollup: Rollup = DAILY) -> pd.DataFrame:
+    """
+    Load per-day averages of the given columns for the last ``days`` days.
+
+    Reads the pre-aggregated rollups, so the result has at most ``days``
+    rows however many records the user logs per day or in total.
+
+    Args:
+        user_id: ID of the user whose data to load
+        columns: Mapping of DataFrame column name to model column
+        days: Number of days to include, ending at ``end_date``
+        end_date: End of the window (defaults to now)
+        rollup: DAILY, or WEEKLY for per-week averages
+
+    Returns:
+        DataFrame with a ``date`` column (one row per day, or week, with
+        data) plus one column per requested model column, ordered by date
+        ascending
+    """
+    end_date = end_date or datetime.now()
+    start_day = daily_series_start(days, end_date, rollup).date()
+    df = fetch_rollup_series(user_id, list(columns), start_day, end_date.date(), rollup)
+    return df[['date', *columns]]
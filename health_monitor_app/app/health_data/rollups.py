@@ -0,0 +1,323 @@
+"""
+Daily and weekly rollups of health data for the Health Monitor application.
+
+The rollup tables hold count, sum, min, max and sum of squares per user,
+metric and day (or week), so charts and statistics over a period read at
+most one row per metric and bucket however often the user logs.
+
+Rollups are kept current inside the write transaction: an added record
+is folded into its buckets with a single upsert per table, and an
+imported batch is aggregated in memory and folded in the same way, while
+edits and deletes re-aggregate the affected day and week from the raw
+rows (min and max cannot be un-applied incrementally). ``rebuild``
+recomputes everything from scratch and backs the
+``flask db rebuild-rollups`` command; ``backfill`` runs it at startup for
+users whose records predate the rollup tables.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import exists, func, select
+from sqlalchemy.dialects.sqlite import Insert, insert as sqlite_insert
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.sql.elements import ColumnElement
+
+from ..extensions import db
+from ..models import HealthData, HealthDataDailyRollup, HealthDataWeeklyRollup, User, UserDataVersion, execute_upsert
+
+# Metrics that are rolled up, keyed by the name used in DataFrames and
+# in the rollup tables' metric column
+ROLLUP_METRICS: Dict[str, InstrumentedAttribute] = {
+    'weight': HealthData.weight,
+    'systolic': HealthData.blood_pressure_systolic,
+    'diastolic': HealthData.blood_pressure_diastolic,
+    'heart_rate': HealthData.heart_rate,
+    'steps': HealthData.steps,
+    'sleep_duration': HealthData.sleep_duration,
+    'water_intake': HealthData.water_intake,
+    'calorie_intake': HealthData.calorie_intake,
+    'stress_level': HealthData.stress_level
+}
+
+# Rows inserted per executemany() call while rebuilding
+REBUILD_BATCH_SIZE = 5000
+
+
+class Rollup(NamedTuple):
+    """How one rollup table buckets records."""
+    model: Any
+    bucket_column: str
+    bucket_days: int
+    bucket_expr: ColumnElement
+
+    def bucket(self, moment: datetime) -> date:
+        """Return the bucket a timestamp falls in."""
+        day = moment.date()
+        return day - timedelta(days=day.weekday()) if self.bucket_days == 7 else day
+
+
+DAILY = Rollup(HealthDataDailyRollup, 'day', 1, func.date(HealthData.date))
+# SQLite: move to the coming Sunday (or stay on one), then back to its Monday
+WEEKLY = Rollup(HealthDataWeeklyRollup, 'week', 7, func.date(HealthData.date, 'weekday 0', '-6 days'))
+ROLLUPS = (DAILY, WEEKLY)
+
+
+def add_record(record: HealthData) -> None:
+    """
+    Fold a newly inserted record into its day and week buckets.
+
+    Runs one upsert per rollup table in the current transaction.
+
+    Args:
+        record: Flushed HealthData record
+    """
+    values = {
+        metric: float(getattr(record, column.key))
+        for metric, column in ROLLUP_METRICS.items()
+        if getattr(record, column.key) is not None
+    }
+    if not values:
+        return
+
+    for rollup in ROLLUPS:
+        _fold(rollup, [
+            {
+                'user_id': record.user_id,
+                rollup.bucket_column: rollup.bucket(record.date),
+                'metric': metric,
+                'count': 1,
+                'total': value,
+                'minimum': value,
+                'maximum': value,
+                'sum_squares': value * value
+            }
+            for metric, value in values.items()
+        ])
+
+
+def add_records(user_id: int, dates: np.ndarray, columns: Mapping[str, np.ndarray]) -> None:
+    """
+    Fold a batch of newly inserted records into their day and week buckets.
+
+    The batch is aggregated per bucket in memory, so a bulk insert costs
+    one upsert per bucket and metric rather than one per record.
+
+    Args:
+        user_id: ID of the user the records belong to
+        dates: Record dates as a datetime64 array
+        columns: Float arrays of the records' values keyed by HealthData
+            column name, NaN where a value is missing
+    """
+    days = dates.astype('datetime64[D]')
+    # Day 0 of datetime64 (1970-01-01) was a Thursday
+    mondays = days - (days.astype(np.int64) + 3) % 7
+    values = pd.DataFrame({
+        metric: columns[column.key] for metric, column in ROLLUP_METRICS.items() if column.key in columns
+    })
+    if values.empty:
+        return
+
+    for rollup in ROLLUPS:
+        keys = days if rollup.bucket_days == 1 else mondays
+        aggregates = values.groupby(keys).agg(['count', 'sum', 'min', 'max'])
+        sum_squares = (values * values).groupby(keys).sum()
+        counts, totals, minima, maxima = (aggregates.xs(name, axis=1, level=1).to_numpy()
+                                          for name in ('count', 'sum', 'min', 'max'))
+        squares = sum_squares.to_numpy()
+        rows = [
+            {
+                'user_id': user_id, rollup.bucket_column: bucket, 'metric': metric,
+                'count': int(counts[i, j]), 'total': float(totals[i, j]),
+                'minimum': float(minima[i, j]), 'maximum': float(maxima[i, j]),
+                'sum_squares': float(squares[i, j])
+            }
+            for i, bucket in enumerate(aggregates.index.date)
+            for j, metric in enumerate(values.columns)
+            if counts[i, j]
+        ]
+        _fold(rollup, rows)
+
+
+def _fold(rollup: Rollup, rows: List[Dict[str, Any]]) -> None:
+    # Add partial aggregates to the bucket rows, creating missing ones
+    execute_upsert(_fold_statement, rows, rollup)
+
+
+def _fold_statement(rollup: Rollup) -> Insert:
+    table = rollup.model.__table__
+    stmt = sqlite_insert(table)
+    # Multi-argument min()/max() are SQLite's scalar functions
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c[rollup.bucket_column], table.c.metric],
+        set_={
+            'count': table.c.count + stmt.excluded.count,
+            'total': table.c.total + stmt.excluded.total,
+            'minimum': func.min(table.c.minimum, stmt.excluded.minimum),
+            'maximum': func.max(table.c.maximum, stmt.excluded.maximum),
+            'sum_squares': table.c.sum_squares + stmt.excluded.sum_squares
+        }
+    )
+
+
+def refresh_buckets(user_id: int, moments: Iterable[datetime]) -> None:
+    """
+    Re-aggregate the day and week buckets containing the given times.
+
+    Used after an edit or delete, once the change has been flushed.
+
+    Args:
+        user_id: ID of the user whose records changed
+        moments: Dates of the changed records, before and after the change
+    """
+    for rollup in ROLLUPS:
+        for bucket in {rollup.bucket(moment) for moment in moments}:
+            start = datetime.combine(bucket, datetime.min.time())
+            _rebuild(rollup, user_id, start, start + timedelta(days=rollup.bucket_days))
+
+
+def refresh_span(user_id: int, first: datetime, last: datetime) -> None:
+    """
+    Re-aggregate every day and week bucket between two times.
+
+    Used after a bulk import overwrote existing records.
+
+    Args:
+        user_id: ID of the user whose records changed
+        first: Earliest date of the changed records
+        last: Latest date of the changed records
+    """
+    for rollup in ROLLUPS:
+        start = datetime.combine(rollup.bucket(first), datetime.min.time())
+        end = datetime.combine(rollup.bucket(last), datetime.min.time()) + timedelta(days=rollup.bucket_days)
+        _rebuild(rollup, user_id, start, end)
+
+
+def rebuild(user_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Recompute the rollup tables from the raw records.
+
+    Args:
+        user_id: Only rebuild this user's rollups (all users if None)
+
+    Returns:
+        Number of rollup rows written per table
+    """
+    return {rollup.model.__tablename__: _rebuild(rollup, user_id) for rollup in ROLLUPS}
+
+
+def backfill() -> List[int]:
+    """
+    Build the rollups of users who have records but no rollups, without committing.
+
+    Records added before the rollup tables existed were never folded
+    into them, and the graphs would show those users no data.
+
+    Returns:
+        IDs of the users whose rollups were built
+    """
+    query = select(User.id).where(
+        exists().where(HealthData.user_id == User.id),
+        ~exists().where(HealthDataDailyRollup.user_id == User.id)
+    )
+    user_ids = [user_id for (user_id,) in db.session.execute(query)]
+    for user_id in user_ids:
+        rebuild(user_id)
+        # Charts cached before the backfill were drawn without the records
+        UserDataVersion.bump(user_id)
+    return user_ids
+
+
+def _rebuild(rollup: Rollup, user_id: Optional[int] = None,
+             start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    # Replace the rollup rows of the selected buckets with fresh aggregates
+    table = rollup.model.__table__
+    bucket_col = table.c[rollup.bucket_column]
+    delete = table.delete()
+    filters = []
+    if user_id is not None:
+        delete = delete.where(table.c.user_id == user_id)
+        filters.append(HealthData.user_id == user_id)
+    if start is not None:
+        delete = delete.where(bucket_col >= start.date(), bucket_col < end.date())
+        filters.extend([HealthData.date >= start, HealthData.date < end])
+    db.session.execute(delete)
+
+    aggregates = []
+    for column in ROLLUP_METRICS.values():
+        aggregates.extend([
+            func.count(column), func.sum(column), func.min(column), func.max(column),
+            func.sum(column * column)
+        ])
+    query = db.session.query(HealthData.user_id, rollup.bucket_expr, *aggregates)\
+        .filter(*filters)\
+        .group_by(HealthData.user_id, rollup.bucket_expr)
+
+    batch: List[Dict[str, Any]] = []
+    written = 0
+    for row in query.yield_per(REBUILD_BATCH_SIZE):
+        bucket = date.fromisoformat(row[1])
+        for i, metric in enumerate(ROLLUP_METRICS):
+            count, total, minimum, maximum, sum_squares = row[2 + 5 * i: 7 + 5 * i]
+            if count:
+                batch.append({
+                    'user_id': row[0], rollup.bucket_column: bucket, 'metric': metric,
+                    'count': count, 'total': total, 'minimum': minimum,
+                    'maximum': maximum, 'sum_squares': sum_squares
+                })
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        written += len(batch)
+    return written
+
+
+def fetch_rollup_series(user_id: int, metrics: Sequence[str], start: date, end: date,
+                        rollup: Rollup = DAILY) -> pd.DataFrame:
+    """
+    Load per-bucket aggregates of the given metrics for a date range.
+
+    Args:
+        user_id: ID of the user whose data to load
+        metrics: Metric names (keys of ROLLUP_METRICS)
+        start: First bucket to include
+        end: Last bucket to include
+        rollup: DAILY or WEEKLY
+
+    Returns:
+        DataFrame with a ``date`` column (one row per bucket with data),
+        the mean of each metric under its own name, and ``<metric>_count``,
+        ``<metric>_total``, ``<metric>_min`` and ``<metric>_max`` columns,
+        ordered by date ascending
+    """
+    model = rollup.model
+    bucket_col = getattr(model, rollup.bucket_column)
+    rows = db.session.query(
+        bucket_col, model.metric, model.count, model.total, model.minimum, model.maximum
+    ).filter(
+        model.user_id == user_id,
+        bucket_col >= start,
+        bucket_col <= end,
+        model.metric.in_(list(metrics))
+    ).order_by(bucket_col).all()
+
+    buckets = sorted({row[0] for row in rows})
+    position = {bucket: i for i, bucket in enumerate(buckets)}
+    suffixes = ('count', 'total', 'min', 'max')
+    aggregates = {metric: np.full((len(suffixes), len(buckets)), np.nan) for metric in metrics}
+    for bucket, metric, *values in rows:
+        aggregates[metric][:, position[bucket]] = values
+
+    # Build the frame from plain arrays, already in column order
+    data: Dict[str, Any] = {'date': np.array(buckets, dtype='datetime64[ns]')}
+    for metric in metrics:
+        data[metric] = aggregates[metric][1] / aggregates[metric][0]
+    for metric in metrics:
+        for i, suffix in enumerate(suffixes):
+            data[f'{metric}_{suffix}'] = aggregates[metric][i]
+    return pd.DataFrame(data)
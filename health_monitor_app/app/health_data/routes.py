@@ -5,23 +5,36 @@ This module defines the routes for health data operations, including
 adding, viewing, updating, and deleting health records.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Response, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Response, abort, jsonify, stream_with_context
 from flask_login import login_required, current_user
-from ..extensions import db
-from ..models import HealthData, User
+from ..chart_cache import CHART_VERSION, chart_key, chart_response
+from ..chart_render import ChartSpec, SeriesSpec
+from ..extensions import db, chart_cache, chart_renderer, write_queue
+from ..models import HealthData, User, UserDataVersion
 from . import health_data
-from .forms import HealthDataForm
+from .export import EXPORT_FORMATS, available_formats, export_stream
+from .forms import HealthDataForm, ImportForm
+from .importer import ImportResult, detect_format, import_file
+from .pagination import paginate_history
+from .queries import (
+    PARAMETER_COLUMNS, PREVIEW_COLUMNS, daily_series_start, fetch_daily_series, fetch_window, has_health_data
+)
+from .rollups import WEEKLY
+from .samples import (
+    SAMPLE_METRICS, append_samples, downsample, fetch_graph_series, has_samples, read_samples, sample_bounds
+)
+from .stats import graph_stats, summarize_window
+from .sync import fetch_changes
+from .wearables import WEARABLE_FORMATS, detect_wearable_format, import_wearable
+from .writes import add_record, on_record_deleted, on_record_updated
 from datetime import datetime, timedelta, date
+import io
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
 from typing import Dict, List, Optional, Tuple, Union, Any, cast, TypeVar, TYPE_CHECKING
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Query
+from werkzeug.utils import secure_filename
 from ..security import sanitize_input, sanitize_form_data, validate_input
 import re
 
@@ -54,6 +67,36 @@ VALID_PARAMETERS = [
 # Valid time periods for filtering
 VALID_TIME_PERIODS = ['week', 'month', 'quarter']
 
+# Length and label of each time period
+PERIOD_CONFIG: Dict[str, Dict[str, Union[int, str]]] = {
+    'week': {'days': 7, 'label': '1 Week'},
+    'quarter': {'days': 90, 'label': '3 Months'},
+    'month': {'days': 30, 'label': '1 Month'}  # Default
+}
+
+# How each graph parameter is drawn: chart type, y-axis label and the
+# plotted DataFrame columns as (column, colour, legend label)
+GRAPH_STYLES: Dict[str, Dict[str, Any]] = {
+    'weight': {'kind': 'line', 'ylabel': 'Weight (kg)', 'series': [('weight', 'blue', None)]},
+    'blood_pressure': {'kind': 'line', 'ylabel': 'Blood Pressure (mmHg)',
+                       'series': [('systolic', 'red', 'Systolic'), ('diastolic', 'blue', 'Diastolic')]},
+    'heart_rate': {'kind': 'line', 'ylabel': 'Heart Rate (bpm)', 'series': [('heart_rate', 'green', None)]},
+    'steps': {'kind': 'bar', 'ylabel': 'Steps', 'series': [('steps', 'orange', None)]},
+    'sleep_duration': {'kind': 'line', 'ylabel': 'Sleep Duration (hours)',
+                       'series': [('sleep_duration', 'purple', None)]},
+    'water_intake': {'kind': 'bar', 'ylabel': 'Water Intake (liters)', 'series': [('water_intake', 'skyblue', None)]},
+    'calorie_intake': {'kind': 'bar', 'ylabel': 'Calories', 'series': [('calorie_intake', 'brown', None)]},
+    'stress_level': {'kind': 'line', 'ylabel': 'Stress Level (1-10)', 'series': [('stress_level', 'red', None)]}
+}
+
+# Colours of the history page preview charts
+PREVIEW_COLORS = {
+    'weight': 'blue',
+    'heart_rate': 'green',
+    'steps': 'orange',
+    'sleep_duration': 'purple'
+}
+
 # Error message constant
 ERROR_GENERIC = 'An unexpected error occurred. Please try again.'
 
@@ -71,34 +114,37 @@ def add_health_data():
     """
     form = HealthDataForm()
     if form.validate_on_submit():
+        # Sync clients may name the submission in a header instead of the form
+        idempotency_key = request.headers.get('Idempotency-Key') or form.idempotency_key.data or None
+        if idempotency_key is not None and len(idempotency_key) > 64:
+            abort(400)
         try:
-            # Create new health data record
-            health_data = HealthData(
-                user_id=current_user.id,
-                weight=form.weight.data,
-                blood_pressure_systolic=form.blood_pressure_systolic.data,
-                blood_pressure_diastolic=form.blood_pressure_diastolic.data,
-                heart_rate=form.heart_rate.data,
-                temperature=form.temperature.data,
-                oxygen_saturation=form.oxygen_saturation.data,
-                steps=form.steps.data,
-                exercise_duration=form.exercise_duration.data,
-                calories_burned=form.calories_burned.data,
-                sleep_duration=form.sleep_duration.data,
-                sleep_quality=form.sleep_quality.data,
-                water_intake=form.water_intake.data,
-                calorie_intake=form.calorie_intake.data,
-                stress_level=form.stress_level.data,
-                mood=form.mood.data,
-                notes=form.notes.data
-            )
-            db.session.add(health_data)
-            db.session.commit()
+            # Save through the write queue, which commits it (possibly
+            # together with other requests' writes) before returning
+            write_queue.run(add_record, current_user.id, {
+                'weight': form.weight.data,
+                'blood_pressure_systolic': form.blood_pressure_systolic.data,
+                'blood_pressure_diastolic': form.blood_pressure_diastolic.data,
+                'heart_rate': form.heart_rate.data,
+                'temperature': form.temperature.data,
+                'oxygen_saturation': form.oxygen_saturation.data,
+                'steps': form.steps.data,
+                'exercise_duration': form.exercise_duration.data,
+                'calories_burned': form.calories_burned.data,
+                'sleep_duration': form.sleep_duration.data,
+                'sleep_quality': form.sleep_quality.data,
+                'water_intake': form.water_intake.data,
+                'calorie_intake': form.calorie_intake.data,
+                'stress_level': form.stress_level.data,
+                'mood': form.mood.data,
+                'notes': form.notes.data
+            }, idempotency_key)
             
             flash('Health data added successfully!', 'success')
             return redirect(url_for('health_data.history'))
-        except Exception:
+        except Exception as e:
             db.session.rollback()
+            current_app.logger.error(f"Error adding health data: {str(e)}")
             flash(ERROR_GENERIC, 'error')
     
     return render_template('health_data/add.html', 
@@ -111,73 +157,64 @@ def history() -> str:
     """
     Display the user's health data history with pagination.
 
-    Also generates mini preview charts for quick visualization of trends.
+    Also links mini preview charts for quick visualization of trends.
 
     Returns:
-        Rendered template with health records and preview charts
+        Rendered template with health records and preview chart links
     """
     try:
-        # Validate and sanitize page input
-        try:
-            page = request.args.get('page', 1, type=int)
-            if page < 1:
-                page = 1
-        except (ValueError, TypeError):
-            page = 1
-        
-        # Query user's health records with pagination
-        health_records = HealthData.query.filter_by(user_id=current_user.id)\
-            .order_by(HealthData.date.desc())\
-            .paginate(page=page, per_page=10, error_out=False)
-        
-        # Generate mini preview charts
-        preview_charts: Dict[str, str] = {}
-        
-        # Get all data for charts
-        all_records = HealthData.query.filter_by(user_id=current_user.id)\
-            .order_by(HealthData.date.asc()).all()
+        per_page = current_app.config.get('HISTORY_PER_PAGE', 10)
 
-        if all_records and len(all_records) > 1:
+        if current_app.config.get('HISTORY_PAGINATION') == 'offset' or 'page' in request.args:
+            # Validate and sanitize page input
             try:
-                # Convert to DataFrame for easier manipulation
-                data = [{
-                    'date': record.date,
-                    'weight': record.weight,
-                    'systolic': record.blood_pressure_systolic,
-                    'diastolic': record.blood_pressure_diastolic,
-                    'heart_rate': record.heart_rate,
-                    'steps': record.steps,
-                    'sleep_duration': record.sleep_duration
-                } for record in all_records]
-
-                df = pd.DataFrame(data)
-
-                # Create mini charts
-                for param, color in [
-                    ('weight', 'blue'),
-                    ('heart_rate', 'green'),
-                    ('steps', 'orange'),
-                    ('sleep_duration', 'purple')
-                ]:
-                    if param in df.columns and df[param].notna().any():
-                        preview_charts[param] = create_mini_chart(df, param, color)
+                page = request.args.get('page', 1, type=int)
+                if page < 1:
+                    page = 1
+            except (ValueError, TypeError):
+                page = 1
 
+            # Query user's health records with OFFSET pagination
+            health_records = HealthData.query.filter_by(user_id=current_user.id)\
+                .order_by(HealthData.date.desc())\
+                .paginate(page=page, per_page=per_page, error_out=False)
+        else:
+            # Keyset pagination: each page is one indexed range scan
+            health_records = paginate_history(
+                current_user.id,
+                request.args.get('cursor'),
+                per_page,
+                with_total=current_app.config.get('HISTORY_SHOW_TOTAL', True)
+            )
+        
+        # Previews are separate requests to preview_chart() (server mode) or
+        # drawn by the browser from the series API (client mode)
+        preview_days = current_app.config.get('HISTORY_PREVIEW_DAYS', 90)
+        render_mode = chart_render_mode()
+        data_version = None
+        if render_mode == 'server':
+            data_version = UserDataVersion.get(current_user.id)
+            try:
+                prefetch_previews(current_user, preview_days, data_version)
             except Exception as e:
-                current_app.logger.error(f"Error generating preview charts: {str(e)}")
-                flash("Error generating preview charts. Some visualizations may not be available.", "warning")
+                # The image requests render anything that was not prefetched
+                current_app.logger.error(f"Error prefetching preview charts: {str(e)}")
 
         return render_template('health_data/history.html', title='Health Data History',
-                              health_records=health_records, preview_charts=preview_charts)
+                              health_records=health_records, preview_params=list(PREVIEW_COLORS),
+                              render_mode=render_mode, preview_days=preview_days,
+                              data_version=data_version, chart_version=CHART_VERSION,
+                              today=date.today().isoformat(), export_formats=available_formats())
 
     except Exception as e:
         current_app.logger.error(f"Error in history view: {str(e)}")
         flash("Error loading health history. Please try again.", "danger")
         return render_template('health_data/history.html', title='Health Data History',
-                              health_records=None, preview_charts={})
+                              health_records=None, preview_params=[])
 
-def create_mini_chart(df: pd.DataFrame, parameter: str, color: str) -> str:
+def mini_chart_spec(df: pd.DataFrame, parameter: str, color: str) -> Optional[ChartSpec]:
     """
-    Create a mini chart for the specified parameter.
+    Describe a mini chart for the specified parameter.
 
     Args:
         df: DataFrame containing the data
@@ -185,25 +222,70 @@ def create_mini_chart(df: pd.DataFrame, parameter: str, color: str) -> str:
         color: Color for the line
 
     Returns:
-        Base64 encoded image string
+        Chart spec, or None if the parameter is not in the data
     """
     # Security check: validate parameter
     if parameter not in df.columns:
         current_app.logger.warning(f"Invalid parameter requested for chart: {parameter}")
-        return ""
-        
-    fig, ax = plt.subplots(figsize=(3, 1.5))
-    ax.plot(df['date'], df[parameter], '-', color=color)
-    ax.set_title(parameter.replace('_', ' ').title(), fontsize=8)
-    ax.tick_params(axis='both', which='both', labelsize=6)
-    fig.tight_layout()
-
-    img = BytesIO()
-    fig.savefig(img, format='png', dpi=80)
-    img.seek(0)
-    chart = base64.b64encode(img.getvalue()).decode()
-    plt.close(fig)
-    return chart
+        return None
+
+    return ChartSpec(
+        series=(SeriesSpec.from_frame(df, parameter, color),),
+        figsize=(3, 1.5),
+        dpi=80,
+        title=parameter.replace('_', ' ').title(),
+        title_size=8,
+        tick_size=6
+    )
+
+def create_mini_chart(df: pd.DataFrame, parameter: str, color: str) -> bytes:
+    """
+    Create a mini chart for the specified parameter.
+
+    Args:
+        df: DataFrame containing the data
+        parameter: Parameter to plot
+        color: Color for the line
+
+    Returns:
+        PNG image bytes, empty if the parameter is not in the data
+    """
+    spec = mini_chart_spec(df, parameter, color)
+    return chart_renderer.render(spec) if spec else b''
+
+def prefetch_previews(user: User, preview_days: int, data_version: int) -> None:
+    """
+    Start rendering the history previews that are not cached yet.
+
+    The four previews are submitted to the render pool together and drawn
+    concurrently while the page is sent; preview_chart() then finds each
+    one cached or joins its in-flight render. Nothing is started when the
+    pool is disabled, so the page never waits for a chart.
+
+    Args:
+        user: User whose previews to render
+        preview_days: Number of days the previews cover
+        data_version: The user's current data version
+    """
+    if chart_renderer.workers <= 0:
+        return
+
+    today = date.today()
+    keys = {
+        param: chart_key(user, 'preview', param, f'{preview_days}d', today, data_version)
+        for param in PREVIEW_COLORS
+    }
+    missing = {param: key for param, key in keys.items() if chart_cache.get(key) is None}
+    if not missing:
+        return
+
+    df = fetch_daily_series(user.id, {param: PREVIEW_COLUMNS[param] for param in missing}, preview_days)
+    for param, key in missing.items():
+        if len(df) < 2 or not df[param].notna().any():
+            chart_cache.set(key, b'')
+            continue
+        chart_renderer.submit(mini_chart_spec(df, param, PREVIEW_COLORS[param]), key=key,
+                              on_done=lambda png, key=key: chart_cache.set(key, png))
 
 @health_data.route('/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -236,6 +318,8 @@ def edit_health_data(id: int) -> Union[str, Response]:
 
         form = HealthDataForm()
         if form.validate_on_submit():
+            previous_date = data.date
+
             # Sanitize text inputs
             sanitized_notes = sanitize_input(form.notes.data) if form.notes.data else None
             sanitized_mood = sanitize_input(form.mood.data) if form.mood.data else None
@@ -258,6 +342,7 @@ def edit_health_data(id: int) -> Union[str, Response]:
             data.notes = sanitized_notes
 
             try:
+                on_record_updated(data, previous_date)
                 db.session.commit()
                 current_app.logger.info(f"Health data record {id} updated by user {current_user.username}")
                 flash('Health data updated successfully!', 'success')
@@ -335,6 +420,7 @@ def delete_health_data(id: int) -> Response:
             record_date = data.date
             
             db.session.delete(data)
+            on_record_deleted(current_user.id, id, record_date)
             db.session.commit()
             
             current_app.logger.info(
@@ -361,6 +447,91 @@ def delete_health_data(id: int) -> Response:
         flash(ERROR_GENERIC, 'danger')
         return redirect(url_for('health_data.history'))
 
+@health_data.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_health_data() -> str:
+    """
+    Bulk import health data from an uploaded CSV or NDJSON file, or an
+    Apple Health or Fitbit export.
+
+    GET: Display the upload form
+    POST: Import the file and show how many rows were imported or rejected
+    """
+    form = ImportForm()
+    result: Optional[ImportResult] = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        filename = upload.filename or ''
+        if form.format.data == 'auto':
+            fmt = detect_wearable_format(filename, upload.stream) or detect_format(filename)
+        else:
+            fmt = form.format.data
+        if fmt is None:
+            flash('Could not tell the file format from its name. Please choose one.', 'warning')
+        else:
+            wearable = fmt in WEARABLE_FORMATS
+            stream = upload.stream if wearable else io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            try:
+                if wearable:
+                    result = import_wearable(current_user.id, stream, fmt, filename)
+                else:
+                    result = import_file(current_user.id, stream, fmt)
+                current_app.logger.info(
+                    f"User {current_user.username} imported {result.imported} health data rows "
+                    f"({result.replaced} replaced, {result.rejected} rejected)"
+                )
+                if result.imported:
+                    replaced = f' ({result.replaced} replaced existing records)' if result.replaced else ''
+                    flash(f'Imported {result.imported} health data records{replaced}.', 'success')
+                if result.rejected:
+                    flash(f'{result.rejected} rows were rejected.', 'warning')
+            except (ValueError, UnicodeDecodeError) as e:
+                flash(f'Could not read the file: {e}', 'danger')
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Unexpected error when importing health data: {str(e)}")
+                flash(ERROR_GENERIC, 'danger')
+            finally:
+                if not wearable:
+                    stream.detach()
+
+    return render_template('health_data/import.html',
+                           title='Import Health Data',
+                           form=form,
+                           result=result)
+
+@health_data.route('/export/<fmt>')
+@login_required
+def export_health_data(fmt: str) -> Response:
+    """
+    Download the user's full health data history.
+
+    The file is streamed in batches while it is read, so memory use does
+    not depend on the size of the history.
+
+    Args:
+        fmt: Export format ('csv', 'ndjson' or 'parquet')
+
+    Returns:
+        Streamed file download
+    """
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    if fmt not in available_formats():
+        flash('Parquet export is not available on this server.', 'warning')
+        return redirect(url_for('health_data.history'))
+
+    export_format = EXPORT_FORMATS[fmt]
+    filename = secure_filename(f"health-data-{current_user.username}-{date.today().isoformat()}.{export_format.extension}")
+    current_app.logger.info(f"User {current_user.username} exported health data as {fmt}")
+    # stream_with_context keeps the app context (and the database
+    # session) alive while the generator runs after the view returns
+    return Response(
+        stream_with_context(export_stream(current_user.id, fmt)),
+        mimetype=export_format.mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @health_data.route('/graph/<parameter>')
 @health_data.route('/graph/<parameter>/<time_period>')
 @health_data.route('/graph/<parameter>/<time_period>/<reference_date>')
@@ -398,11 +569,8 @@ def view_graph(parameter: str, time_period: str = 'month', reference_date: Optio
                 current_app.logger.warning(f"Invalid reference date format: {reference_date}")
                 reference_date = None  # Use current date if invalid
         
-        # Get all health data for the current user
-        health_records = HealthData.query.filter_by(user_id=current_user.id)\
-            .order_by(HealthData.date.asc()).all()
-
-        if not health_records:
+        if not has_health_data(current_user.id) and not (
+                parameter in SAMPLE_METRICS and has_samples(current_user.id, parameter)):
             flash('No health data available for graphing.', 'info')
             return redirect(url_for('health_data.history'))
 
@@ -414,50 +582,24 @@ def view_graph(parameter: str, time_period: str = 'month', reference_date: Optio
             flash('Invalid date format. Using current date.', 'warning')
             ref_date = date.today()
 
-        # Calculate date ranges based on time period
-        period_config: Dict[str, Dict[str, Union[int, str]]] = {
-            'week': {'days': 7, 'label': '1 Week'},
-            'quarter': {'days': 90, 'label': '3 Months'},
-            'month': {'days': 30, 'label': '1 Month'}  # Default
-        }
-
-        # Get configuration for the selected time period (or default to month)
-        period_info = period_config.get(time_period, period_config['month'])
-        period_days = int(period_info['days'])
-
         # Calculate start and end dates for the selected period
-        start_date = datetime.combine(ref_date - timedelta(days=period_days-1), datetime.min.time())
-        end_date = datetime.combine(ref_date, datetime.max.time())
+        start_date, end_date = period_window(ref_date, time_period)
+        period_days = int(PERIOD_CONFIG[time_period]['days'])
 
         # Calculate navigation dates
         next_date = (ref_date + timedelta(days=period_days)).strftime('%Y-%m-%d')
         prev_date = (ref_date - timedelta(days=period_days)).strftime('%Y-%m-%d')
 
         # Format the period text for display
-        period_text = f"{start_date.strftime('%b %d')} - {end_date.strftime('%b %d, %Y')}"
-
-        # Convert to DataFrame for easier manipulation
-        data = [{
-            'date': record.date,
-            'weight': record.weight,
-            'systolic': record.blood_pressure_systolic,
-            'diastolic': record.blood_pressure_diastolic,
-            'heart_rate': record.heart_rate,
-            'steps': record.steps,
-            'sleep_duration': record.sleep_duration,
-            'water_intake': record.water_intake,
-            'calorie_intake': record.calorie_intake,
-            'stress_level': record.stress_level
-        } for record in health_records]
-
-        df = pd.DataFrame(data)
-
-        # Filter data based on time period and reference date
-        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+        period_text = format_period_text(start_date, end_date)
+
+        # Load only the selected parameter's columns within the period
+        df = fetch_graph_series(current_user.id, parameter, start_date, end_date)
 
         # Check if filtered data exists
         no_data_in_period = len(df) == 0
-        graph = None
+        render_mode = chart_render_mode()
+        chart_url = None
         title = f"{parameter.replace('_', ' ').title()} History"
         stats: Dict[str, Dict[str, Any]] = {
             'averages': {},
@@ -469,8 +611,15 @@ def view_graph(parameter: str, time_period: str = 'month', reference_date: Optio
 
         if not no_data_in_period:
             try:
-                # Generate graph based on parameter
-                graph, title, stats = generate_graph(df, parameter, period_text)
+                # Calculate statistics; the graph itself is fetched separately,
+                # as a PNG from graph_chart() or drawn from the series API
+                stats = calculate_graph_stats(df, parameter)
+                title = f'{parameter.replace("_", " ").title()} History - {period_text}'
+                if render_mode == 'server':
+                    chart_url = url_for('health_data.graph_chart', parameter=parameter,
+                                        time_period=time_period,
+                                        reference_date=ref_date.strftime('%Y-%m-%d'),
+                                        v=UserDataVersion.get(current_user.id), r=CHART_VERSION)
             except ValueError as ve:
                 current_app.logger.warning(f"Error generating graph: {str(ve)}")
                 flash(f'Error generating graph: {str(ve)}', 'warning')
@@ -483,7 +632,11 @@ def view_graph(parameter: str, time_period: str = 'month', reference_date: Optio
 
         return render_template('health_data/graph.html',
                               title=title,
-                              graph=graph,
+                              chart_url=chart_url,
+                              render_mode=render_mode,
+                              series_url=url_for('health_data.series_api', parameter=parameter,
+                                                 period=time_period,
+                                                 reference_date=ref_date.strftime('%Y-%m-%d')),
                               parameter=parameter,
                               time_period=time_period,
                               reference_date=ref_date.strftime('%Y-%m-%d'),
@@ -507,226 +660,357 @@ def view_graph(parameter: str, time_period: str = 'month', reference_date: Optio
         flash(ERROR_GENERIC, 'danger')
         return redirect(url_for('health_data.history'))
 
-def generate_graph(df: pd.DataFrame, parameter: str, period_text: str) -> Tuple[str, str, Dict[str, Dict[str, Any]]]:
+@health_data.route('/api/series/<parameter>')
+@login_required
+def series_api(parameter: str) -> Tuple[Response, int]:
     """
-    Generate a graph for the specified health parameter.
+    Return a health parameter's time series as compact columnar JSON.
+
+    Query args select the window: ``period`` and ``reference_date`` match
+    the graph view, while ``days`` (with ``resolution=day`` or ``week``
+    for per-day or per-week averages) selects the most recent days as
+    used by the previews. Graph periods are read at GRAPH_RESOLUTION, or
+    downsampled from the user's samples where there are any.
 
     Args:
-        df: Pandas DataFrame containing filtered health data
-        parameter: Health parameter to visualize
-        period_text: Text describing the time period for the graph title
+        parameter: Health parameter to return ('weight', 'blood_pressure', etc.)
 
     Returns:
-        Tuple containing:
-        - encoded_image: Base64 encoded image string
-        - title: Graph title
-        - statistics_dict: Dictionary of calculated statistics
+        JSON response and status code. The body holds ``t`` (timestamps in
+        epoch milliseconds) plus one value array per plotted column under
+        ``series``, with null for missing values, the style to draw them
+        and per-column summary statistics under ``stats``
+    """
+    try:
+        parameter = sanitize_input(parameter)
+        if parameter not in VALID_PARAMETERS:
+            return jsonify(error='Invalid health parameter requested.'), 400
+
+        columns = PARAMETER_COLUMNS[parameter]
+        days = request.args.get('days', type=int)
+        if days:
+            days = max(1, min(days, 366))
+            end_date = datetime.now()
+            resolution = request.args.get('resolution')
+            # The start reported is the one the query used; weekly series
+            # begin with the week of the first day
+            if resolution == 'day':
+                start_date = daily_series_start(days, end_date)
+                df = fetch_daily_series(current_user.id, columns, days, end_date)
+            elif resolution == 'week':
+                start_date = daily_series_start(days, end_date, WEEKLY)
+                df = fetch_daily_series(current_user.id, columns, days, end_date, WEEKLY)
+            else:
+                start_date = daily_series_start(days, end_date)
+                df = fetch_window(current_user.id, columns, start_date, end_date)
+        else:
+            time_period = request.args.get('period', 'month')
+            if time_period not in VALID_TIME_PERIODS:
+                time_period = 'month'
+            try:
+                ref_date = datetime.strptime(request.args.get('reference_date', ''), '%Y-%m-%d').date()
+            except ValueError:
+                ref_date = date.today()
+            start_date, end_date = period_window(ref_date, time_period)
+            df = fetch_graph_series(current_user.id, parameter, start_date, end_date)
+
+        style = GRAPH_STYLES[parameter]
+        return jsonify(
+            parameter=parameter,
+            unit=UNIT_MAPPING.get(parameter, ''),
+            kind=style['kind'],
+            ylabel=style['ylabel'],
+            start=start_date.isoformat(),
+            end=end_date.isoformat(),
+            t=[int(ts.value // 1_000_000) for ts in df['date']],
+            series={
+                column: [None if pd.isna(value) else value for value in df[column].tolist()]
+                for column, _, _ in style['series']
+            },
+            styles=[{'column': column, 'color': color, 'label': label}
+                    for column, color, label in style['series']],
+            stats={column: summary.to_dict() for column, summary in summarize_window(df, list(columns)).items()}
+        ), 200
 
-    Raises:
-        ValueError: If parameter is invalid or no data is available
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error in series API: {str(e)}")
+        return jsonify(error='Error retrieving health data.'), 500
+
+@health_data.route('/api/sync')
+@login_required
+def sync_api() -> Tuple[Response, int]:
     """
-    # Initialize statistics dictionaries
-    stats: Dict[str, Dict[str, Any]] = {
-        'averages': {},
-        'minimums': {},
-        'maximums': {},
-        'latest': {},
-        'trends': {}
-    }
+    Return the current user's health data changes since a sync token.
 
-    if df.empty:
-        raise ValueError(f"No data available for {parameter}")
+    Query args: ``token`` from the previous response (omit for a full
+    sync) and ``limit``, the page size (SYNC_PAGE_SIZE by default, at most
+    SYNC_MAX_PAGE_SIZE). While ``has_more`` is true the client requests
+    the next page with the returned token; afterwards it keeps the token
+    for its next sync.
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    title = f'{parameter.replace("_", " ").title()} History - {period_text}'
-
-    if parameter == 'weight' and 'weight' in df and df['weight'].notna().any():
-        ax.plot(df['date'], df['weight'], 'o-', color='blue')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Weight (kg)')
-
-        # Calculate statistics
-        stats['averages']['weight'] = round(float(df['weight'].mean()), 1)
-        stats['minimums']['weight'] = round(float(df['weight'].min()), 1)
-        stats['maximums']['weight'] = round(float(df['weight'].max()), 1)
-        stats['latest']['weight'] = round(float(df['weight'].iloc[-1]), 1) if not df.empty else 'N/A'
-
-        # Determine trend
-        stats['trends']['weight'] = calculate_trend(df['weight'], threshold=0.1)
-
-    elif parameter == 'blood_pressure' and 'systolic' in df and 'diastolic' in df and df['systolic'].notna().any() and df['diastolic'].notna().any():
-        ax.plot(df['date'], df['systolic'], 'o-', color='red', label='Systolic')
-        ax.plot(df['date'], df['diastolic'], 'o-', color='blue', label='Diastolic')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Blood Pressure (mmHg)')
-        ax.legend()
-
-        # Calculate statistics for both systolic and diastolic
-        if not df.empty:
-            stats['averages']['blood_pressure'] = f"{round(float(df['systolic'].mean()))}/{round(float(df['diastolic'].mean()))}"
-            stats['minimums']['blood_pressure'] = f"{round(float(df['systolic'].min()))}/{round(float(df['diastolic'].min()))}"
-            stats['maximums']['blood_pressure'] = f"{round(float(df['systolic'].max()))}/{round(float(df['diastolic'].max()))}"
-            stats['latest']['blood_pressure'] = f"{round(float(df['systolic'].iloc[-1]))}/{round(float(df['diastolic'].iloc[-1]))}"
-        else:
-            stats['averages']['blood_pressure'] = stats['minimums']['blood_pressure'] = stats['maximums']['blood_pressure'] = stats['latest']['blood_pressure'] = 'N/A'
-
-        # Determine trend based on systolic
-        stats['trends']['blood_pressure'] = calculate_trend(df['systolic'], threshold=1)
-
-    elif parameter == 'heart_rate' and 'heart_rate' in df and df['heart_rate'].notna().any():
-        ax.plot(df['date'], df['heart_rate'], 'o-', color='green')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Heart Rate (bpm)')
-
-        # Calculate statistics
-        if not df.empty:
-            stats['averages']['heart_rate'] = round(float(df['heart_rate'].mean()))
-            stats['minimums']['heart_rate'] = int(df['heart_rate'].min())
-            stats['maximums']['heart_rate'] = int(df['heart_rate'].max())
-            stats['latest']['heart_rate'] = int(df['heart_rate'].iloc[-1])
-        else:
-            stats['averages']['heart_rate'] = stats['minimums']['heart_rate'] = stats['maximums']['heart_rate'] = stats['latest']['heart_rate'] = 'N/A'
-
-        # Determine trend
-        stats['trends']['heart_rate'] = calculate_trend(df['heart_rate'], threshold=1)
-
-    elif parameter == 'steps' and 'steps' in df and df['steps'].notna().any():
-        ax.bar(df['date'], df['steps'], color='orange')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Steps')
-
-        # Calculate statistics
-        if not df.empty:
-            stats['averages']['steps'] = round(float(df['steps'].mean()))
-            stats['minimums']['steps'] = int(df['steps'].min())
-            stats['maximums']['steps'] = int(df['steps'].max())
-            stats['latest']['steps'] = int(df['steps'].iloc[-1])
-        else:
-            stats['averages']['steps'] = stats['minimums']['steps'] = stats['maximums']['steps'] = stats['latest']['steps'] = 'N/A'
-
-        # Determine trend
-        stats['trends']['steps'] = calculate_trend(df['steps'], threshold=100)
-
-    elif parameter == 'sleep_duration' and 'sleep_duration' in df and df['sleep_duration'].notna().any():
-        ax.plot(df['date'], df['sleep_duration'], 'o-', color='purple')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Sleep Duration (hours)')
-
-        # Calculate statistics
-        if not df.empty:
-            stats['averages']['sleep_duration'] = round(float(df['sleep_duration'].mean()), 1)
-            stats['minimums']['sleep_duration'] = round(float(df['sleep_duration'].min()), 1)
-            stats['maximums']['sleep_duration'] = round(float(df['sleep_duration'].max()), 1)
-            stats['latest']['sleep_duration'] = round(float(df['sleep_duration'].iloc[-1]), 1)
-        else:
-            stats['averages']['sleep_duration'] = stats['minimums']['sleep_duration'] = stats['maximums']['sleep_duration'] = stats['latest']['sleep_duration'] = 'N/A'
-
-        # Determine trend
-        stats['trends']['sleep_duration'] = calculate_trend(df['sleep_duration'], threshold=0.2)
-
-    elif parameter == 'water_intake' and 'water_intake' in df and df['water_intake'].notna().any():
-        ax.bar(df['date'], df['water_intake'], color='skyblue')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Water Intake (liters)')
-
-        # Calculate statistics
-        if not df.empty:
-            stats['averages']['water_intake'] = round(float(df['water_intake'].mean()), 1)
-            stats['minimums']['water_intake'] = round(float(df['water_intake'].min()), 1)
-            stats['maximums']['water_intake'] = round(float(df['water_intake'].max()), 1)
-            stats['latest']['water_intake'] = round(float(df['water_intake'].iloc[-1]), 1)
-        else:
-            stats['averages']['water_intake'] = stats['minimums']['water_intake'] = stats['maximums']['water_intake'] = stats['latest']['water_intake'] = 'N/A'
-
-        # Determine trend
-        stats['trends']['water_intake'] = calculate_trend(df['water_intake'], threshold=0.1)
-
-    elif parameter == 'calorie_intake' and 'calorie_intake' in df and df['calorie_intake'].notna().any():
-        ax.bar(df['date'], df['calorie_intake'], color='brown')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Calories')
-
-        # Calculate statistics
-        if not df.empty:
-            stats['averages']['calorie_intake'] = round(float(df['calorie_intake'].mean()))
-            stats['minimums']['calorie_intake'] = int(df['calorie_intake'].min())
-            stats['maximums']['calorie_intake'] = int(df['calorie_intake'].max())
-            stats['latest']['calorie_intake'] = int(df['calorie_intake'].iloc[-1])
-        else:
-            stats['averages']['calorie_intake'] = stats['minimums']['calorie_intake'] = stats['maximums']['calorie_intake'] = stats['latest']['calorie_intake'] = 'N/A'
-
-        # Determine trend
-        stats['trends']['calorie_intake'] = calculate_trend(df['calorie_intake'], threshold=50)
-
-    elif parameter == 'stress_level' and 'stress_level' in df and df['stress_level'].notna().any():
-        ax.plot(df['date'], df['stress_level'], 'o-', color='red')
-        ax.set_title(title)
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Stress Level (1-10)')
-
-        # Calculate statistics
-        if not df.empty:
-            stats['averages']['stress_level'] = round(float(df['stress_level'].mean()), 1)
-            stats['minimums']['stress_level'] = int(df['stress_level'].min())
-            stats['maximums']['stress_level'] = int(df['stress_level'].max())
-            stats['latest']['stress_level'] = int(df['stress_level'].iloc[-1])
-        else:
-            stats['averages']['stress_level'] = stats['minimums']['stress_level'] = stats['maximums']['stress_level'] = stats['latest']['stress_level'] = 'N/A'
+    Returns:
+        JSON response and status code. The body holds ``changes`` (each
+        with ``op`` 'upsert' and the record's fields, or 'delete' with its
+        ``id`` and ``date``), ``token`` and ``has_more``
+    """
+    limit = request.args.get('limit', current_app.config['SYNC_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['SYNC_MAX_PAGE_SIZE']))
+    try:
+        page = fetch_changes(current_user.id, request.args.get('token'), limit)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error in sync API: {str(e)}")
+        return jsonify(error='Error retrieving health data.'), 500
+    return jsonify(changes=page.changes, token=page.token, has_more=page.has_more), 200
 
-        # Determine trend
-        stats['trends']['stress_level'] = calculate_trend(df['stress_level'], threshold=0.5)
+@health_data.route('/api/samples/<metric>', methods=['POST'])
+@login_required
+def append_samples_api(metric: str) -> Tuple[Response, int]:
+    """
+    Store high-frequency samples of a metric for the current user.
 
-    else:
-        raise ValueError(f'No data available for {parameter} or parameter is invalid.')
+    The JSON body holds ``t`` (sample times in epoch milliseconds) and
+    ``v`` (the values, null for none), at most SAMPLE_MAX_APPEND samples
+    per request. Samples at the same second as stored ones replace them.
+    Values must be finite and within the range the add form accepts for
+    the metric, or the whole request is rejected.
 
-    # Format the graph
-    fig.autofmt_xdate()  # Rotate date labels
-    fig.tight_layout()
+    Args:
+        metric: Sampled metric ('heart_rate', 'steps', 'oxygen_saturation')
 
-    # Save to bytesIO
-    img = BytesIO()
-    fig.savefig(img, format='png')
-    img.seek(0)
-    encoded_img = base64.b64encode(img.getvalue()).decode()
-    plt.close(fig)
+    Returns:
+        JSON response with the number of ``stored`` samples, and status code
+    """
+    if metric not in SAMPLE_METRICS:
+        return jsonify(error='Invalid sample metric.'), 400
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error='Expected a JSON object.'), 400
+    times, values = payload.get('t'), payload.get('v')
+    if not isinstance(times, list) or not isinstance(values, list) or len(times) != len(values):
+        return jsonify(error='Expected equally long "t" and "v" arrays.'), 400
+    if len(times) > current_app.config['SAMPLE_MAX_APPEND']:
+        return jsonify(error='Too many samples in one request.'), 413
+    try:
+        times = np.array(times, dtype=np.int64).astype('datetime64[ms]')
+        values = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError, OverflowError):
+        return jsonify(error='Sample times must be integers and values numbers.'), 400
+    # null marks a missing value; NaN and Infinity (which Python's JSON
+    # parser accepts) are rejected with the other invalid values
+    missing = np.fromiter((value is None for value in payload['v']), dtype=bool, count=len(values))
+    if not np.isfinite(values[~missing]).all():
+        return jsonify(error='Sample values must be finite numbers.'), 400
+    minimum, maximum = sample_bounds(metric)
+    if ((values < minimum) | (values > maximum)).any():
+        return jsonify(error=f'Sample values must be between {minimum:g} and {maximum:g}.'), 400
 
-    return encoded_img, title, stats
+    try:
+        stored = write_queue.run(append_samples, current_user.id, metric, times, values)
+    except Exception as e:
+        current_app.logger.error(f"Error storing {metric} samples: {str(e)}")
+        return jsonify(error='Error storing samples.'), 500
+    return jsonify(stored=stored), 200
 
-def calculate_trend(series: pd.Series, threshold: float = 0.1, num_points: int = 3) -> str:
+@health_data.route('/api/samples/<metric>')
+@login_required
+def samples_api(metric: str) -> Tuple[Response, int]:
     """
-    Calculate the trend of a time series.
+    Return the current user's samples of a metric over a time range.
+
+    Query args: ``start`` and ``end`` (ISO datetimes, inclusive; the last
+    day by default) and ``bucket``, a width in seconds to downsample to
+    instead of returning every sample.
 
     Args:
-        series: Pandas Series containing the data
-        threshold: Threshold to determine if trend is significant
-        num_points: Number of most recent points to consider
+        metric: Sampled metric ('heart_rate', 'steps', 'oxygen_saturation')
 
     Returns:
-        'up', 'down', or 'neutral' depending on trend direction
+        JSON response and status code. The body holds ``t`` (epoch
+        milliseconds) and ``v`` (sample values, or bucket means or sums);
+        downsampled responses add per-bucket ``count``, ``min`` and ``max``
     """
-    if len(series) >= num_points:
-        recent_data = series.tail(num_points)
-        try:
-            # Convert data indices to numeric range for fitting
-            x_range = np.arange(len(recent_data))
-            # Convert series values to float for calculation
-            y_values = recent_data.astype(float).values
-            # Calculate trend slope
-            slope = np.polyfit(x_range, y_values, 1)[0]
-
-            if slope > threshold:
-                return 'up'
-            elif slope < -threshold:
-                return 'down'
-        except (ValueError, TypeError) as e:
-            current_app.logger.warning(f"Error calculating trend: {str(e)}")
-            return 'neutral'
-
-    return 'neutral'
\ No newline at end of file
+    if metric not in SAMPLE_METRICS:
+        return jsonify(error='Invalid sample metric.'), 400
+    try:
+        end = datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.now()
+        start = datetime.fromisoformat(request.args['start']) if 'start' in request.args else end - timedelta(days=1)
+    except ValueError:
+        return jsonify(error='Invalid start or end.'), 400
+    bucket = request.args.get('bucket', type=int)
+
+    try:
+        if bucket:
+            df = downsample(current_user.id, metric, start, end, timedelta(seconds=max(1, bucket)))
+            return jsonify(
+                t=df['date'].to_numpy(dtype='datetime64[ms]').astype(np.int64).tolist(),
+                v=df[metric].tolist(),
+                count=df[f'{metric}_count'].astype(int).tolist(),
+                min=df[f'{metric}_min'].tolist(),
+                max=df[f'{metric}_max'].tolist()
+            ), 200
+        series = read_samples(current_user.id, metric, start, end)
+        return jsonify(
+            t=series.dates.astype('datetime64[ms]').astype(np.int64).tolist(),
+            v=series.values[metric].tolist()
+        ), 200
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error in samples API: {str(e)}")
+        return jsonify(error='Error retrieving samples.'), 500
+
+@health_data.route('/chart/<parameter>/<time_period>/<reference_date>.png')
+@login_required
+def graph_chart(parameter: str, time_period: str, reference_date: str) -> Response:
+    """
+    Serve the graph for a health parameter and period as a PNG image.
+
+    Args:
+        parameter: Health parameter to display ('weight', 'blood_pressure', etc.)
+        time_period: Time period to display ('week', 'month', 'quarter')
+        reference_date: ISO format date (YYYY-MM-DD) the period ends on
+
+    Returns:
+        PNG response, 304 if the browser's copy is current, or 404
+    """
+    if parameter not in VALID_PARAMETERS or time_period not in VALID_TIME_PERIODS:
+        abort(404)
+    try:
+        ref_date = datetime.strptime(reference_date, '%Y-%m-%d').date()
+    except ValueError:
+        abort(404)
+
+    start_date, end_date = period_window(ref_date, time_period)
+    key = chart_key(current_user, 'graph', parameter, time_period, ref_date,
+                    UserDataVersion.get(current_user.id))
+
+    def render() -> bytes:
+        df = fetch_graph_series(current_user.id, parameter, start_date, end_date)
+        if not any(df[column].notna().any() for column, _, _ in GRAPH_STYLES[parameter]['series']):
+            return b''
+        title = f'{parameter.replace("_", " ").title()} History - {format_period_text(start_date, end_date)}'
+        return render_graph(df, parameter, title)
+
+    return chart_response(key, render)
+
+@health_data.route('/chart/preview/<parameter>.png')
+@login_required
+def preview_chart(parameter: str) -> Response:
+    """
+    Serve a history page preview sparkline as a PNG image.
+
+    Args:
+        parameter: Previewed parameter ('weight', 'heart_rate', 'steps', 'sleep_duration')
+
+    Returns:
+        PNG response, 304 if the browser's copy is current, or 404 if there
+        is nothing to draw
+    """
+    if parameter not in PREVIEW_COLORS:
+        abort(404)
+
+    preview_days = current_app.config.get('HISTORY_PREVIEW_DAYS', 90)
+    key = chart_key(current_user, 'preview', parameter, f'{preview_days}d', date.today(),
+                    UserDataVersion.get(current_user.id))
+
+    def render() -> bytes:
+        # Join the render started by history() if it is still in flight
+        png = chart_renderer.wait(key)
+        if png is not None:
+            return png
+
+        # Previews plot a bounded, per-day series rather than every record
+        df = fetch_daily_series(current_user.id, {parameter: PREVIEW_COLUMNS[parameter]}, preview_days)
+        if len(df) < 2 or not df[parameter].notna().any():
+            return b''
+        return create_mini_chart(df, parameter, PREVIEW_COLORS[parameter])
+
+    return chart_response(key, render)
+
+def period_window(ref_date: date, time_period: str) -> Tuple[datetime, datetime]:
+    """
+    Calculate the inclusive datetime bounds of a time period.
+
+    Args:
+        ref_date: Last day of the period
+        time_period: Time period ('week', 'month', 'quarter')
+
+    Returns:
+        Tuple of (start of the first day, end of ref_date)
+    """
+    period_days = int(PERIOD_CONFIG.get(time_period, PERIOD_CONFIG['month'])['days'])
+    start_date = datetime.combine(ref_date - timedelta(days=period_days-1), datetime.min.time())
+    end_date = datetime.combine(ref_date, datetime.max.time())
+    return start_date, end_date
+
+def format_period_text(start_date: datetime, end_date: datetime) -> str:
+    """
+    Format a period's bounds for display, e.g. "Mar 01 - Mar 30, 2024".
+
+    Args:
+        start_date: Start of the period
+        end_date: End of the period
+
+    Returns:
+        Human readable period text
+    """
+    return f"{start_date.strftime('%b %d')} - {end_date.strftime('%b %d, %Y')}"
+
+def chart_render_mode() -> str:
+    """
+    Decide whether charts are drawn in the browser or on the server.
+
+    A ``render`` query argument ('client' or 'server') overrides the
+    CHART_RENDER_MODE setting, so the server-rendered PNGs remain
+    available as a fallback.
+
+    Returns:
+        'client' or 'server'
+    """
+    mode = request.args.get('render') or current_app.config.get('CHART_RENDER_MODE', 'client')
+    return mode if mode in ('client', 'server') else 'server'
+
+def render_graph(df: pd.DataFrame, parameter: str, title: str) -> bytes:
+    """
+    Draw the graph for the specified health parameter.
+
+    Args:
+        df: Pandas DataFrame containing filtered health data
+        parameter: Health parameter to visualize
+        title: Graph title
+
+    Returns:
+        PNG image bytes
+    """
+    style = GRAPH_STYLES[parameter]
+    return chart_renderer.render(ChartSpec(
+        series=tuple(
+            SeriesSpec.from_frame(df, column, color, label, 'bar' if style['kind'] == 'bar' else 'points')
+            for column, color, label in style['series']
+        ),
+        figsize=(10, 6),
+        title=title,
+        xlabel='Date',
+        ylabel=style['ylabel'],
+        legend=len(style['series']) > 1,
+        rotate_dates=True
+    ))
+
+def calculate_graph_stats(df: pd.DataFrame, parameter: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Calculate summary statistics for the specified health parameter.
+
+    Args:
+        df: Pandas DataFrame containing filtered health data
+        parameter: Health parameter to summarize
+
+    Returns:
+        Dictionary of calculated statistics
+
+    Raises:
+        ValueError: If parameter is invalid or no data is available
+    """
+    if df.empty:
+        raise ValueError(f"No data available for {parameter}")
+
+    return graph_stats(summarize_window(df, list(PARAMETER_COLUMNS[parameter])), parameter)
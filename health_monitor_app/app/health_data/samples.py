@@ -0,0 +1,444 @@
+"""
+High-frequency sample store for the Health Monitor application.
+
+Wearables report metrics such as heart rate every minute or faster. Kept
+as HealthData rows, every sample would be a wide, mostly NULL row with
+its own index entries, so samples are stored in SampleChunk instead: one
+row per user, metric and day holding that day's sample times and values
+as integer arrays. Each array is delta-encoded, turning regular intervals
+and slowly changing values into runs of small repeated numbers, packed
+into the narrowest integer type that holds them and zlib-compressed.
+
+``append_samples`` merges new samples into their chunks, ``read_samples``
+decodes the chunks overlapping a range and ``downsample`` aggregates a
+range into fixed buckets for plotting. Buckets of whole days take fully
+covered chunks from their stored aggregates without decoding them.
+"""
+
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import Insert, insert as sqlite_insert
+
+from ..extensions import db
+from ..models import SampleChunk, UserDataVersion, execute_upsert
+from .importer import IMPORT_FIELDS
+from .queries import PARAMETER_COLUMNS, SeriesArrays, fetch_graph_window
+
+
+class SampleMetric(NamedTuple):
+    """How the samples of one metric are stored and downsampled."""
+    # Values are stored as round(value * scale)
+    scale: int
+    # 'mean' or 'sum' of the samples in a downsampled bucket
+    aggregate: str
+
+
+# Metrics that can be sampled, keyed by the name used in SampleChunk.metric
+# and in DataFrames (matching the graph parameter where there is one)
+SAMPLE_METRICS: Dict[str, SampleMetric] = {
+    'heart_rate': SampleMetric(1, 'mean'),
+    'steps': SampleMetric(1, 'sum'),
+    'oxygen_saturation': SampleMetric(10, 'mean')
+}
+
+# Length of a chunk; chunks start at midnight
+CHUNK_SECONDS = 86400
+
+# Integer types tried for a delta array, narrowest first; the index of the
+# one used is the first byte of the encoded array
+DELTA_TYPES = tuple(np.dtype(code) for code in ('<i1', '<i2', '<i4', '<i8'))
+
+
+def encode_deltas(values: np.ndarray) -> bytes:
+    """
+    Delta-encode and compress an integer array.
+
+    Args:
+        values: One-dimensional integer array
+
+    Returns:
+        Encoded bytes, decoded by decode_deltas
+    """
+    deltas = np.diff(np.asarray(values, dtype=np.int64), prepend=0)
+    low, high = (int(deltas.min()), int(deltas.max())) if len(deltas) else (0, 0)
+    code = next(i for i, dtype in enumerate(DELTA_TYPES)
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max)
+    return bytes([code]) + zlib.compress(deltas.astype(DELTA_TYPES[code]).tobytes())
+
+
+def decode_deltas(data: bytes) -> np.ndarray:
+    """
+    Decode an array encoded by encode_deltas.
+
+    Args:
+        data: Encoded bytes
+
+    Returns:
+        int64 array
+    """
+    deltas = np.frombuffer(zlib.decompress(data[1:]), dtype=DELTA_TYPES[data[0]])
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+def sample_bounds(metric: str) -> Tuple[float, float]:
+    """
+    Return the range a metric's sample values must lie in.
+
+    The same range HealthDataForm, and so the importer, accepts for the
+    metric's HealthData column.
+
+    Args:
+        metric: Name of the metric (a key of SAMPLE_METRICS)
+
+    Returns:
+        (minimum, maximum), inclusive
+    """
+    _metric(metric)
+    field = IMPORT_FIELDS[metric]
+    return field.minimum, field.maximum
+
+
+def append_samples(user_id: int, metric: str, times: Any, values: Any) -> int:
+    """
+    Store samples of a metric, merging them into their day chunks.
+
+    Runs in the current transaction without committing. Times are kept
+    to the second; a sample at the same second as a stored one replaces
+    it, so sending a batch again changes nothing.
+
+    Args:
+        user_id: ID of the user the samples belong to
+        metric: Name of the metric (a key of SAMPLE_METRICS)
+        times: Sample times as datetime64 values or datetimes
+        values: Sample values; samples with a NaN value are skipped
+
+    Returns:
+        Number of samples stored
+
+    Raises:
+        ValueError: If the metric is unknown, times and values do not
+            match, or a value is infinite or outside sample_bounds()
+    """
+    spec = _metric(metric)
+    times = np.asarray(times, dtype='datetime64[s]')
+    values = np.asarray(values, dtype=np.float64)
+    if times.ndim != 1 or times.shape != values.shape:
+        raise ValueError('Sample times and values must be flat arrays of the same length.')
+    keep = ~np.isnat(times) & ~np.isnan(values)
+    kept = values[keep]
+    minimum, maximum = sample_bounds(metric)
+    # Also rejects infinities, which would overflow the integer encoding
+    if ((kept < minimum) | (kept > maximum)).any():
+        raise ValueError(f'Sample values must be between {minimum:g} and {maximum:g}.')
+    seconds = times[keep].astype(np.int64)
+    scaled = np.round(kept * spec.scale).astype(np.int64)
+    if not len(seconds):
+        return 0
+
+    order = np.argsort(seconds, kind='stable')
+    seconds, scaled = seconds[order], scaled[order]
+    days = seconds - seconds % CHUNK_SECONDS
+    first, last = _datetime(days[0]), _datetime(days[-1])
+    stored = {
+        _epoch(chunk_start): (times, values)
+        for chunk_start, times, values in db.session.execute(
+            select(SampleChunk.start, SampleChunk.times, SampleChunk.values).where(
+                SampleChunk.user_id == user_id,
+                SampleChunk.metric == metric,
+                SampleChunk.start >= first,
+                SampleChunk.start <= last
+            )
+        )
+    }
+
+    rows = []
+    bounds = np.flatnonzero(np.diff(days)) + 1
+    for day_seconds, day_scaled in zip(np.split(seconds, bounds), np.split(scaled, bounds)):
+        day = int(day_seconds[0] - day_seconds[0] % CHUNK_SECONDS)
+        offsets = day_seconds - day
+        if day in stored:
+            # Stored samples go first, so the stable sort below keeps the
+            # new sample last among those at the same second
+            stored_times, stored_values = stored[day]
+            offsets = np.concatenate([decode_deltas(stored_times), offsets])
+            day_scaled = np.concatenate([decode_deltas(stored_values), day_scaled])
+        order = np.argsort(offsets, kind='stable')
+        offsets, day_scaled = offsets[order], day_scaled[order]
+        latest = np.append(offsets[1:] != offsets[:-1], True)
+        offsets, day_scaled = offsets[latest], day_scaled[latest]
+        rows.append({
+            'user_id': user_id,
+            'metric': metric,
+            'start': _datetime(day),
+            'count': len(offsets),
+            'total': float(day_scaled.sum()) / spec.scale,
+            'minimum': float(day_scaled.min()) / spec.scale,
+            'maximum': float(day_scaled.max()) / spec.scale,
+            'times': encode_deltas(offsets),
+            'values': encode_deltas(day_scaled)
+        })
+    execute_upsert(_chunk_statement, rows)
+    UserDataVersion.bump(user_id)
+    return len(seconds)
+
+
+def _chunk_statement() -> Insert:
+    table = SampleChunk.__table__
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.metric, table.c.start],
+        set_={name: stmt.excluded[name]
+              for name in ('count', 'total', 'minimum', 'maximum', 'times', 'values')}
+    )
+
+
+def has_samples(user_id: int, metric: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> bool:
+    """
+    Check whether a user has samples of a metric, optionally on the days of a range.
+
+    Args:
+        user_id: ID of the user to check
+        metric: Name of the metric
+        start: Start of the range (None for any time)
+        end: End of the range (None for any time)
+
+    Returns:
+        True if a chunk exists (overlapping the range), False otherwise
+    """
+    query = db.session.query(SampleChunk.start).filter(
+        SampleChunk.user_id == user_id,
+        SampleChunk.metric == metric
+    )
+    if start is not None:
+        query = query.filter(SampleChunk.start >= _day_start(start), SampleChunk.start <= end)
+    return query.first() is not None
+
+
+def read_samples(user_id: int, metric: str, start: datetime, end: datetime) -> SeriesArrays:
+    """
+    Load a user's samples of a metric within a time range.
+
+    Args:
+        user_id: ID of the user whose samples to load
+        metric: Name of the metric (a key of SAMPLE_METRICS)
+        start: Inclusive start of the range
+        end: Inclusive end of the range
+
+    Returns:
+        SeriesArrays ordered by time, with the values under the metric's name
+
+    Raises:
+        ValueError: If the metric is unknown
+    """
+    spec = _metric(metric)
+    low, high = _epoch(start), _epoch(end)
+    seconds: List[np.ndarray] = []
+    values: List[np.ndarray] = []
+    for chunk_start, chunk_times, chunk_values in _chunks(user_id, metric, start, end,
+                                                          SampleChunk.times, SampleChunk.values):
+        chunk_seconds = _epoch(chunk_start) + decode_deltas(chunk_times)
+        inside = (chunk_seconds >= low) & (chunk_seconds <= high)
+        seconds.append(chunk_seconds[inside])
+        values.append(decode_deltas(chunk_values)[inside] / spec.scale)
+
+    if not seconds:
+        return SeriesArrays(np.empty(0, dtype='datetime64[ns]'), {metric: np.empty(0)})
+    return SeriesArrays(
+        np.concatenate(seconds).astype('datetime64[s]').astype('datetime64[ns]'),
+        {metric: np.concatenate(values)}
+    )
+
+
+def downsample(user_id: int, metric: str, start: datetime, end: datetime,
+               bucket: timedelta) -> pd.DataFrame:
+    """
+    Aggregate a user's samples of a metric into fixed time buckets.
+
+    Buckets are aligned to the Unix epoch, so whole-day buckets start at
+    midnight, and only buckets with samples are returned.
+
+    Args:
+        user_id: ID of the user whose samples to load
+        metric: Name of the metric (a key of SAMPLE_METRICS)
+        start: Inclusive start of the range
+        end: Inclusive end of the range
+        bucket: Bucket width, at least a second
+
+    Returns:
+        DataFrame with a ``date`` column (bucket start), the metric's bucket
+        mean or sum (per SAMPLE_METRICS) under its name and ``<metric>_count``,
+        ``<metric>_total``, ``<metric>_min`` and ``<metric>_max`` columns,
+        as returned by ``fetch_rollup_series``, ordered by date ascending
+
+    Raises:
+        ValueError: If the metric is unknown or the bucket is too narrow
+    """
+    spec = _metric(metric)
+    width = int(bucket.total_seconds())
+    if width < 1:
+        raise ValueError('Bucket width must be at least one second.')
+    low, high = _epoch(start), _epoch(end)
+    whole_days = width % CHUNK_SECONDS == 0
+
+    # Partial aggregates (time, count, total, min, max) in time order: a
+    # single sample each, or a whole chunk that falls in a single bucket
+    parts: List[Tuple[np.ndarray, ...]] = []
+    for chunk_start, *aggregates, chunk_times, chunk_values in _chunks(
+            user_id, metric, start, end, SampleChunk.count, SampleChunk.total, SampleChunk.minimum,
+            SampleChunk.maximum, SampleChunk.times, SampleChunk.values):
+        chunk_start = _epoch(chunk_start)
+        if whole_days and low <= chunk_start and chunk_start + CHUNK_SECONDS - 1 <= high:
+            parts.append(tuple(np.array([value], dtype=np.float64) for value in (chunk_start, *aggregates)))
+            continue
+        chunk_seconds = chunk_start + decode_deltas(chunk_times)
+        inside = (chunk_seconds >= low) & (chunk_seconds <= high)
+        chunk_values = decode_deltas(chunk_values)[inside] / spec.scale
+        parts.append((chunk_seconds[inside].astype(np.float64), np.ones(len(chunk_values)),
+                      chunk_values, chunk_values, chunk_values))
+
+    seconds, counts, totals, minima, maxima = (
+        np.concatenate([part[i] for part in parts]) if parts else np.empty(0) for i in range(5)
+    )
+    keys = (seconds // width).astype(np.int64)
+    if len(keys):
+        # Parts are in time order, so each bucket is a run of equal keys
+        firsts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+        keys = keys[firsts]
+        counts, totals = np.add.reduceat(counts, firsts), np.add.reduceat(totals, firsts)
+        minima, maxima = np.minimum.reduceat(minima, firsts), np.maximum.reduceat(maxima, firsts)
+
+    return pd.DataFrame({
+        'date': (keys * width).astype('datetime64[s]').astype('datetime64[ns]'),
+        metric: totals / counts if spec.aggregate == 'mean' else totals,
+        f'{metric}_count': counts,
+        f'{metric}_total': totals,
+        f'{metric}_min': minima,
+        f'{metric}_max': maxima
+    })
+
+
+def graph_bucket(start: datetime, end: datetime, points: int) -> timedelta:
+    """
+    Choose a bucket width that plots a range in at most the given points.
+
+    Args:
+        start: Start of the range
+        end: End of the range
+        points: Most buckets wanted
+
+    Returns:
+        Bucket width, a whole number of minutes
+    """
+    minutes = -(-(end - start).total_seconds() // (60 * max(points, 1)))
+    return timedelta(minutes=max(1, int(minutes)))
+
+
+def fetch_graph_series(user_id: int, parameter: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Load a graph's data, including the user's samples of the parameter.
+
+    The parameter's records are read with ``fetch_graph_window``. If the
+    parameter can be sampled and the user has samples on the days of the
+    window, they are merged in: metrics averaged per bucket as buckets of
+    at most SAMPLE_GRAPH_POINTS across the window, summed metrics (steps)
+    as one total per day, counted as a single reading like a logged daily
+    step count. Rows at the same time are combined, so the count, total,
+    minimum and maximum columns still cover every reading and
+    ``summarize_rollups`` averages the right things.
+
+    Args:
+        user_id: ID of the user whose data to load
+        parameter: Graph parameter (a key of PARAMETER_COLUMNS)
+        start: Inclusive start of the window
+        end: Inclusive end of the window
+
+    Returns:
+        DataFrame as returned by ``fetch_graph_window``, or with samples as
+        returned by ``downsample``
+    """
+    records = fetch_graph_window(user_id, PARAMETER_COLUMNS[parameter], start, end)
+    if parameter not in SAMPLE_METRICS or not has_samples(user_id, parameter, start, end):
+        return records
+    if SAMPLE_METRICS[parameter].aggregate == 'sum':
+        samples = _daily_totals(user_id, parameter, start, end)
+    else:
+        points = current_app.config.get('SAMPLE_GRAPH_POINTS', 720)
+        samples = downsample(user_id, parameter, start, end, graph_bucket(start, end, points))
+    return _merge_series(_aggregates(records, parameter), samples, parameter)
+
+
+def _daily_totals(user_id: int, metric: str, start: datetime, end: datetime) -> pd.DataFrame:
+    # Each day's total as a single reading
+    df = downsample(user_id, metric, start, end, timedelta(days=1))
+    totals = df[metric]
+    return df.assign(**{f'{metric}_count': 1.0, f'{metric}_total': totals,
+                        f'{metric}_min': totals, f'{metric}_max': totals})
+
+
+def _aggregates(df: pd.DataFrame, metric: str) -> pd.DataFrame:
+    # Raw records (GRAPH_RESOLUTION 'raw') as single-reading aggregates;
+    # rollup frames already have them
+    if f'{metric}_count' in df.columns:
+        return df
+    values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.DataFrame({
+        'date': df['date'],
+        metric: values,
+        f'{metric}_count': np.where(np.isnan(values), np.nan, 1.0),
+        f'{metric}_total': values,
+        f'{metric}_min': values,
+        f'{metric}_max': values
+    })
+
+
+def _merge_series(records: pd.DataFrame, samples: pd.DataFrame, metric: str) -> pd.DataFrame:
+    # Combine the aggregates of rows at the same time and recompute the means
+    grouped = pd.concat([records, samples], ignore_index=True).groupby('date', sort=True)
+    count, total = f'{metric}_count', f'{metric}_total'
+    merged = pd.DataFrame({
+        count: grouped[count].sum(min_count=1),
+        total: grouped[total].sum(min_count=1),
+        f'{metric}_min': grouped[f'{metric}_min'].min(),
+        f'{metric}_max': grouped[f'{metric}_max'].max()
+    }).reset_index()
+    merged.insert(1, metric, merged[total] / merged[count])
+    return merged
+
+
+def _metric(metric: str) -> SampleMetric:
+    if metric not in SAMPLE_METRICS:
+        raise ValueError(f'Unknown sample metric: {metric}')
+    return SAMPLE_METRICS[metric]
+
+
+def _chunks(user_id: int, metric: str, start: datetime, end: datetime, *columns: Any) -> List[Any]:
+    # Chunks overlapping the range, oldest first, as a range scan of the
+    # primary key
+    return db.session.execute(
+        select(SampleChunk.start, *columns).where(
+            SampleChunk.user_id == user_id,
+            SampleChunk.metric == metric,
+            SampleChunk.start >= _day_start(start),
+            SampleChunk.start <= end
+        ).order_by(SampleChunk.start)
+    ).all()
+
+
+def _day_start(moment: datetime) -> datetime:
+    return datetime.combine(moment.date(), datetime.min.time())
+
+
+def _epoch(moment: datetime) -> int:
+    # Whole seconds since the epoch of a naive datetime, like datetime64
+    return int(np.datetime64(moment, 's').astype(np.int64))
+
+
+def _datetime(seconds: int) -> datetime:
+    return np.datetime64(int(seconds), 's').astype(datetime)
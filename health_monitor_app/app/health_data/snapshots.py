@@ -0,0 +1,171 @@
+"""
+Per-user latest-value snapshots for the Health Monitor application.
+
+``UserLatestSnapshot`` holds the latest non-null value of each metric,
+the record count and the date of the newest record, so the dashboard
+needs one lookup instead of a count and an ``ORDER BY date DESC LIMIT 1``
+query per metric. An added record, or an imported batch, is folded in
+with a single upsert that only replaces values older than it; edits and
+deletes recompute the row from HealthData with one statement served by
+the ``(user_id, date)`` index.
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, func, literal, or_, select
+from sqlalchemy.dialects.sqlite import Insert, insert as sqlite_insert
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ColumnElement
+
+from ..extensions import db
+from ..models import HealthData, User, UserDataVersion, UserLatestSnapshot, execute_upsert
+
+# HealthData columns whose latest value is kept in the snapshot
+SNAPSHOT_COLUMNS = (
+    'weight', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'steps',
+    'sleep_duration', 'water_intake', 'calorie_intake', 'stress_level'
+)
+
+
+def add_record(record: HealthData) -> None:
+    """
+    Fold a newly inserted record into its user's snapshot.
+
+    Args:
+        record: Flushed HealthData record
+    """
+    values = {'user_id': record.user_id, 'record_count': 1, 'last_recorded_at': record.date}
+    for name in SNAPSHOT_COLUMNS:
+        value = getattr(record, name)
+        values[name] = value
+        values[f'{name}_at'] = record.date if value is not None else None
+    _fold(values)
+
+
+def add_records(user_id: int, dates: np.ndarray, columns: Mapping[str, np.ndarray]) -> None:
+    """
+    Fold a batch of newly inserted records into their user's snapshot.
+
+    Args:
+        user_id: ID of the user the records belong to
+        dates: Record dates as a datetime64 array
+        columns: Float arrays of the records' values keyed by HealthData
+            column name, NaN where a value is missing
+    """
+    if not len(dates):
+        return
+    values = {'user_id': user_id, 'record_count': len(dates), 'last_recorded_at': dates.max().item()}
+    for name in SNAPSHOT_COLUMNS:
+        values[name] = values[f'{name}_at'] = None
+        present = np.flatnonzero(~np.isnan(columns[name])) if name in columns else []
+        if len(present):
+            latest = present[np.argmax(dates[present])]
+            values[name] = HealthData.__table__.c[name].type.python_type(columns[name][latest])
+            values[f'{name}_at'] = dates[latest].item()
+    _fold(values)
+
+
+def refresh(user_id: int) -> None:
+    """
+    Recompute a user's snapshot from their records.
+
+    Used after an edit or delete, once the change has been flushed.
+
+    Args:
+        user_id: ID of the user whose records changed
+    """
+    _replace(select(*_snapshot_columns(literal(user_id))))
+
+
+def rebuild(user_id: Optional[int] = None) -> int:
+    """
+    Recompute the snapshots of all users, or of one user.
+
+    Args:
+        user_id: Only rebuild this user's snapshot (all users if None)
+
+    Returns:
+        Number of snapshots written
+    """
+    query = select(*_snapshot_columns(User.id))
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    return _replace(query)
+
+
+def fetch_snapshot(user_id: int) -> Tuple[UserLatestSnapshot, int]:
+    """
+    Load a user's snapshot together with their data version.
+
+    A missing snapshot (a user whose data predates the table) is built
+    and committed on first access.
+
+    Args:
+        user_id: ID of the user
+
+    Returns:
+        Tuple of (snapshot, data version)
+    """
+    query = db.session.query(UserLatestSnapshot, UserDataVersion.version)\
+        .outerjoin(UserDataVersion, UserDataVersion.user_id == UserLatestSnapshot.user_id)\
+        .filter(UserLatestSnapshot.user_id == user_id)
+    row = query.first()
+    if row is None:
+        refresh(user_id)
+        db.session.commit()
+        row = query.one()
+    snapshot, version = row
+    return snapshot, version or 0
+
+
+def _fold(values: Dict[str, Any]) -> None:
+    execute_upsert(_fold_statement, [values])
+
+
+def _fold_statement() -> Insert:
+    # Upsert that adds to the record count and only replaces older values
+    table = UserLatestSnapshot.__table__
+    stmt = sqlite_insert(table)
+    new = stmt.excluded
+    set_ = {
+        'record_count': table.c.record_count + new.record_count,
+        'last_recorded_at': case(
+            (_is_newer(new.last_recorded_at, table.c.last_recorded_at), new.last_recorded_at),
+            else_=table.c.last_recorded_at
+        )
+    }
+    for name in SNAPSHOT_COLUMNS:
+        # SET expressions all see the old row, so each pair switches together
+        newer = _is_newer(new[f'{name}_at'], table.c[f'{name}_at'])
+        set_[name] = case((newer, new[name]), else_=table.c[name])
+        set_[f'{name}_at'] = case((newer, new[f'{name}_at']), else_=table.c[f'{name}_at'])
+    return stmt.on_conflict_do_update(index_elements=[table.c.user_id], set_=set_)
+
+
+def _is_newer(candidate: ColumnElement, current: ColumnElement) -> ColumnElement:
+    return and_(candidate.isnot(None), or_(current.is_(None), candidate >= current))
+
+
+def _snapshot_columns(user_id: ColumnElement) -> List[ColumnElement]:
+    # Correlated scalar subqueries, each a short backwards scan of the
+    # (user_id, date) index, labelled with the snapshot column they fill
+    mine = HealthData.user_id == user_id
+    columns = [
+        user_id.label('user_id'),
+        select(func.count(HealthData.id)).where(mine).scalar_subquery().label('record_count'),
+        select(func.max(HealthData.date)).where(mine).scalar_subquery().label('last_recorded_at')
+    ]
+    for name in SNAPSHOT_COLUMNS:
+        column = getattr(HealthData, name)
+        latest = select(column).where(mine, column.isnot(None)).order_by(HealthData.date.desc()).limit(1)
+        columns.append(latest.scalar_subquery().label(name))
+        columns.append(latest.with_only_columns(HealthData.date).scalar_subquery().label(f'{name}_at'))
+    return columns
+
+
+def _replace(query: Select) -> int:
+    table = UserLatestSnapshot.__table__
+    names = [column.name for column in query.selected_columns]
+    result = db.session.execute(table.insert().prefix_with('OR REPLACE').from_select(names, query))
+    return result.rowcount
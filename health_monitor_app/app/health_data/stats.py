@@ -0,0 +1,305 @@
+"""
+Summary statistics for health data in the Health Monitor application.
+
+All metrics are summarized together: the selected columns are packed
+into one float64 matrix (NaN for missing values) and every statistic is
+a single NaN-aware NumPy reduction over its rows. The result is a plain
+structure that graphs, the dashboard and the JSON API can share, with
+display formatting kept separate in ``graph_stats``.
+"""
+
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Number of most recent values a trend slope is fitted to
+TREND_POINTS = 3
+
+# Minimum slope per point for a trend to count as 'up' or 'down'. A point
+# is a reading, or a daily (weekly) mean where the data comes from the
+# rollups, as it does for graphs at GRAPH_RESOLUTION 'day'
+TREND_THRESHOLDS: Dict[str, float] = {
+    'weight': 0.1,
+    'systolic': 1,
+    'diastolic': 1,
+    'heart_rate': 1,
+    'steps': 100,
+    'sleep_duration': 0.2,
+    'water_intake': 0.1,
+    'calorie_intake': 50,
+    'stress_level': 0.5
+}
+
+# Display precision per column: (digits for the mean, digits for
+# min/max/latest), where None shows a whole number
+DISPLAY_PRECISION: Dict[str, Tuple[Optional[int], Optional[int]]] = {
+    'weight': (1, 1),
+    'heart_rate': (None, None),
+    'steps': (None, None),
+    'sleep_duration': (1, 1),
+    'water_intake': (1, 1),
+    'calorie_intake': (None, None),
+    'stress_level': (1, None)
+}
+
+
+@dataclass(frozen=True)
+class MetricSummary:
+    """
+    Summary statistics of one metric over a window.
+
+    Attributes:
+        count: Number of recorded (non-missing) values
+        mean: Average value, None if there are no values
+        minimum: Smallest value, None if there are no values
+        maximum: Largest value, None if there are no values
+        latest: Most recent recorded value, None if there are no values
+        slope: Least-squares slope per reading over the last TREND_POINTS
+            values, None if there are fewer values than that
+        trend: 'up', 'down' or 'neutral'
+    """
+    count: int
+    mean: Optional[float]
+    minimum: Optional[float]
+    maximum: Optional[float]
+    latest: Optional[float]
+    slope: Optional[float]
+    trend: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the summary as a JSON-serializable dictionary."""
+        return asdict(self)
+
+
+def summarize(values: np.ndarray, columns: Sequence[str],
+              trend_points: int = TREND_POINTS) -> Dict[str, MetricSummary]:
+    """
+    Summarize every column of a value matrix in one pass.
+
+    Args:
+        values: Array of shape (rows, len(columns)) ordered oldest first,
+            with NaN for missing values
+        columns: Metric name of each column
+        trend_points: Number of most recent values to fit trends to
+
+    Returns:
+        Dictionary of metric name to MetricSummary
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(-1, len(columns))
+    valid = ~np.isnan(values)
+    count = np.count_nonzero(valid, axis=0)
+    has_values = count > 0
+
+    # NaN-aware reductions that skip missing values without copying the data
+    total = np.add.reduce(values, axis=0, where=valid, initial=0.0)
+    mean = np.divide(total, count, out=np.full(len(columns), np.nan), where=has_values)
+    minimum = np.fmin.reduce(values, axis=0, initial=np.inf)
+    maximum = np.fmax.reduce(values, axis=0, initial=-np.inf)
+
+    latest, slope = _recent(values, valid, count, trend_points)
+    has_trend = count >= trend_points
+
+    summaries: Dict[str, MetricSummary] = {}
+    for i, column in enumerate(columns):
+        if not has_values[i]:
+            summaries[column] = MetricSummary(0, None, None, None, None, None, 'neutral')
+            continue
+        column_slope = float(slope[i]) if has_trend[i] else None
+        summaries[column] = MetricSummary(
+            count=int(count[i]),
+            mean=float(mean[i]),
+            minimum=float(minimum[i]),
+            maximum=float(maximum[i]),
+            latest=float(latest[i]),
+            slope=column_slope,
+            trend=trend_direction(column_slope, TREND_THRESHOLDS.get(column, 0.1))
+        )
+    return summaries
+
+
+def _recent(values: np.ndarray, valid: np.ndarray, count: np.ndarray,
+            trend_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Latest value and trend slope per column, looking only at trailing rows."""
+    # Grow a trailing block until it holds enough recent values of every column
+    wanted = np.minimum(count, max(trend_points, 1))
+    tail = min(len(values), 4 * max(trend_points, 1))
+    while tail < len(values) and (np.count_nonzero(valid[-tail:], axis=0) < wanted).any():
+        tail = min(len(values), tail * 4)
+    n_columns = values.shape[1]
+    if tail == 0:
+        return np.full(n_columns, np.nan), np.zeros(n_columns)
+    newest_first = values[len(values) - tail:][::-1]
+    newest_valid = valid[len(values) - tail:][::-1]
+
+    # Rank each value by recency among its column's valid values (1 = latest)
+    recency = np.cumsum(newest_valid, axis=0)
+    latest = newest_first[np.argmax(newest_valid, axis=0), np.arange(n_columns)]
+
+    # Least-squares slope over the last trend_points values: x runs from 0
+    # (oldest) to trend_points - 1 (latest), so sum((x - x_mean)^2) is fixed
+    if trend_points < 2:
+        return latest, np.zeros(n_columns)
+    in_window = newest_valid & (recency <= trend_points)
+    x_centered = (trend_points - recency) - (trend_points - 1) / 2
+    covariance = np.add.reduce(x_centered * newest_first, axis=0, where=in_window, initial=0.0)
+    return latest, covariance / (trend_points * (trend_points ** 2 - 1) / 12)
+
+
+def summarize_frame(df: pd.DataFrame, columns: Optional[Sequence[str]] = None,
+                    trend_points: int = TREND_POINTS) -> Dict[str, MetricSummary]:
+    """
+    Summarize the metric columns of a DataFrame ordered by date.
+
+    Args:
+        df: DataFrame ordered oldest first
+        columns: Columns to summarize (all but ``date`` if omitted)
+        trend_points: Number of most recent values to fit trends to
+
+    Returns:
+        Dictionary of column name to MetricSummary
+    """
+    if columns is None:
+        columns = [column for column in df.columns if column != 'date']
+    return summarize(_matrix(df, columns), columns, trend_points)
+
+
+def summarize_rollups(df: pd.DataFrame, columns: Sequence[str],
+                      trend_points: int = TREND_POINTS) -> Dict[str, MetricSummary]:
+    """
+    Summarize per-bucket aggregates as returned by ``fetch_rollup_series``.
+
+    Count, mean, minimum and maximum cover every underlying record; the
+    latest value and trend are taken from the bucket means, so the slope
+    is per day (or week) rather than per reading.
+
+    Args:
+        df: Rollup DataFrame ordered oldest first
+        columns: Metrics to summarize
+        trend_points: Number of most recent buckets to fit trends to
+
+    Returns:
+        Dictionary of metric name to MetricSummary
+    """
+    summaries = summarize(_matrix(df, columns), columns, trend_points)
+    counts = np.nan_to_num(_matrix(df, [f'{column}_count' for column in columns])).sum(axis=0)
+    totals = np.nansum(_matrix(df, [f'{column}_total' for column in columns]), axis=0)
+    minimum = np.fmin.reduce(_matrix(df, [f'{column}_min' for column in columns]), axis=0, initial=np.inf)
+    maximum = np.fmax.reduce(_matrix(df, [f'{column}_max' for column in columns]), axis=0, initial=-np.inf)
+
+    for i, column in enumerate(columns):
+        if counts[i]:
+            summaries[column] = replace(
+                summaries[column],
+                count=int(counts[i]),
+                mean=float(totals[i] / counts[i]),
+                minimum=float(minimum[i]),
+                maximum=float(maximum[i])
+            )
+    return summaries
+
+
+def summarize_window(df: pd.DataFrame, columns: Sequence[str]) -> Dict[str, MetricSummary]:
+    """
+    Summarize a window loaded either as raw records or as rollups.
+
+    Args:
+        df: Result of ``fetch_window`` or ``fetch_rollup_series``
+        columns: Metrics to summarize
+
+    Returns:
+        Dictionary of metric name to MetricSummary
+    """
+    if all(f'{column}_count' in df.columns for column in columns):
+        return summarize_rollups(df, columns)
+    return summarize_frame(df, columns)
+
+
+def _matrix(df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+    # Fill column by column into a column-major matrix: each column is one
+    # contiguous copy, much cheaper than converting the frame as a whole
+    values = np.empty((len(df), len(columns)), dtype=np.float64, order='F')
+    for i, column in enumerate(columns):
+        series = pd.to_numeric(df[column])
+        if series.dtype == np.float64:
+            values[:, i] = series.to_numpy()
+        else:
+            values[:, i] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return values
+
+
+def trend_direction(slope: Optional[float], threshold: float) -> str:
+    """
+    Classify a trend slope.
+
+    Args:
+        slope: Slope per reading, or None if there is too little data
+        threshold: Minimum absolute slope for a significant trend
+
+    Returns:
+        'up', 'down', or 'neutral' depending on trend direction
+    """
+    if slope is None:
+        return 'neutral'
+    if slope > threshold:
+        return 'up'
+    if slope < -threshold:
+        return 'down'
+    return 'neutral'
+
+
+def _display(value: float, digits: Optional[int]) -> Any:
+    # Whole-number metrics are recorded as integers, but read from the
+    # rollups the latest value is a daily mean (72.8 bpm shows as 73)
+    return round(value, digits) if digits is not None else round(value)
+
+
+def graph_stats(summaries: Dict[str, MetricSummary], parameter: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Format a parameter's summary for the graph page.
+
+    Blood pressure is shown as rounded "systolic/diastolic" pairs with the
+    trend of the systolic reading; other parameters use DISPLAY_PRECISION.
+
+    Args:
+        summaries: Result of summarize() or summarize_frame()
+        parameter: Health parameter to format
+
+    Returns:
+        Dictionary with 'averages', 'minimums', 'maximums', 'latest' and
+        'trends', each keyed by parameter
+
+    Raises:
+        ValueError: If the parameter has no recorded values
+    """
+    stats: Dict[str, Dict[str, Any]] = {
+        'averages': {},
+        'minimums': {},
+        'maximums': {},
+        'latest': {},
+        'trends': {}
+    }
+
+    if parameter == 'blood_pressure':
+        systolic, diastolic = summaries.get('systolic'), summaries.get('diastolic')
+        if not systolic or not diastolic or not systolic.count or not diastolic.count:
+            raise ValueError(f'No data available for {parameter} or parameter is invalid.')
+        stats['averages'][parameter] = f"{round(systolic.mean)}/{round(diastolic.mean)}"
+        stats['minimums'][parameter] = f"{round(systolic.minimum)}/{round(diastolic.minimum)}"
+        stats['maximums'][parameter] = f"{round(systolic.maximum)}/{round(diastolic.maximum)}"
+        stats['latest'][parameter] = f"{round(systolic.latest)}/{round(diastolic.latest)}"
+        stats['trends'][parameter] = systolic.trend
+        return stats
+
+    summary = summaries.get(parameter)
+    if parameter not in DISPLAY_PRECISION or not summary or not summary.count:
+        raise ValueError(f'No data available for {parameter} or parameter is invalid.')
+
+    mean_digits, value_digits = DISPLAY_PRECISION[parameter]
+    stats['averages'][parameter] = round(summary.mean, mean_digits)
+    stats['minimums'][parameter] = _display(summary.minimum, value_digits)
+    stats['maximums'][parameter] = _display(summary.maximum, value_digits)
+    stats['latest'][parameter] = _display(summary.latest, value_digits)
+    stats['trends'][parameter] = summary.trend
+    return stats
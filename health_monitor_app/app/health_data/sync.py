@@ -0,0 +1,127 @@
+"""
+Delta sync of health data for mirroring clients.
+
+Every write stamps the records it changes with the user's new data
+version (``change_seq``), and deletes leave a ``HealthDataTombstone``
+stamped the same way, so a user's changes form one sequence. A client
+sends the opaque token from its last response and gets the changes after
+it in ``(change_seq, id)`` order, a page at a time: each page is a range
+scan of the ``(user_id, change_seq)`` indexes, and the token returned with
+it resumes after its last change. A record changed several times since
+the token is sent once, in its current state.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import and_, or_, select
+
+from ..extensions import db
+from ..models import HealthData, HealthDataTombstone
+from .writes import RECORD_COLUMNS
+
+# Position before every change, for clients without a token
+START = (-1, 0)
+
+
+class SyncPage(NamedTuple):
+    """One page of changes and the token to request the next one with."""
+    changes: List[Dict[str, Any]]
+    token: str
+    has_more: bool
+
+
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='sync-token')
+
+
+def encode_token(position: Tuple[int, int]) -> str:
+    """
+    Encode a position in a user's change sequence as an opaque token.
+
+    Args:
+        position: (change_seq, id) of the last change a client has seen
+
+    Returns:
+        URL-safe signed token string
+    """
+    return _serializer().dumps(list(position))
+
+
+def decode_token(token: Optional[str]) -> Tuple[int, int]:
+    """
+    Decode a token created by encode_token.
+
+    Args:
+        token: Token string from the request, may be None
+
+    Returns:
+        (change_seq, id) position, START if there is no token
+
+    Raises:
+        ValueError: If the token was tampered with or is malformed
+    """
+    if not token:
+        return START
+    try:
+        change_seq, record_id = _serializer().loads(token)
+        return int(change_seq), int(record_id)
+    except (BadSignature, ValueError, TypeError):
+        raise ValueError('Invalid sync token.')
+
+
+def fetch_changes(user_id: int, token: Optional[str], limit: int) -> SyncPage:
+    """
+    Fetch a page of a user's changes since a sync token.
+
+    Args:
+        user_id: ID of the user whose changes to return
+        token: Token from the previous page or sync, None for a full sync
+        limit: Maximum number of changes on the page
+
+    Returns:
+        SyncPage whose changes are upserts (the record's current values)
+        and deletes (the record's id and date), oldest first
+
+    Raises:
+        ValueError: If the token is invalid
+    """
+    position = decode_token(token)
+    records = _after(HealthData, HealthData.id, user_id, position, limit)
+    # A client starting from scratch has nothing to delete
+    deletes = _after(HealthDataTombstone, HealthDataTombstone.health_data_id, user_id, position, limit) \
+        if position != START else []
+
+    changes = sorted(
+        [(row.change_seq, row.id, _upsert(row)) for row in records]
+        + [(row.change_seq, row.health_data_id, _delete(row)) for row in deletes],
+        key=lambda change: change[:2]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        position = changes[-1][:2]
+    return SyncPage([change for _, _, change in changes], encode_token(position), has_more)
+
+
+def _after(model: Any, id_column: Any, user_id: int, position: Tuple[int, int], limit: int) -> List[Any]:
+    # Rows strictly after the position; the redundant change_seq bound keeps
+    # the scan on the (user_id, change_seq) index
+    change_seq, record_id = position
+    query = select(model.__table__).where(
+        model.user_id == user_id,
+        model.change_seq >= change_seq,
+        or_(model.change_seq > change_seq, and_(model.change_seq == change_seq, id_column > record_id))
+    ).order_by(model.change_seq, id_column).limit(limit + 1)
+    return db.session.execute(query).all()
+
+
+def _upsert(row: Any) -> Dict[str, Any]:
+    change = {'op': 'upsert', 'id': row.id, 'date': row.date.isoformat()}
+    change.update((name, getattr(row, name)) for name in RECORD_COLUMNS)
+    return change
+
+
+def _delete(row: Any) -> Dict[str, Any]:
+    return {'op': 'delete', 'id': row.health_data_id, 'date': row.date.isoformat()}
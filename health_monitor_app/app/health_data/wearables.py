@@ -0,0 +1,470 @@
+"""
+Streaming import of wearable exports for the Health Monitor application.
+
+Apple Health exports (``export.xml``, or the ``export.zip`` it comes in)
+and Fitbit data exports (``heart_rate-YYYY-MM-DD.json`` and similar
+files, or a zip of them) run to hundreds of megabytes and millions of
+readings. They are read as a stream: the XML with ``iterparse``, clearing
+every record once it has been read, and Fitbit's JSON arrays an item at
+a time, so memory does not grow with the file. Readings are collected in
+batches of READING_BATCH_SIZE, converted with NumPy and folded into
+running aggregates per day, column and source, which stay small however
+long the export is. Heart rate and oxygen saturation readings are also
+appended to the sample store batch by batch.
+
+Once the export has been read, each day becomes one health record, dated
+at midnight, with the day's mean heart rate, total steps, last weight and
+so on (see DAILY_COMBINE). The records go through the bulk importer's
+validation and upsert, so importing an export again replaces them with
+equal ones. A phone and a watch both count the same steps, so for sums
+the day's value is the total of the source that recorded the most.
+"""
+
+import codecs
+import json
+import re
+import zipfile
+from contextlib import ExitStack, nullcontext
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from typing import IO, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+from ..extensions import write_queue
+from .importer import IMPORT_BATCH_SIZE, IMPORT_FIELDS, Chunk, ImportResult, import_chunks
+from .samples import append_samples, sample_bounds
+
+WEARABLE_FORMATS = ('apple_health', 'fitbit')
+
+# Readings converted and aggregated together
+READING_BATCH_SIZE = 100000
+
+# How a day's readings of each HealthData column become the day's value:
+# their 'mean', their 'sum' (of the source with the largest sum) or the
+# 'last' reading
+DAILY_COMBINE: Dict[str, str] = {
+    'weight': 'last',
+    'blood_pressure_systolic': 'last',
+    'blood_pressure_diastolic': 'last',
+    'heart_rate': 'mean',
+    'temperature': 'last',
+    'oxygen_saturation': 'mean',
+    'steps': 'sum',
+    'exercise_duration': 'sum',
+    'calories_burned': 'sum',
+    'sleep_duration': 'sum',
+    'water_intake': 'sum',
+    'calorie_intake': 'sum'
+}
+COLUMNS = tuple(DAILY_COMBINE)
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+# Columns whose readings are also kept in the sample store. Sums are not:
+# overlapping sources are only resolved per day
+SAMPLED_COLUMNS = ('heart_rate', 'oxygen_saturation')
+
+_KILOJOULES = (1 / 4.184, 0.0)
+
+# Apple Health record types read, as the column and the (factor, offset)
+# converting each unit to the column's unit; other units are skipped
+APPLE_HEALTH_TYPES: Dict[str, Tuple[str, Dict[str, Tuple[float, float]]]] = {
+    'HKQuantityTypeIdentifierBodyMass': ('weight', {'kg': (1.0, 0.0), 'lb': (0.45359237, 0.0), 'g': (0.001, 0.0)}),
+    'HKQuantityTypeIdentifierBloodPressureSystolic': ('blood_pressure_systolic', {'mmHg': (1.0, 0.0)}),
+    'HKQuantityTypeIdentifierBloodPressureDiastolic': ('blood_pressure_diastolic', {'mmHg': (1.0, 0.0)}),
+    'HKQuantityTypeIdentifierHeartRate': ('heart_rate', {'count/min': (1.0, 0.0)}),
+    'HKQuantityTypeIdentifierBodyTemperature': ('temperature', {'degC': (1.0, 0.0), 'degF': (5 / 9, -160 / 9)}),
+    # Recorded as a fraction with the unit '%'
+    'HKQuantityTypeIdentifierOxygenSaturation': ('oxygen_saturation', {'%': (100.0, 0.0)}),
+    'HKQuantityTypeIdentifierStepCount': ('steps', {'count': (1.0, 0.0)}),
+    'HKQuantityTypeIdentifierAppleExerciseTime': ('exercise_duration', {'min': (1.0, 0.0)}),
+    'HKQuantityTypeIdentifierActiveEnergyBurned': ('calories_burned', {'kcal': (1.0, 0.0), 'Cal': (1.0, 0.0),
+                                                                       'kJ': _KILOJOULES}),
+    'HKQuantityTypeIdentifierDietaryWater': ('water_intake', {'mL': (0.001, 0.0), 'L': (1.0, 0.0),
+                                                              'fl_oz_us': (0.0295735, 0.0)}),
+    'HKQuantityTypeIdentifierDietaryEnergyConsumed': ('calorie_intake', {'kcal': (1.0, 0.0), 'Cal': (1.0, 0.0),
+                                                                         'kJ': _KILOJOULES})
+}
+
+# Sleep analysis records count their time asleep, in hours, towards the
+# day they end on; in-bed and awake records are skipped
+APPLE_SLEEP_TYPE = 'HKCategoryTypeIdentifierSleepAnalysis'
+APPLE_ASLEEP_PREFIX = 'HKCategoryValueSleepAnalysisAsleep'
+
+
+class FitbitFile(NamedTuple):
+    """How the items of one kind of Fitbit export file are read."""
+    column: str
+    factor: float  # converts the value to the column's unit
+    time_format: str
+    read: Callable[[Dict[str, Any]], Tuple[str, Any]]  # item -> (time, value)
+
+
+# Fitbit export files read, keyed by the name they start with. Times are
+# taken as they are written; weights are exported in pounds
+FITBIT_FILES: Dict[str, FitbitFile] = {
+    'heart_rate': FitbitFile('heart_rate', 1.0, '%m/%d/%y %H:%M:%S',
+                             lambda item: (item['dateTime'], item['value']['bpm'])),
+    'steps': FitbitFile('steps', 1.0, '%m/%d/%y %H:%M:%S', lambda item: (item['dateTime'], item['value'])),
+    'weight': FitbitFile('weight', 0.45359237, '%m/%d/%y %H:%M:%S',
+                         lambda item: (f"{item['date']} {item['time']}", item['weight'])),
+    'sleep': FitbitFile('sleep_duration', 1 / 60, '%Y-%m-%dT%H:%M:%S.%f',
+                        lambda item: (item['endTime'], item['minutesAsleep']))
+}
+FITBIT_FILE = re.compile(r'(?:^|/)(' + '|'.join(FITBIT_FILES) + r')-\d{4}-\d{2}-\d{2}\.json$')
+
+# Bytes read from a Fitbit file at a time
+JSON_READ_SIZE = 1 << 16
+
+
+class Readings(NamedTuple):
+    """A batch of readings as arrays, one entry per reading."""
+    columns: np.ndarray  # index into DAILY_COMBINE
+    sources: np.ndarray  # index of the device or app that recorded it
+    times: np.ndarray  # naive UTC datetime64[s]
+    values: np.ndarray  # float64 in the column's unit
+
+
+@dataclass
+class _DailyAggregates:
+    """Running [count, sum, last time, last value] per (day, column, source)."""
+    entries: Dict[Tuple[int, int, int], List[Any]] = field(default_factory=dict)
+
+    def add(self, readings: Readings) -> None:
+        frame = pd.DataFrame({
+            'day': readings.times.astype('datetime64[D]').astype(np.int64),
+            'column': readings.columns,
+            'source': readings.sources,
+            'time': readings.times.astype(np.int64),
+            'value': readings.values
+        }).sort_values('time', kind='stable')
+        grouped = frame.groupby(['day', 'column', 'source'], sort=False).agg(
+            count=('value', 'size'), total=('value', 'sum'), time=('time', 'last'), last=('value', 'last')
+        )
+        for key, count, total, time, last in grouped.itertuples():
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = [count, total, time, last]
+                continue
+            entry[0] += count
+            entry[1] += total
+            if time >= entry[2]:
+                entry[2], entry[3] = time, last
+
+    def chunks(self) -> Iterator[Chunk]:
+        # One row per day, in date order, numbered from 1 in place of lines
+        by_column: Dict[Tuple[int, int], List[List[Any]]] = {}
+        for (day, column, _), entry in self.entries.items():
+            by_column.setdefault((day, column), []).append(entry)
+        days: Dict[int, Dict[str, Any]] = {}
+        for (day, column), entries in by_column.items():
+            name = COLUMNS[column]
+            combine = DAILY_COMBINE[name]
+            if combine == 'mean':
+                value = sum(entry[1] for entry in entries) / sum(entry[0] for entry in entries)
+            elif combine == 'sum':
+                value = max(entry[1] for entry in entries)
+            else:
+                value = max(entries, key=lambda entry: entry[2])[3]
+            # Integer fields must hold whole numbers to pass validation
+            days.setdefault(day, {})[name] = round(value) if IMPORT_FIELDS[name].kind == 'int' else round(value, 2)
+
+        ordered = sorted(days)
+        for start in range(0, len(ordered), IMPORT_BATCH_SIZE):
+            batch = ordered[start:start + IMPORT_BATCH_SIZE]
+            frame = pd.DataFrame({
+                'date': [str(np.datetime64(day, 'D')) for day in batch],
+                **{name: [days[day].get(name) for day in batch] for name in DAILY_COMBINE}
+            }, dtype=object)
+            yield frame, np.arange(start + 1, start + len(batch) + 1), []
+
+
+class _CountingReader:
+    """Binary file wrapper counting the bytes read through it."""
+
+    def __init__(self, raw: IO[bytes]):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.count += len(data)
+        return data
+
+
+def detect_wearable_format(filename: str, stream: IO[bytes]) -> Optional[str]:
+    """
+    Tell whether a file is a wearable export.
+
+    Args:
+        filename: Name of the uploaded or local file
+        stream: The file opened in binary mode; zip files are looked into
+            and the stream is rewound afterwards
+
+    Returns:
+        'apple_health', 'fitbit' or None if the file is neither
+    """
+    name = filename.lower()
+    if name.endswith('.xml'):
+        return 'apple_health'
+    if FITBIT_FILE.search(name):
+        return 'fitbit'
+    if name.endswith('.zip'):
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                names = archive.namelist()
+        except zipfile.BadZipFile:
+            return None
+        finally:
+            stream.seek(0)
+        if any(_is_apple_export(member) for member in names):
+            return 'apple_health'
+        if any(FITBIT_FILE.search(member.lower()) for member in names):
+            return 'fitbit'
+    return None
+
+
+def import_wearable(user_id: int, stream: IO[bytes], fmt: str, filename: str = '',
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    samples: bool = True) -> ImportResult:
+    """
+    Import an Apple Health or Fitbit export for a user.
+
+    Args:
+        user_id: ID of the user the records belong to
+        stream: Seekable binary stream of the export file or zip archive
+        fmt: 'apple_health' or 'fitbit'
+        filename: Name of the file; tells zip archives apart and which
+            data a single Fitbit file holds
+        progress: Called after each batch of readings with the bytes read
+            so far and the total, both uncompressed
+        samples: Also keep heart rate and oxygen saturation readings in
+            the sample store
+
+    Returns:
+        ImportResult with one imported row per day, and the numbers of
+        readings and stored samples
+
+    Raises:
+        ValueError: If the format is unknown or the file is not a readable
+            export of that format
+    """
+    if fmt not in WEARABLE_FORMATS:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+    result = ImportResult()
+    aggregates = _DailyAggregates()
+    sources: Dict[str, int] = {}
+    with ExitStack() as stack:
+        if filename.lower().endswith('.zip'):
+            try:
+                archive = stack.enter_context(zipfile.ZipFile(stream))
+            except zipfile.BadZipFile:
+                raise ValueError('Not a valid zip file.')
+            members = [info for info in archive.infolist()
+                       if (_is_apple_export(info.filename) if fmt == 'apple_health'
+                           else FITBIT_FILE.search(info.filename.lower()))]
+            if not members:
+                raise ValueError('The archive holds no export files.')
+            parts = [(info.filename, info.file_size, partial(archive.open, info)) for info in members]
+        else:
+            parts = [(filename, _size(stream), partial(nullcontext, stream))]
+
+        total = sum(size for _, size, _ in parts)
+        done = 0
+        for name, size, open_part in parts:
+            with open_part() as raw:
+                reader = _CountingReader(raw)
+                if fmt == 'apple_health':
+                    batches = _apple_health_readings(reader, sources)
+                else:
+                    match = FITBIT_FILE.search(name.lower())
+                    if match is None:
+                        raise ValueError('Cannot tell from its name which Fitbit data the file holds.')
+                    batches = _fitbit_readings(reader, FITBIT_FILES[match.group(1)])
+                for readings in batches:
+                    keep = ~np.isnat(readings.times) & ~np.isnan(readings.values)
+                    readings = Readings(*(array[keep] for array in readings))
+                    result.readings += len(readings.values)
+                    aggregates.add(readings)
+                    if samples:
+                        result.samples += write_queue.run(_append_samples, user_id, readings)
+                    if progress is not None:
+                        progress(done + reader.count, total)
+            done += size
+
+    return import_chunks(user_id, aggregates.chunks(), result)
+
+
+def _append_samples(user_id: int, readings: Readings) -> int:
+    # Write function for the write queue: keep a batch's sampled readings
+    stored = 0
+    for name in SAMPLED_COLUMNS:
+        # Readings the sample store would reject are left out of it, as
+        # implausible daily values are rejected by the import
+        minimum, maximum = sample_bounds(name)
+        mask = ((readings.columns == COLUMN_INDEX[name])
+                & (readings.values >= minimum) & (readings.values <= maximum))
+        if mask.any():
+            stored += append_samples(user_id, name, readings.times[mask], readings.values[mask])
+    return stored
+
+
+def _is_apple_export(name: str) -> bool:
+    # apple_health_export/export.xml, not export_cda.xml beside it
+    return name.rsplit('/', 1)[-1] == 'export.xml'
+
+
+def _size(stream: IO[bytes]) -> int:
+    position = stream.tell()
+    size = stream.seek(0, 2)
+    stream.seek(position)
+    return size - position
+
+
+def _apple_health_readings(stream: _CountingReader, sources: Dict[str, int]) -> Iterator[Readings]:
+    # Records are read as they end, at depth 1 only: Correlation elements
+    # repeat records that are also listed on their own
+    columns: List[int] = []
+    source_ids: List[int] = []
+    starts: List[str] = []
+    values: List[str] = []
+    conversions: List[Tuple[float, float]] = []
+    spans: List[Tuple[int, str]] = []  # (index, end date) of sleep records
+
+    try:
+        context = ElementTree.iterparse(stream, events=('start', 'end'))
+        _, root = next(context)
+        depth = 1
+        for event, element in context:
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if element.tag == 'Record':
+                attributes = element.attrib
+                record_type = attributes.get('type')
+                if record_type in APPLE_HEALTH_TYPES:
+                    name, units = APPLE_HEALTH_TYPES[record_type]
+                    conversion = units.get(attributes.get('unit'))
+                    value = attributes.get('value')
+                elif record_type == APPLE_SLEEP_TYPE and attributes.get('value', '').startswith(APPLE_ASLEEP_PREFIX):
+                    # The value is the time asleep, filled in from the end date
+                    name, conversion, value = 'sleep_duration', (1 / 3600, 0.0), '0'
+                    spans.append((len(columns), attributes.get('endDate', '')))
+                else:
+                    conversion = None
+                if conversion is not None:
+                    columns.append(COLUMN_INDEX[name])
+                    source_ids.append(sources.setdefault(attributes.get('sourceName', ''), len(sources)))
+                    starts.append(attributes.get('startDate', ''))
+                    values.append(value)
+                    conversions.append(conversion)
+                    if len(columns) >= READING_BATCH_SIZE:
+                        yield _apple_batch(columns, source_ids, starts, values, conversions, spans)
+                        columns, source_ids, starts, values, conversions, spans = [], [], [], [], [], []
+            # Drop everything read so far; the root would keep it alive
+            root.clear()
+    except ElementTree.ParseError as e:
+        raise ValueError(f'Not a valid Apple Health export: {e}')
+    if columns:
+        yield _apple_batch(columns, source_ids, starts, values, conversions, spans)
+
+
+def _apple_batch(columns: List[int], sources: List[int], starts: List[str], values: List[str],
+                 conversions: List[Tuple[float, float]], spans: List[Tuple[int, str]]) -> Readings:
+    times = _apple_times(starts)
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(np.float64)
+    if spans:
+        rows = np.array([row for row, _ in spans])
+        ends = _apple_times([end for _, end in spans])
+        seconds = ends - times[rows]
+        numbers[rows] = np.where(np.isnat(seconds), np.nan, seconds.astype(np.float64))
+        times[rows] = ends
+    factors, offsets = np.array(conversions).T
+    return Readings(np.array(columns, dtype=np.int16), np.array(sources, dtype=np.int32), times,
+                    numbers * factors + offsets)
+
+
+def _apple_times(texts: List[str]) -> np.ndarray:
+    # 'YYYY-MM-DD HH:MM:SS +HHMM' to naive UTC; exports use a handful of
+    # offsets, so each distinct one is parsed once
+    try:
+        local = np.array([text[:19] for text in texts], dtype='datetime64[s]')
+    except ValueError:
+        parsed = pd.to_datetime(pd.Series(texts, dtype=object), errors='coerce', utc=True)
+        return parsed.dt.tz_convert(None).to_numpy('datetime64[s]')
+    zones, inverse = np.unique(np.array([text[20:] for text in texts]), return_inverse=True)
+    offsets = np.array([_utc_offset(zone) for zone in zones], dtype=np.int64).astype('timedelta64[s]')
+    return local - offsets[inverse]
+
+
+def _utc_offset(zone: str) -> int:
+    # Seconds east of UTC of a '+HHMM' or '-HHMM' offset, 0 if there is none
+    if not re.fullmatch(r'[+-]\d{4}', zone):
+        return 0
+    seconds = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+    return -seconds if zone[0] == '-' else seconds
+
+
+def _fitbit_readings(stream: _CountingReader, spec: FitbitFile) -> Iterator[Readings]:
+    items = _json_items(stream)
+    column = COLUMN_INDEX[spec.column]
+    while True:
+        texts: List[str] = []
+        values: List[Any] = []
+        count = 0
+        for item in islice(items, READING_BATCH_SIZE):
+            count += 1
+            try:
+                text, value = spec.read(item)
+            except (KeyError, TypeError):
+                continue
+            texts.append(text)
+            values.append(value)
+        if not count:
+            return
+        times = pd.to_datetime(pd.Series(texts, dtype=object), format=spec.time_format, errors='coerce')
+        numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(np.float64)
+        yield Readings(np.full(len(texts), column, dtype=np.int16), np.zeros(len(texts), dtype=np.int32),
+                       times.to_numpy('datetime64[s]'), numbers * spec.factor)
+
+
+def _json_items(stream: _CountingReader) -> Iterator[Any]:
+    # Items of a top-level JSON array, decoding one at a time from a
+    # buffer refilled JSON_READ_SIZE bytes at a time
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, position, started, finished = '', 0, False, False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ',')):
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Expected a JSON array.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+                yield item
+                continue
+            except ValueError:
+                if finished:
+                    raise ValueError('Not valid JSON.')
+        elif finished:
+            if not started:
+                raise ValueError('Expected a JSON array.')
+            raise ValueError('The JSON array is not closed.')
+        data = stream.read(JSON_READ_SIZE)
+        finished = not data
+        buffer = buffer[position:] + text_decoder.decode(data, final=finished)
+        position = 0
@@ -0,0 +1,281 @@
+"""
+Write hooks for health data in the Health Monitor application.
+
+Every change to a user's HealthData rows goes through one of these
+functions before the commit, so derived state (the per-user data
+version, the daily/weekly rollups and the latest-value snapshot) is
+updated in the same transaction as the records themselves.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import exists, func, literal, select, text
+from sqlalchemy.dialects.sqlite import Insert, insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import HealthData, HealthDataTombstone, IdempotencyKey, User, UserDataVersion, execute_upsert
+from . import rollups, snapshots
+from .pagination import invalidate_record_count
+
+# HealthData columns holding a submission's values
+RECORD_COLUMNS = tuple(
+    column.name for column in HealthData.__table__.columns
+    if column.name not in ('id', 'user_id', 'date', 'change_seq')
+)
+
+
+def next_change_seq(user_id: int) -> int:
+    """
+    Bump a user's data version for a change about to be written.
+
+    Args:
+        user_id: ID of the user whose data changes
+
+    Returns:
+        The change_seq to stamp on the changed records
+    """
+    return UserDataVersion.bump(user_id)
+
+
+def add_record(user_id: int, values: Dict[str, Any], idempotency_key: Optional[str] = None) -> int:
+    """
+    Save a submitted record and update derived state, without committing.
+
+    A write function for the write queue. A submission whose idempotency
+    key was already applied returns the record it created without writing
+    anything; otherwise the record is upserted (see upsert_record). If
+    another submission with the same key commits between the lookup and
+    the key's insert, the upsert is rolled back to a savepoint and that
+    submission's record is returned instead.
+
+    Args:
+        user_id: ID of the user the record belongs to
+        values: HealthData column values; 'date' defaults to now
+        idempotency_key: Client-supplied key identifying the submission
+
+    Returns:
+        ID of the record
+    """
+    if idempotency_key is None:
+        return upsert_record(user_id, values)
+    applied = db.session.get(IdempotencyKey, (user_id, idempotency_key))
+    if applied is not None:
+        return applied.health_data_id
+    try:
+        with db.session.begin_nested():
+            record_id = upsert_record(user_id, values)
+            db.session.add(IdempotencyKey(user_id=user_id, key=idempotency_key, health_data_id=record_id))
+    except IntegrityError:
+        # The (user_id, key) primary key was taken by a concurrent submission
+        return db.session.get(IdempotencyKey, (user_id, idempotency_key)).health_data_id
+    return record_id
+
+
+def upsert_record(user_id: int, values: Dict[str, Any]) -> int:
+    """
+    Insert a record, or replace the user's record with the same date.
+
+    Resubmitting a reading therefore never adds a row: an identical one
+    costs a single lookup on the (user_id, date) index, a changed one
+    overwrites the stored values.
+
+    Args:
+        user_id: ID of the user the record belongs to
+        values: HealthData column values; 'date' defaults to now
+
+    Returns:
+        ID of the record
+    """
+    row = {name: values.get(name) for name in RECORD_COLUMNS}
+    row['user_id'] = user_id
+    row['date'] = values.get('date') or datetime.utcnow()
+    table = HealthData.__table__
+    existing = db.session.execute(
+        select(table).where(table.c.user_id == user_id, table.c.date == row['date'])
+    ).first()
+    if existing is not None and all(existing._mapping[name] == row[name] for name in RECORD_COLUMNS):
+        return existing.id
+
+    row['change_seq'] = next_change_seq(user_id)
+    result = execute_upsert(upsert_statement, [row], RECORD_COLUMNS)
+    if existing is None:
+        record = HealthData(**row)
+        rollups.add_record(record)
+        snapshots.add_record(record)
+        invalidate_record_count(user_id)
+        return result.lastrowid
+    rollups.refresh_buckets(user_id, [row['date']])
+    snapshots.refresh(user_id)
+    return existing.id
+
+
+def upsert_statement(columns: Tuple[str, ...]) -> Insert:
+    """
+    Build the HealthData insert that overwrites a record with the same date.
+
+    Args:
+        columns: HealthData value columns set by the statement (change_seq
+            is always set as well)
+
+    Returns:
+        INSERT ... ON CONFLICT (user_id, date) DO UPDATE statement
+    """
+    table = HealthData.__table__
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.date],
+        set_={name: stmt.excluded[name] for name in (*columns, 'change_seq')}
+    )
+
+
+def on_record_updated(record: HealthData, previous_date: datetime) -> None:
+    """
+    Update derived state for a modified record.
+
+    Args:
+        record: Modified HealthData record
+        previous_date: Date of the record before the change
+    """
+    db.session.flush()
+    record.change_seq = next_change_seq(record.user_id)
+    rollups.refresh_buckets(record.user_id, {previous_date, record.date})
+    snapshots.refresh(record.user_id)
+
+
+def on_record_deleted(user_id: int, record_id: int, record_date: datetime) -> None:
+    """
+    Update derived state for a record deleted from the session.
+
+    Leaves a tombstone so syncing clients learn about the deletion.
+
+    Args:
+        user_id: ID of the user who owned the record
+        record_id: ID of the deleted record
+        record_date: Date of the deleted record
+    """
+    db.session.flush()
+    db.session.add(HealthDataTombstone(
+        user_id=user_id, health_data_id=record_id, date=record_date, change_seq=next_change_seq(user_id)
+    ))
+    rollups.refresh_buckets(user_id, [record_date])
+    snapshots.refresh(user_id)
+    invalidate_record_count(user_id)
+
+
+def on_records_imported(user_id: int, dates: np.ndarray, columns: Mapping[str, np.ndarray],
+                        replaced: Sequence[datetime] = ()) -> None:
+    """
+    Update derived state for a batch of bulk upserted records.
+
+    The batch's rows carry a change_seq from next_change_seq, which has
+    already bumped the data version.
+
+    Args:
+        user_id: ID of the user the records belong to
+        dates: Dates of the newly inserted records as a datetime64 array
+        columns: Float arrays of the new records' numeric values keyed by
+            HealthData column name, NaN where a value is missing
+        replaced: Dates of existing records the batch overwrote
+    """
+    rollups.add_records(user_id, dates, columns)
+    snapshots.add_records(user_id, dates, columns)
+    if len(dates):
+        invalidate_record_count(user_id)
+    if len(replaced):
+        # Overwritten values cannot be folded out, so re-aggregate the
+        # period they span (new records in it included) from the raw rows
+        rollups.refresh_span(user_id, min(replaced), max(replaced))
+        snapshots.refresh(user_id)
+
+
+def delete_account(user_id: int) -> None:
+    """
+    Delete a user and all of their data, without committing.
+
+    A write function for the write queue.
+
+    Args:
+        user_id: ID of the user to delete
+    """
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user.delete_account()
+    invalidate_record_count(user_id)
+
+
+def _superseded() -> Any:
+    # A record for which the same user has a newer record with the same date
+    table = HealthData.__table__
+    newer = table.alias('newer')
+    return exists(select(newer.c.id).where(
+        newer.c.user_id == table.c.user_id, newer.c.date == table.c.date, newer.c.id > table.c.id
+    ))
+
+
+def count_duplicates() -> List[Tuple[int, int]]:
+    """
+    Count the health records superseded by a newer record with the same date.
+
+    Returns:
+        (user_id, duplicate count) for every user with duplicates
+    """
+    table = HealthData.__table__
+    return [tuple(row) for row in db.session.execute(
+        select(table.c.user_id, func.count()).where(_superseded()).group_by(table.c.user_id)
+    ).all()]
+
+
+def duplicate_records() -> List[Tuple[int, int, datetime]]:
+    """
+    List the health records superseded by a newer record with the same date.
+
+    Returns:
+        (user_id, record ID, date) of each, ordered by user and date
+    """
+    table = HealthData.__table__
+    return [tuple(row) for row in db.session.execute(
+        select(table.c.user_id, table.c.id, table.c.date).where(_superseded())
+        .order_by(table.c.user_id, table.c.date, table.c.id)
+    ).all()]
+
+
+def remove_duplicates() -> List[Tuple[int, int]]:
+    """
+    Remove duplicate health records and make (user, date) unique, without committing.
+
+    Of the records a user has with the same date, the most recently added
+    one is kept, as an upsert would have left it; clients that synced the
+    others are told they were deleted. The old non-unique index is then
+    replaced by the unique one the upserts need, and the rollups and
+    snapshots of the affected users are rebuilt.
+
+    Returns:
+        (user_id, removed count) for every user that had duplicates
+    """
+    table = HealthData.__table__
+    tombstones = HealthDataTombstone.__table__
+    counts = count_duplicates()
+    for user_id, count in counts:
+        ids = db.session.execute(
+            select(table.c.id).where(table.c.user_id == user_id, _superseded()).order_by(table.c.id)
+        ).scalars().all()
+        current_app.logger.warning(f"Removing {count} duplicate health records of user {user_id}: {ids}")
+        change_seq = next_change_seq(user_id)
+        db.session.execute(tombstones.insert().from_select(
+            ['user_id', 'health_data_id', 'date', 'change_seq'],
+            select(table.c.user_id, table.c.id, table.c.date, literal(change_seq))
+            .where(table.c.user_id == user_id, _superseded())
+        ))
+    db.session.execute(table.delete().where(_superseded()))
+    db.session.execute(text('DROP INDEX IF EXISTS ix_health_data_user_date'))
+    for index in table.indexes:
+        index.create(bind=db.session.connection(), checkfirst=True)
+    for user_id, _ in counts:
+        rollups.rebuild(user_id)
+        snapshots.rebuild(user_id)
+        invalidate_record_count(user_id)
+    return counts
@@ -0,0 +1,240 @@
+"""
+Logging pipeline for the Health Monitor application.
+
+Records logged by the application are put on a bounded queue and written
+by a QueueListener thread, so a ``current_app.logger`` call in a request
+costs a dict copy and a queue put instead of a write to disk. The writer
+rotates LOG_FILE at LOG_MAX_BYTES and formats each record as one JSON
+object per line carrying the request id, user id, route and the time
+since the request started.
+
+If the writer falls behind and the queue fills up, further records are
+dropped rather than blocking the request; the number dropped is logged
+once there is room again.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict
+
+from flask import Flask, Response, current_app, g, has_request_context, request
+from flask.logging import default_handler
+
+# Attributes every LogRecord has; anything else was passed with ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Text format used when LOG_FORMAT is 'text'
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Records also written to stderr, in Flask's format, by the writer thread
+CONSOLE_LEVEL = logging.WARNING
+CONSOLE_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+# Pipelines by absolute log file path, shared by apps logging to the same file
+_pipelines: Dict[str, 'LogPipeline'] = {}
+_pipelines_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the current request's id, user, route and elapsed time to records.
+
+    Runs on the thread that logs, where the request context is available;
+    records logged outside a request pass through unchanged.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            context = g.get('log_context')
+            if context is not None:
+                record.__dict__.update(context)
+                if getattr(record, 'latency_ms', None) is None:
+                    record.latency_ms = round((time.perf_counter() - g.request_started) * 1000, 3)
+            # The user Flask-Login loaded for this request, if it did; reading
+            # the session here would mark every response Vary: Cookie
+            user = g.get('_login_user')
+            if user is not None and user.is_authenticated:
+                record.user_id = user.get_id()
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that drops records when its queue is full.
+
+    Records are made safe to pass to another thread here: the message is
+    merged with its arguments and a traceback is rendered to text, but
+    unlike QueueHandler's default the record is not formatted, so the
+    writer's formatter still sees its fields.
+
+    Args:
+        capacity: Most records waiting to be written
+    """
+
+    def __init__(self, capacity: int):
+        # SimpleQueue's put costs a fraction of Queue's; the size check
+        # stands in for Queue's bound
+        super().__init__(queue.SimpleQueue())
+        self.capacity = capacity
+        self.dropped = 0
+        self._traceback_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A shallow copy, as copy.copy() makes, for a third of its cost
+        prepared = logging.LogRecord.__new__(type(record))
+        prepared.__dict__.update(record.__dict__)
+        record = prepared
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called with the handler's lock held, so the count needs no lock of its own
+        if self.queue.qsize() >= self.capacity:
+            self.dropped += 1
+            return
+        if self.dropped:
+            self.queue.put_nowait(logging.makeLogRecord({
+                'name': record.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f'Log queue full: dropped {self.dropped} records'
+            }))
+            self.dropped = 0
+        self.queue.put_nowait(record)
+
+
+class LogPipeline:
+    """
+    A log file, and stderr for warnings and errors, written by a background thread.
+
+    Args:
+        path: Log file path
+        max_bytes: Size at which the file is rotated
+        backup_count: Rotated files kept
+        formatter: Formatter for the file
+        queue_size: Most records waiting to be written
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int,
+                 formatter: logging.Formatter, queue_size: int):
+        self.file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+        self.file_handler.setFormatter(formatter)
+        self.file_handler.setLevel(logging.INFO)
+        self.console_handler = logging.StreamHandler(sys.stderr)
+        self.console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        self.console_handler.setLevel(CONSOLE_LEVEL)
+        self.handler = NonBlockingQueueHandler(queue_size)
+        self.handler.addFilter(RequestContextFilter())
+        self.listener = QueueListener(self.handler.queue, self.file_handler, self.console_handler,
+                                      respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Write the records still queued and stop the writer thread."""
+        self.listener.stop()
+        self.file_handler.close()
+
+
+def configure_logging(app: Flask) -> None:
+    """
+    Send the application's log records through the background writer.
+
+    Every request gets an id (the X-Request-ID header if the client sent
+    one) that is echoed in the response and added to the records logged
+    while it runs. Outside debug mode, records go to LOG_FILE, which is
+    rotated at LOG_MAX_BYTES keeping LOG_BACKUP_COUNT files, formatted as
+    LOG_FORMAT ('json' or 'text'); with LOG_REQUESTS every request is
+    also logged with its status and latency. Flask's stderr handler is
+    replaced by one on the writer thread that only shows warnings and
+    errors, so request logging does not flood the console.
+
+    Args:
+        app: Flask application instance
+    """
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    if app.debug:
+        return
+
+    path = os.path.abspath(app.config.get('LOG_FILE', 'logs/health_monitor.log'))
+    with _pipelines_lock:
+        pipeline = _pipelines.get(path)
+        if pipeline is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            formatter = JsonFormatter() if app.config.get('LOG_FORMAT', 'json') == 'json' \
+                else logging.Formatter(TEXT_FORMAT)
+            pipeline = _pipelines[path] = LogPipeline(
+                path, app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024), app.config.get('LOG_BACKUP_COUNT', 10),
+                formatter, app.config.get('LOG_QUEUE_SIZE', 10000))
+    app.logger.removeHandler(default_handler)
+    if pipeline.handler not in app.logger.handlers:
+        app.logger.addHandler(pipeline.handler)
+    app.logger.setLevel(logging.INFO)
+
+
+def shutdown_logging() -> None:
+    """Flush and stop every log pipeline; registered to run at exit."""
+    with _pipelines_lock:
+        pipelines = list(_pipelines.values())
+        _pipelines.clear()
+    for pipeline in pipelines:
+        pipeline.stop()
+
+
+atexit.register(shutdown_logging)
+
+
+def _start_request() -> None:
+    g.request_started = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+    # Fields added to every record logged during the request
+    g.log_context = {'request_id': g.request_id, 'method': request.method,
+                     'path': request.path, 'route': request.endpoint}
+
+
+def _finish_request(response: Response) -> Response:
+    request_id = g.get('request_id')
+    started = g.get('request_started')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    if current_app.config.get('LOG_REQUESTS') and not current_app.debug and started is not None:
+        latency_ms = round((time.perf_counter() - started) * 1000, 3)
+        current_app.logger.info('%s %s %s', request.method, request.path, response.status_code,
+                                extra={'status': response.status_code, 'latency_ms': latency_ms})
+    return response
@@ -2,31 +2,41 @@
 Main routes for the Health Monitor application.
 This module handles the main views including the dashboard and about page.
 """
-from flask import render_template, flash, redirect, url_for, current_app, Response, request
+from flask import render_template, flash, redirect, url_for, current_app, Response, request, abort
 from flask_login import login_required, current_user, logout_user
 from typing import Dict, Any, Union, List, TYPE_CHECKING, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
 from sqlalchemy.exc import SQLAlchemyError
 
 # Application imports
-from ..extensions import db
-from ..models import HealthData, User, UserSettings, MetadataBaseline
+from ..chart_cache import CHART_VERSION, chart_key, chart_response
+from ..chart_render import ChartSpec, SeriesSpec
+from ..extensions import db, baseline_index, chart_renderer, write_queue
+from ..health_data.queries import PARAMETER_COLUMNS, fetch_graph_window
+from ..health_data.snapshots import fetch_snapshot
+from ..health_data.writes import delete_account as delete_user_account
+from ..models import User, UserDataVersion
 from . import main
 from ..forms import ProfileForm, SettingsForm, DeleteAccountForm
-from ..security import sanitize_input
 
 # Type definitions for better type checking
 if TYPE_CHECKING:
     from werkzeug.wrappers import Response as WerkzeugResponse
     ResponseType = Union[str, WerkzeugResponse, Response]
 
+# Dashboard trend charts: name -> (line color, y-axis label); blood pressure
+# is drawn with its own two-series chart
+DASHBOARD_CHARTS = {
+    'weight': ('blue', 'Weight (kg)'),
+    'blood_pressure': (None, 'Blood Pressure (mmHg)'),
+    'heart_rate': ('green', 'Heart Rate (bpm)')
+}
+
+# Metrics whose demographic baselines the dashboard shows
+DASHBOARD_BASELINES = ('weight', 'heart_rate', 'steps')
+
 @main.route('/')
 def index() :
     """
@@ -40,139 +50,80 @@ def index() :
         return redirect(url_for('main.dashboard'))
     return render_template('main/landing.html', title='Welcome to Health Monitor')
 
-@main.route('/dashboard')
 @main.route('/index')
+@main.route('/dashboard')
 @login_required
 def dashboard() -> Union[str, Response]:
     """
     Render the dashboard home page with health data summary.
     
-    Retrieves the latest health metrics and trends for display
-    on the dashboard. Requires authentication.
+    Renders from the user's latest-value snapshot, which the health
+    data write hooks keep current. Requires authentication.
     
     Returns:
         Rendered dashboard template with health data
     """
     try:
-        # Get the latest health records for the current user
-        latest_records = HealthData.query.filter_by(user_id=current_user.id)\
-            .order_by(HealthData.date.desc())\
-            .limit(5).all()
-        
-        # Get some basic statistics
-        record_count = HealthData.query.filter_by(user_id=current_user.id).count()
-        
-        # Get record from last week for comparison
-        now = datetime.utcnow()
-        one_week_ago = now - timedelta(days=7)
-        
-        recent_stats = {
-            'weight': None,
-            'steps': None,
-            'heart_rate': None
-        }
-        
-        # Get recent values for key metrics
-        latest_weight = HealthData.query.filter(
-            HealthData.user_id == current_user.id,
-            HealthData.weight.isnot(None)
-        ).order_by(HealthData.date.desc()).first()
-        
-        latest_steps = HealthData.query.filter(
-            HealthData.user_id == current_user.id,
-            HealthData.steps.isnot(None)
-        ).order_by(HealthData.date.desc()).first()
-        
-        latest_heart_rate = HealthData.query.filter(
-            HealthData.user_id == current_user.id,
-            HealthData.heart_rate.isnot(None)
-        ).order_by(HealthData.date.desc()).first()
-        
-        if latest_weight:
-            recent_stats['weight'] = latest_weight.weight
-            
-        if latest_steps:
-            recent_stats['steps'] = latest_steps.steps
-            
-        if latest_heart_rate:
-            recent_stats['heart_rate'] = latest_heart_rate.heart_rate
-        
-        # Initialize settings if they don't exist yet
-        if not current_user.settings:
-            current_user.initialize_settings()
+        # Latest values, record count and data version in one lookup
+        snapshot, data_version = fetch_snapshot(current_user.id)
+        record_count = snapshot.record_count
         
         # Get baseline data if available
         baselines = {}
         if current_user.gender and current_user.date_of_birth:
             age = current_user.get_age()
             if age:
-                for metric in ['weight', 'heart_rate', 'steps']:
-                    baseline = MetadataBaseline.get_baseline(
-                        gender=current_user.gender,
-                        age=age,
-                        metric_type=metric
-                    )
-                    if baseline:
-                        baselines[metric] = baseline
+                demographic = baseline_index.for_demographic(current_user.gender, age)
+                baselines = {metric: demographic[metric] for metric in DASHBOARD_BASELINES if metric in demographic}
         
         return render_template('main/dashboard.html', 
                               title='Dashboard',
-                              latest_records=latest_records,
+                              latest_data=snapshot if record_count else None,
                               record_count=record_count,
-                              recent_stats=recent_stats,
-                              baselines=baselines)
+                              baselines=baselines,
+                              charts=list(DASHBOARD_CHARTS) if record_count > 1 else [],
+                              data_version=data_version,
+                              chart_version=CHART_VERSION,
+                              today=date.today().isoformat())
     
     except Exception as e:
         current_app.logger.error(f"Error in dashboard view: {str(e)}")
         flash("Error loading dashboard. Please try again.", "danger")
         return render_template('main/dashboard.html', title='Dashboard')
 
-def generate_dashboard_charts() -> Dict[str, str]:
+@main.route('/chart/dashboard/<name>.png')
+@login_required
+def dashboard_chart(name: str) -> Response:
     """
-    Generate mini charts for the dashboard.
-    
+    Serve a dashboard trend chart covering the last 30 days as a PNG image.
+
+    Args:
+        name: Chart to draw ('weight', 'blood_pressure' or 'heart_rate')
+
     Returns:
-        Dictionary of chart names and their base64-encoded images
+        PNG response, 304 if the browser's copy is current, or 404 if there
+        is nothing to draw
     """
-    charts = {}
-    
-    # Get the last 30 days of data
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    all_records = HealthData.query.filter(HealthData.date >= thirty_days_ago)\
-                                 .order_by(HealthData.date.asc()).all()
-    
-    if all_records and len(all_records) > 1:
-        try:
-            # Convert to DataFrame for easier manipulation
-            data = [{
-                'date': record.date,
-                'weight': record.weight,
-                'systolic': record.blood_pressure_systolic,
-                'diastolic': record.blood_pressure_diastolic,
-                'heart_rate': record.heart_rate,
-                'steps': record.steps,
-                'sleep_duration': record.sleep_duration
-            } for record in all_records]
+    if name not in DASHBOARD_CHARTS:
+        abort(404)
 
-            df = pd.DataFrame(data)
-            
-            # Generate charts
-            if 'weight' in df.columns and df['weight'].notna().any():
-                charts['weight'] = create_trend_chart(df, 'weight', 'blue', 'Weight (kg)')
-            
-            if 'systolic' in df.columns and 'diastolic' in df.columns and \
-               df['systolic'].notna().any() and df['diastolic'].notna().any():
-                charts['blood_pressure'] = create_blood_pressure_chart(df)
-            
-            if 'heart_rate' in df.columns and df['heart_rate'].notna().any():
-                charts['heart_rate'] = create_trend_chart(df, 'heart_rate', 'green', 'Heart Rate (bpm)')
-            
-        except Exception as e:
-            current_app.logger.error(f"Error generating dashboard charts: {str(e)}")
-    
-    return charts
+    user_id = current_user.id
+    key = chart_key(current_user, 'dashboard', name, '30d', date.today(), UserDataVersion.get(user_id))
+
+    def render() -> bytes:
+        columns = PARAMETER_COLUMNS[name]
+        end_date = datetime.now()
+        df = fetch_graph_window(user_id, columns, end_date - timedelta(days=30), end_date)
+        if len(df) < 2 or not all(df[column].notna().any() for column in columns):
+            return b''
+        if name == 'blood_pressure':
+            return create_blood_pressure_chart(df)
+        color, ylabel = DASHBOARD_CHARTS[name]
+        return create_trend_chart(df, name, color, ylabel)
 
-def create_trend_chart(df: pd.DataFrame, column: str, color: str, ylabel: str) -> str:
+    return chart_response(key, render)
+
+def create_trend_chart(df: pd.DataFrame, column: str, color: str, ylabel: str) -> bytes:
     """
     Create a line chart for a single metric.
     
@@ -183,25 +134,18 @@ def create_trend_chart(df: pd.DataFrame, column: str, color: str, ylabel: str) -
         ylabel: Y-axis label
         
     Returns:
-        Base64 encoded image
+        PNG image bytes
     """
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.plot(df['date'], df[column], 'o-', color=color)
-    ax.set_xlabel('Date')
-    ax.set_ylabel(ylabel)
-    ax.grid(True, alpha=0.3)
-    fig.autofmt_xdate()
-    fig.tight_layout()
-    
-    img = BytesIO()
-    fig.savefig(img, format='png')
-    img.seek(0)
-    chart_data = base64.b64encode(img.getvalue()).decode()
-    plt.close(fig)
-    
-    return chart_data
+    return chart_renderer.render(ChartSpec(
+        series=(SeriesSpec.from_frame(df, column, color, style='points'),),
+        figsize=(8, 4),
+        xlabel='Date',
+        ylabel=ylabel,
+        grid=True,
+        rotate_dates=True
+    ))
 
-def create_blood_pressure_chart(df: pd.DataFrame) -> str:
+def create_blood_pressure_chart(df: pd.DataFrame) -> bytes:
     """
     Create a line chart for blood pressure.
     
@@ -209,110 +153,20 @@ def create_blood_pressure_chart(df: pd.DataFrame) -> str:
         df: DataFrame with systolic and diastolic data
         
     Returns:
-        Base64 encoded image
-    """
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.plot(df['date'], df['systolic'], 'o-', color='red', label='Systolic')
-    ax.plot(df['date'], df['diastolic'], 'o-', color='blue', label='Diastolic')
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Blood Pressure (mmHg)')
-    ax.grid(True, alpha=0.3)
-    ax.legend()
-    fig.autofmt_xdate()
-    fig.tight_layout()
-    
-    img = BytesIO()
-    fig.savefig(img, format='png')
-    img.seek(0)
-    chart_data = base64.b64encode(img.getvalue()).decode()
-    plt.close(fig)
-    
-    return chart_data
-
-def calculate_trend(metric_type: str, current_record: Optional[HealthData]) -> Dict[str, Any]:
-    """
-    Calculate the trend for a health metric compared to the previous week.
-    
-    Args:
-        metric_type: The type of health metric (e.g., 'weight', 'blood_pressure')
-        current_record: The most recent health data record
-        
-    Returns:
-        Dictionary containing trend data including value, percentage, and direction
+        PNG image bytes
     """
-    trend = {
-        'value': 0,
-        'percentage': 0,
-        'direction': 'neutral'
-    }
-    
-    if not current_record:
-        return trend
-    
-    # Get the date from one week ago
-    one_week_ago = datetime.now() - timedelta(days=7)
-    
-    try:
-        # Get the health data record from one week ago
-        previous_record = HealthData.query.filter(HealthData.date < one_week_ago).order_by(HealthData.date.desc()).first()
-        
-        if not previous_record:
-            return trend
-        
-        if metric_type == 'weight':
-            if current_record.weight and previous_record.weight:
-                trend['value'] = round(current_record.weight - previous_record.weight, 1)
-                trend['percentage'] = round((trend['value'] / previous_record.weight) * 100, 1) if previous_record.weight else 0
-        
-        elif metric_type == 'blood_pressure':
-            if (current_record.blood_pressure_systolic and previous_record.blood_pressure_systolic and
-                current_record.blood_pressure_diastolic and previous_record.blood_pressure_diastolic):
-                
-                # Calculate trend for systolic
-                systolic_diff = current_record.blood_pressure_systolic - previous_record.blood_pressure_systolic
-                systolic_perc = round((systolic_diff / previous_record.blood_pressure_systolic) * 100, 1) if previous_record.blood_pressure_systolic else 0
-                
-                # Calculate trend for diastolic
-                diastolic_diff = current_record.blood_pressure_diastolic - previous_record.blood_pressure_diastolic
-                diastolic_perc = round((diastolic_diff / previous_record.blood_pressure_diastolic) * 100, 1) if previous_record.blood_pressure_diastolic else 0
-                
-                # Use average of systolic and diastolic trends
-                trend['value'] = round((systolic_diff + diastolic_diff) / 2, 1)
-                trend['percentage'] = round((systolic_perc + diastolic_perc) / 2, 1)
-        
-        elif metric_type == 'heart_rate':
-            if current_record.heart_rate and previous_record.heart_rate:
-                trend['value'] = current_record.heart_rate - previous_record.heart_rate
-                trend['percentage'] = round((trend['value'] / previous_record.heart_rate) * 100, 1) if previous_record.heart_rate else 0
-        
-        elif metric_type == 'oxygen_saturation':
-            if current_record.oxygen_saturation and previous_record.oxygen_saturation:
-                trend['value'] = round(current_record.oxygen_saturation - previous_record.oxygen_saturation, 1)
-                trend['percentage'] = round((trend['value'] / previous_record.oxygen_saturation) * 100, 1) if previous_record.oxygen_saturation else 0
-        
-        elif metric_type == 'temperature':
-            if current_record.temperature and previous_record.temperature:
-                trend['value'] = round(current_record.temperature - previous_record.temperature, 1)
-                trend['percentage'] = round((trend['value'] / previous_record.temperature) * 100, 1) if previous_record.temperature else 0
-        
-        elif metric_type == 'sleep':
-            if current_record.sleep_duration and previous_record.sleep_duration:
-                trend['value'] = round(current_record.sleep_duration - previous_record.sleep_duration, 1)
-                trend['percentage'] = round((trend['value'] / previous_record.sleep_duration) * 100, 1) if previous_record.sleep_duration else 0
-        
-        # Determine direction
-        if trend['value'] > 0:
-            trend['direction'] = 'up'
-        elif trend['value'] < 0:
-            trend['direction'] = 'down'
-        else:
-            trend['direction'] = 'neutral'
-            
-    except Exception as e:
-        current_app.logger.error(f"Error calculating {metric_type} trend: {str(e)}")
-        trend = {'value': 0, 'percentage': 0, 'direction': 'neutral'}
-    
-    return trend
+    return chart_renderer.render(ChartSpec(
+        series=(
+            SeriesSpec.from_frame(df, 'systolic', 'red', 'Systolic', 'points'),
+            SeriesSpec.from_frame(df, 'diastolic', 'blue', 'Diastolic', 'points')
+        ),
+        figsize=(8, 4),
+        xlabel='Date',
+        ylabel='Blood Pressure (mmHg)',
+        legend=True,
+        grid=True,
+        rotate_dates=True
+    ))
 
 @main.route('/about')
 def about() -> str:
@@ -337,13 +191,9 @@ def profile() -> Union[str, Response]:
     
     if form.validate_on_submit():
         try:
-            # Update user profile with form data
-            current_user.first_name = sanitize_input(form.first_name.data)
-            current_user.last_name = sanitize_input(form.last_name.data)
-            current_user.gender = form.gender.data
+            # Update the profile fields stored on the User model
+            current_user.gender = form.gender.data or None
             current_user.date_of_birth = form.date_of_birth.data
-            current_user.height = form.height.data
-            current_user.weight = form.weight.data
             
             db.session.commit()
             
@@ -362,12 +212,8 @@ def profile() -> Union[str, Response]:
     
     elif request.method == 'GET':
         # Pre-populate form with user data
-        form.first_name.data = current_user.first_name
-        form.last_name.data = current_user.last_name
         form.gender.data = current_user.gender
         form.date_of_birth.data = current_user.date_of_birth
-        form.height.data = current_user.height
-        form.weight.data = current_user.weight
     
     return render_template('main/profile.html', 
                           title='Your Profile',
@@ -391,15 +237,11 @@ def settings() -> Union[str, Response]:
     
     if form.validate_on_submit():
         try:
-            # Update settings with form data
+            # Update the preferences stored on the UserSettings model
             settings = current_user.settings
-            settings.weight_unit = form.weight_unit.data
-            settings.height_unit = form.height_unit.data
-            settings.temperature_unit = form.temperature_unit.data
-            settings.distance_unit = form.distance_unit.data
-            settings.volume_unit = form.volume_unit.data
-            settings.theme = form.theme.data
-            settings.notifications_enabled = form.notifications_enabled.data
+            settings.dark_mode = form.dark_mode.data
+            settings.show_baselines = form.show_baselines.data
+            settings.notification_enabled = form.notifications_enabled.data
             
             db.session.commit()
             
@@ -419,21 +261,14 @@ def settings() -> Union[str, Response]:
     elif request.method == 'GET':
         # Pre-populate form with current settings
         settings = current_user.settings
-        form.weight_unit.data = settings.weight_unit
-        form.height_unit.data = settings.height_unit
-        form.temperature_unit.data = settings.temperature_unit
-        form.distance_unit.data = settings.distance_unit
-        form.volume_unit.data = settings.volume_unit
-        form.theme.data = settings.theme
-        form.notifications_enabled.data = settings.notifications_enabled
-    
-    # Get unit options for the template
-    unit_options = UserSettings.get_unit_options()
+        form.dark_mode.data = settings.dark_mode
+        form.show_baselines.data = settings.show_baselines
+        form.notifications_enabled.data = settings.notification_enabled
     
     return render_template('main/settings.html', 
                           title='Your Settings',
                           form=form,
-                          unit_options=unit_options)
+                          delete_form=DeleteAccountForm())
 
 @main.route('/delete-account', methods=['GET', 'POST'])
 @login_required
@@ -456,8 +291,8 @@ def delete_account() -> Union[str, Response]:
             # Get username for logging
             username = current_user.username
             
-            # Delete the user account (this will cascade to all related records)
-            current_user.delete_account()
+            # Delete the user account with all of their data
+            write_queue.run(delete_user_account, current_user.id)
             
             # Log the account deletion
             current_app.logger.info(f"User account deleted: {username}")
@@ -477,6 +312,8 @@ def delete_account() -> Union[str, Response]:
             current_app.logger.error(f"Unexpected error in account deletion: {str(e)}")
             flash('An unexpected error occurred. Please try again.', 'danger')
     
-    return render_template('main/delete_account.html', 
-                          title='Delete Your Account',
-                          form=form) 
\ No newline at end of file
+    # The confirmation form lives in a modal on the settings page
+    for errors in form.errors.values():
+        for error in errors:
+            flash(error, 'danger')
+    return redirect(url_for('main.settings'))
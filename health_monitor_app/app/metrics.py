@@ -0,0 +1,271 @@
+"""
+Request instrumentation for the Health Monitor application.
+
+Every request is timed and broken down into the time spent in SQL
+(counted with SQLAlchemy's cursor events), rendering templates and
+rendering charts. The figures are kept per endpoint in histograms and
+served in the Prometheus text format at /metrics.
+
+A request's figures accumulate in a context variable, so only work done
+on the request's own thread is attributed to it: writes committed by the
+write queue's thread show up in the request's wall time only. Streamed
+responses are timed until the response is returned, not until the last
+chunk is sent.
+"""
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, abort, current_app, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram buckets: seconds, and queries per request
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+# Label of requests that matched no route, so unknown paths add no series
+UNMATCHED = '<unmatched>'
+
+
+@dataclass
+class RequestStats:
+    """Time and queries accumulated by the current request."""
+    started: float
+    queries: int = 0
+    query_seconds: float = 0.0
+    template_seconds: float = 0.0
+    chart_seconds: float = 0.0
+    status: int = 500
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def timed(kind: str) -> Iterator[None]:
+    """
+    Add the time spent in the block to the current request's figures.
+
+    Outside a request, or with metrics disabled, the block just runs.
+
+    Args:
+        kind: 'template' or 'chart'
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if kind == 'template':
+            stats.template_seconds += elapsed
+        else:
+            stats.chart_seconds += elapsed
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with one series per label set.
+
+    Args:
+        name: Metric name
+        help: One-line description
+        labels: Label names
+        buckets: Upper bounds of the buckets, ascending
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, values: Tuple[str, ...], amount: float) -> None:
+        """Record one observation; the caller holds the registry lock."""
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+
+    def expose(self) -> List[str]:
+        """Return the histogram's lines in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, (counts, total) in sorted(self._series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+            cumulative = 0
+            for bound, count in zip([*map(_number, self.buckets), '+Inf'], counts):
+                cumulative += count
+                bucket_labels = ','.join([*labels, f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            suffix = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {_number(total)}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class RequestMetrics:
+    """
+    Collects per-endpoint request metrics and serves them at /metrics.
+
+    Args:
+        app: Flask application instance (optional)
+
+    Attributes:
+        enabled: Whether requests are instrumented
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Wall time of requests.', ('endpoint', 'method'), DURATION_BUCKETS)
+        self.queries = Histogram(
+            'db_queries_per_request', 'SQL statements executed per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.query_seconds = Histogram(
+            'db_query_duration_seconds', 'Time per request spent executing SQL.', ('endpoint',), DURATION_BUCKETS)
+        self.template_seconds = Histogram(
+            'template_render_duration_seconds', 'Time per request spent rendering templates.', ('endpoint',),
+            DURATION_BUCKETS)
+        self.chart_seconds = Histogram(
+            'chart_render_duration_seconds', 'Time per request spent rendering charts.', ('endpoint',),
+            DURATION_BUCKETS)
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Instrument the application's requests and add the /metrics route.
+
+        Uses METRICS_ENABLED, and METRICS_TOKEN: the bearer token /metrics
+        requires. Without a token /metrics answers 404, so the metrics are
+        never public by default.
+
+        Args:
+            app: Flask application instance
+        """
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        app.extensions['request_metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.jinja_env.template_class = TimedTemplate
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            self._listening = True
+
+    def expose(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        Returns:
+            Exposition text ending with a newline
+        """
+        with self._lock:
+            lines = ['# HELP http_requests_total Requests by endpoint, method and status.',
+                     '# TYPE http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",'
+                             f'status="{status}"}} {count}')
+            for histogram in (self.request_seconds, self.queries, self.query_seconds,
+                              self.template_seconds, self.chart_seconds):
+                lines.extend(histogram.expose())
+        return '\n'.join(lines) + '\n'
+
+    def record(self, endpoint: str, method: str, stats: RequestStats, seconds: float) -> None:
+        """
+        Add a finished request to the metrics.
+
+        Args:
+            endpoint: Endpoint name of the matched route
+            method: HTTP method
+            stats: The request's accumulated figures
+            seconds: Wall time of the request
+        """
+        with self._lock:
+            key = (endpoint, method, str(stats.status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self.request_seconds.observe((endpoint, method), seconds)
+            self.queries.observe((endpoint,), stats.queries)
+            self.query_seconds.observe((endpoint,), stats.query_seconds)
+            self.template_seconds.observe((endpoint,), stats.template_seconds)
+            self.chart_seconds.observe((endpoint,), stats.chart_seconds)
+
+    def _before_request(self) -> None:
+        request.environ['health_monitor.metrics'] = _current.set(RequestStats(time.perf_counter()))
+
+    def _after_request(self, response: Response) -> Response:
+        stats = _current.get()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc: Optional[BaseException]) -> None:
+        stats = _current.get()
+        if stats is None:
+            return
+        seconds = time.perf_counter() - stats.started
+        endpoint = request.url_rule.endpoint if request.url_rule is not None else UNMATCHED
+        self.record(endpoint, request.method, stats, seconds)
+        token = request.environ.pop('health_monitor.metrics', None)
+        if token is not None:
+            _current.reset(token)
+
+    def _metrics_view(self) -> Response:
+        token = current_app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        return Response(self.expose(), mimetype='text/plain; version=0.0.4')
+
+
+class TimedTemplate(Template):
+    """Jinja template whose rendering counts towards the request's template time."""
+
+    def render(self, *args: Any, **kwargs: Any) -> str:
+        with timed('template'):
+            return super().render(*args, **kwargs)
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any,
+                           context: Any, executemany: bool) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any,
+                          context: Any, executemany: bool) -> None:
+    stats = _current.get()
+    started = conn.info.get('query_started')
+    if stats is not None and started:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started.pop()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
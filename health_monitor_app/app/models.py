@@ -4,17 +4,52 @@ This module defines the database models using SQLAlchemy ORM.
 """
 # Standard library imports
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Union
-import json
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Mapping, Union, Callable, Sequence, Tuple
 
 # Third-party imports
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.dialects.sqlite import Insert, insert as sqlite_insert
+from sqlalchemy.engine import CursorResult, Dialect
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.sql.compiler import Compiled
 
 # Application imports
 from .extensions import db, login
 
+
+# Compiled upserts kept; keys include the dialect, so a bounded cache
+# also bounds the engines (and their dialects) it keeps alive
+UPSERT_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=UPSERT_CACHE_SIZE)
+def _compile_upsert(build: Callable[..., Insert], dialect: Dialect, keys: Tuple[str, ...], args: tuple) -> Compiled:
+    return build(*args).compile(dialect=dialect, column_keys=list(keys))
+
+
+def execute_upsert(build: Callable[..., Insert], params: Sequence[Dict[str, Any]], *args: Any) -> Optional[CursorResult]:
+    """
+    Execute an SQLite upsert in the current transaction, compiling it once.
+
+    SQLAlchemy 1.4 does not cache statements with an ON CONFLICT clause,
+    so building and executing one per write recompiles it every time.
+
+    Args:
+        build: Module-level function returning the statement without values
+        params: Parameter sets, all with the same keys
+        *args: Hashable arguments for build
+
+    Returns:
+        Result of the execution, None when there were no parameter sets
+    """
+    if not params:
+        return None
+    connection = db.session.connection()
+    return connection.execute(_compile_upsert(build, connection.dialect, tuple(params[0]), args), list(params))
+
+
 class User(UserMixin, db.Model):
     """
     User model representing application users.
@@ -74,6 +109,19 @@ class User(UserMixin, db.Model):
             )
         return None
         
+    def delete_account(self) -> None:
+        """
+        Delete the user and every row holding or derived from their data, without committing.
+
+        Besides the health records this removes the rollups, latest-value
+        snapshot, sync tombstones, idempotency keys, samples, data version
+        and settings, none of which are deleted by a database cascade.
+        """
+        for model in (HealthData, HealthDataDailyRollup, HealthDataWeeklyRollup, UserLatestSnapshot,
+                      HealthDataTombstone, IdempotencyKey, SampleChunk, UserDataVersion, UserSettings):
+            db.session.execute(model.__table__.delete().where(model.__table__.c.user_id == self.id))
+        db.session.execute(User.__table__.delete().where(User.__table__.c.id == self.id))
+
     def initialize_settings(self) -> None:
         """
         Initialize user settings with default values if they don't exist.
@@ -123,7 +171,17 @@ class HealthData(db.Model):
         stress_level: Stress level rating (1-10)
         mood: Mood description
         notes: Additional notes
+        change_seq: The user's data version when the record last changed
     """
+    # Graph, history and dashboard queries all filter by user and date
+    # range; a user has at most one record per timestamp, which the
+    # ingestion upserts rely on (see flask db dedupe for older databases).
+    # The sync API reads a user's changes in change_seq order
+    __table_args__ = (
+        db.Index('ux_health_data_user_date', 'user_id', 'date', unique=True),
+        db.Index('ix_health_data_user_change', 'user_id', 'change_seq'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -155,6 +213,236 @@ class HealthData(db.Model):
     
     # Additional info
     notes = db.Column(db.Text)
+    
+    # Sync; records from before change tracking have 0
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class HealthDataTombstone(db.Model):
+    """
+    Marker left behind by a deleted health data record for the sync API.
+    
+    Attributes:
+        id: Primary key
+        user_id: Foreign key to User model
+        health_data_id: ID the deleted record had
+        date: Date of the deleted record
+        change_seq: The user's data version when the record was deleted
+    """
+    __table_args__ = (
+        db.Index('ix_health_data_tombstone_user_change', 'user_id', 'change_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    health_data_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """
+    Client-supplied key of a health data submission that has been applied.
+
+    A retried submission carrying the same key is answered from this table
+    instead of being inserted again.
+
+    Attributes:
+        user_id: Foreign key to User model (part of the primary key)
+        key: Client-chosen key, unique per user (part of the primary key)
+        health_data_id: ID of the record the submission created
+        created_at: When the submission was first applied
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    health_data_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class UserDataVersion(db.Model):
+    """
+    Per-user counter bumped whenever the user's health data changes.
+    
+    Derived data such as rendered charts is cached under the current
+    version, so bumping it invalidates everything computed from older data.
+    The version a write bumps to is also stamped on the records it changes
+    (HealthData.change_seq), which orders the user's changes for syncing.
+    
+    Attributes:
+        user_id: Foreign key to User model (primary key)
+        version: Number of writes made to the user's health data
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def get(user_id: int) -> int:
+        """
+        Get the current data version for a user.
+        
+        Args:
+            user_id: ID of the user
+            
+        Returns:
+            Current version, 0 if the user has never written data
+        """
+        version = db.session.query(UserDataVersion.version)\
+            .filter(UserDataVersion.user_id == user_id).scalar()
+        return version or 0
+    
+    @staticmethod
+    def bump(user_id: int) -> int:
+        """
+        Increment a user's data version in the current transaction.
+        
+        Uses a single upsert so concurrent first writes cannot collide.
+        
+        Args:
+            user_id: ID of the user whose data changed
+            
+        Returns:
+            The new version
+        """
+        execute_upsert(_bump_statement, [{'user_id': user_id, 'version': 1}])
+        return UserDataVersion.get(user_id)
+
+
+def _bump_statement() -> Insert:
+    table = UserDataVersion.__table__
+    return sqlite_insert(table).on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={'version': table.c.version + 1}
+    )
+
+class RollupMixin:
+    """
+    Columns shared by the health data rollup tables.
+    
+    Each row aggregates one metric of one user's records over one time
+    bucket, in long format so new metrics need no schema change. Means and
+    variances are derived as total / count and sum_squares / count - mean^2.
+    
+    Attributes:
+        user_id: Foreign key to User model
+        metric: Name of the aggregated metric (e.g. 'weight', 'systolic')
+        count: Number of records with a value for the metric
+        total: Sum of the values
+        minimum: Smallest value
+        maximum: Largest value
+        sum_squares: Sum of the squared values
+    """
+    @declared_attr
+    def user_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    metric = db.Column(db.String(32), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    minimum = db.Column(db.Float, nullable=False)
+    maximum = db.Column(db.Float, nullable=False)
+    sum_squares = db.Column(db.Float, nullable=False)
+
+class HealthDataDailyRollup(RollupMixin, db.Model):
+    """
+    Per-day aggregates of each user's health metrics.
+    
+    Attributes:
+        day: Calendar date of the records
+    """
+    # Clustered on the primary key: range reads touch only adjacent pages
+    __table_args__ = (
+        db.PrimaryKeyConstraint('user_id', 'day', 'metric'),
+        {'sqlite_with_rowid': False}
+    )
+    
+    day = db.Column(db.Date, nullable=False)
+
+class HealthDataWeeklyRollup(RollupMixin, db.Model):
+    """
+    Per-week aggregates of each user's health metrics.
+    
+    Attributes:
+        week: Monday of the week the records fall in
+    """
+    # Clustered on the primary key: range reads touch only adjacent pages
+    __table_args__ = (
+        db.PrimaryKeyConstraint('user_id', 'week', 'metric'),
+        {'sqlite_with_rowid': False}
+    )
+    
+    week = db.Column(db.Date, nullable=False)
+
+class SampleChunk(db.Model):
+    """
+    One day of a user's high-frequency samples of one metric.
+
+    Intraday data from wearables (e.g. a heart rate every minute) is kept
+    out of HealthData, which holds one wide row per manual entry. Each
+    chunk stores its sample times and values as delta-encoded, compressed
+    integer arrays (see health_data.samples), alongside aggregates that
+    let coarse reads skip decoding.
+
+    Attributes:
+        user_id: Foreign key to User model
+        metric: Name of the sampled metric (a key of SAMPLE_METRICS)
+        start: Midnight starting the day the samples fall in
+        count: Number of samples in the chunk
+        total: Sum of the values
+        minimum: Smallest value
+        maximum: Largest value
+        times: Encoded sample times, in seconds since start
+        values: Encoded sample values, scaled to integers
+    """
+    # Unlike the rollups this keeps its rowid: chunks are too large for
+    # a clustered index, which works best with rows of a few hundred bytes
+    __table_args__ = (
+        db.PrimaryKeyConstraint('user_id', 'metric', 'start'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    metric = db.Column(db.String(32), nullable=False)
+    start = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    minimum = db.Column(db.Float, nullable=False)
+    maximum = db.Column(db.Float, nullable=False)
+    times = db.Column(db.LargeBinary, nullable=False)
+    values = db.Column(db.LargeBinary, nullable=False)
+
+class UserLatestSnapshot(db.Model):
+    """
+    Latest recorded value of each health metric for a user.
+
+    Kept current by the health data write hooks so the dashboard renders
+    from this single row. Values are tracked per metric, so e.g. weight
+    and heart rate may come from different records when one was left blank.
+
+    Attributes:
+        user_id: Foreign key to User model (primary key)
+        record_count: Number of health data records the user has
+        last_recorded_at: Date of the most recent record
+        <metric>: Latest non-null value of each HealthData metric column
+        <metric>_at: Date of the record that value was taken from
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    last_recorded_at = db.Column(db.DateTime)
+
+    weight = db.Column(db.Float)
+    weight_at = db.Column(db.DateTime)
+    blood_pressure_systolic = db.Column(db.Integer)
+    blood_pressure_systolic_at = db.Column(db.DateTime)
+    blood_pressure_diastolic = db.Column(db.Integer)
+    blood_pressure_diastolic_at = db.Column(db.DateTime)
+    heart_rate = db.Column(db.Integer)
+    heart_rate_at = db.Column(db.DateTime)
+    steps = db.Column(db.Integer)
+    steps_at = db.Column(db.DateTime)
+    sleep_duration = db.Column(db.Float)
+    sleep_duration_at = db.Column(db.DateTime)
+    water_intake = db.Column(db.Float)
+    water_intake_at = db.Column(db.DateTime)
+    calorie_intake = db.Column(db.Integer)
+    calorie_intake_at = db.Column(db.DateTime)
+    stress_level = db.Column(db.Integer)
+    stress_level_at = db.Column(db.DateTime)
 
 class UserSettings(db.Model):
     """
@@ -200,10 +488,32 @@ class MetadataBaseline(db.Model):
     max_value = db.Column(db.Float, nullable=False)
     metadata_json = db.Column(db.Text)  # JSON string with additional metadata
     
+    # Upper age bound (exclusive) of each age group; older users are "70+"
+    AGE_GROUPS = ((30, "18-29"), (40, "30-39"), (50, "40-49"), (60, "50-59"), (70, "60-69"))
+
     @staticmethod
-    def get_baseline(gender: str, age: int, metric_type: str) -> Optional[Dict[str, Any]]:
+    def age_group_for(age: int) -> str:
+        """
+        Map an age to the age group baselines are stored under.
+
+        Args:
+            age: Age in years
+
+        Returns:
+            Age group label
+        """
+        for bound, age_group in MetadataBaseline.AGE_GROUPS:
+            if age < bound:
+                return age_group
+        return "70+"
+
+    @staticmethod
+    def get_baseline(gender: str, age: int, metric_type: str) -> Optional[Mapping[str, Any]]:
         """
         Get baseline data for a specific gender, age and metric.
+
+        Served from the in-memory baseline index; use
+        ``baseline_index.for_demographic`` to get every metric at once.
         
         Args:
             gender: User gender
@@ -211,44 +521,8 @@ class MetadataBaseline(db.Model):
             metric_type: Type of health metric
             
         Returns:
-            Dictionary with baseline data or None if not found
-        """
-        # Map age to age group
-        age_group = None
-        if age < 30:
-            age_group = "18-29"
-        elif age < 40:
-            age_group = "30-39"
-        elif age < 50:
-            age_group = "40-49"
-        elif age < 60:
-            age_group = "50-59"
-        elif age < 70:
-            age_group = "60-69"
-        else:
-            age_group = "70+"
-            
-        baseline = MetadataBaseline.query.filter_by(
-            gender=gender,
-            age_group=age_group,
-            metric_type=metric_type
-        ).first()
-        
-        if not baseline:
-            return None
-            
-        result = {
-            "avg": baseline.avg_value,
-            "min": baseline.min_value,
-            "max": baseline.max_value
-        }
-        
-        # Add metadata if available
-        if baseline.metadata_json:
-            try:
-                metadata = json.loads(baseline.metadata_json)
-                result.update(metadata)
-            except json.JSONDecodeError:
-                pass
-                
-        return result 
\ No newline at end of file
+            Read-only mapping with baseline data or None if not found
+        """
+        from .extensions import baseline_index
+
+        return baseline_index.get(gender, age, metric_type)
@@ -0,0 +1,282 @@
+"""
+Slow-query log for the Health Monitor application.
+
+Every statement is timed with SQLAlchemy's cursor events, and one that
+takes SLOW_QUERY_MS or longer is logged as a warning with its SQL, the
+number and types of its parameters (their values, which hold health data
+and user IDs, only with SLOW_QUERY_LOG_PARAMETERS), the request (or
+thread) that ran it and, on SQLite, its
+``EXPLAIN QUERY PLAN``, which shows whether it used an index or scanned
+a whole table. A statement that keeps being slow is logged at most once
+per SLOW_QUERY_LOG_INTERVAL seconds, with the number of slow runs that
+were not logged in between.
+
+``explain_hot_queries`` runs the queries behind the history page, the
+graphs and the dashboard for a user and returns their plans, for the
+``flask db explain-hot`` check.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Distinct statements whose last log time is remembered for rate limiting
+RATE_LIMIT_ENTRIES = 256
+
+# Longest parameter list written to the log, in characters
+MAX_PARAMETERS_LENGTH = 500
+
+# A plan step reading every row of a table, or every entry of one of its
+# indexes; SEARCH steps read only the rows an index narrows them to
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+class QueryPlan(NamedTuple):
+    """A statement run by a hot query and the plan SQLite chose for it."""
+    query: str
+    statement: str
+    plan: List[str]
+    full_scans: List[str]
+
+
+def explain_query_plan(dbapi_connection: Any, statement: str, parameters: Any = ()) -> List[str]:
+    """
+    Ask SQLite how it would run a statement.
+
+    Args:
+        dbapi_connection: sqlite3 connection
+        statement: SQL statement
+        parameters: The statement's parameters
+
+    Returns:
+        The plan's steps, indented by depth
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depths: Dict[int, int] = {}
+    steps = []
+    for node, parent, _, detail in rows:
+        depths[node] = depths.get(parent, -1) + 1
+        steps.append('  ' * depths[node] + detail)
+    return steps
+
+
+def full_scans(plan: Sequence[str], tables: Sequence[str]) -> List[str]:
+    """
+    Find the steps of a plan that scan a whole table.
+
+    Args:
+        plan: Steps from explain_query_plan()
+        tables: Names of the database's tables; scans of subquery
+            results are not table scans
+
+    Returns:
+        The offending steps
+    """
+    scans = []
+    for step in plan:
+        match = FULL_SCAN.match(step.strip())
+        if match and match.group(1) in tables:
+            scans.append(step.strip())
+    return scans
+
+
+class SlowQueryLog:
+    """
+    Times statements on an engine and logs the slow ones.
+
+    Args:
+        threshold: Seconds from which a statement is logged
+        interval: Seconds between two log entries for the same statement
+        explain: Whether to add the query plan (SQLite only)
+        log_parameters: Whether to log parameter values rather than only
+            their number and types
+    """
+
+    def __init__(self, threshold: float, interval: float, explain: bool, log_parameters: bool = False):
+        self.threshold = threshold
+        self.interval = interval
+        self.explain = explain
+        self.log_parameters = log_parameters
+        # statement -> [time last logged, slow runs since then]
+        self._logged: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def before_cursor_execute(self, conn: Any, cursor: Any, statement: str, parameters: Any,
+                              context: Any, executemany: bool) -> None:
+        conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn: Any, cursor: Any, statement: str, parameters: Any,
+                             context: Any, executemany: bool) -> None:
+        started = conn.info.get('slow_query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        if elapsed < self.threshold:
+            return
+        suppressed = self._suppressed(statement)
+        if suppressed is None:
+            return
+
+        rows = len(parameters) if executemany and parameters else None
+        if rows:
+            parameters = parameters[0]
+        described = _shorten(repr(parameters)) if self.log_parameters else _parameter_types(parameters)
+        lines = [f'Slow query ({elapsed * 1000:.1f} ms) in {_caller()}: {statement}',
+                 f'Parameters: {described}' + (f' (first of {rows} rows)' if rows else '')]
+        if suppressed:
+            lines.append(f'{suppressed} more slow runs of this statement were not logged')
+        if self.explain and conn.dialect.name == 'sqlite':
+            try:
+                plan = explain_query_plan(cursor.connection, statement, parameters)
+                if plan:
+                    lines.append('Query plan:\n' + '\n'.join(plan))
+            except Exception as e:
+                lines.append(f'Query plan unavailable: {e}')
+        logger.warning('\n'.join(lines))
+
+    def _suppressed(self, statement: str) -> Optional[int]:
+        # Number of unlogged slow runs since the statement was last logged,
+        # or None if it was logged too recently to log it again
+        now = time.monotonic()
+        with self._lock:
+            entry = self._logged.get(statement)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return None
+            self._logged[statement] = [now, 0]
+            self._logged.move_to_end(statement)
+            while len(self._logged) > RATE_LIMIT_ENTRIES:
+                self._logged.popitem(last=False)
+        return int(entry[1]) if entry is not None else 0
+
+
+def install_slow_query_log(engine: Engine, config: Dict[str, Any]) -> Optional[SlowQueryLog]:
+    """
+    Start logging an engine's slow statements.
+
+    Args:
+        engine: SQLAlchemy engine
+        config: Application configuration with SLOW_QUERY_MS,
+            SLOW_QUERY_LOG_INTERVAL, SLOW_QUERY_EXPLAIN and SLOW_QUERY_LOG_PARAMETERS
+
+    Returns:
+        The installed log, or None if SLOW_QUERY_MS is None
+    """
+    if config.get('SLOW_QUERY_MS') is None:
+        return None
+    slow_log = SlowQueryLog(config['SLOW_QUERY_MS'] / 1000, config.get('SLOW_QUERY_LOG_INTERVAL', 60),
+                            config.get('SLOW_QUERY_EXPLAIN', True), config.get('SLOW_QUERY_LOG_PARAMETERS', False))
+    event.listen(engine, 'before_cursor_execute', slow_log.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', slow_log.after_cursor_execute)
+    return slow_log
+
+
+def hot_queries(user_id: int) -> List[Tuple[str, Callable[[], Any]]]:
+    """
+    List the queries behind the busiest pages, as callables.
+
+    Args:
+        user_id: User whose data the queries read
+
+    Returns:
+        (name, callable) pairs
+    """
+    from .health_data.pagination import paginate_history
+    from .health_data.queries import PARAMETER_COLUMNS, fetch_window, has_health_data
+    from .health_data.rollups import fetch_rollup_series
+    from .health_data.samples import read_samples
+    from .health_data.snapshots import fetch_snapshot
+    from .health_data.sync import fetch_changes
+    from .models import HealthData
+
+    per_page = current_app.config.get('HISTORY_PER_PAGE', 10)
+    end = datetime.now()
+    start = end - timedelta(days=90)
+
+    def history_pages() -> None:
+        first = paginate_history(user_id, None, per_page, with_total=True)
+        if first.next_cursor:
+            paginate_history(user_id, first.next_cursor, per_page)
+
+    return [
+        ('history page', history_pages),
+        ('history page (offset)', lambda: HealthData.query.filter_by(user_id=user_id)
+         .order_by(HealthData.date.desc()).paginate(page=2, per_page=per_page, error_out=False)),
+        ('graph window (rollups)', lambda: fetch_rollup_series(user_id, ['weight'], start.date(), end.date())),
+        ('graph window (raw)', lambda: fetch_window(user_id, PARAMETER_COLUMNS['blood_pressure'], start, end)),
+        ('graph has data', lambda: has_health_data(user_id)),
+        ('graph samples', lambda: read_samples(user_id, 'heart_rate', start, end)),
+        ('dashboard latest values', lambda: fetch_snapshot(user_id)),
+        ('sync page', lambda: fetch_changes(user_id, None, 100)),
+    ]
+
+
+def explain_hot_queries(user_id: int) -> List[QueryPlan]:
+    """
+    Run the hot queries for a user and explain every statement they issue.
+
+    Args:
+        user_id: User whose data the queries read
+
+    Returns:
+        QueryPlan for each statement, in the order they ran
+    """
+    from .extensions import db
+
+    engine = db.engine
+    captured: List[Tuple[str, str, Any]] = []
+    current: List[str] = []
+
+    def capture(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.append((current[0], statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        for name, run in hot_queries(user_id):
+            current[:] = [name]
+            run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    tables = list(db.metadata.tables)
+    plans = []
+    connection = db.session.connection().connection
+    for name, statement, parameters in captured:
+        plan = explain_query_plan(connection, statement, parameters)
+        plans.append(QueryPlan(name, ' '.join(statement.split()), plan, full_scans(plan, tables)))
+    return plans
+
+
+def _caller() -> str:
+    if has_request_context():
+        return f'{request.method} {request.path} ({request.endpoint})'
+    return f'thread {threading.current_thread().name}'
+
+
+def _parameter_types(parameters: Any) -> str:
+    # Number and types of a statement's parameters, without their values
+    if isinstance(parameters, dict):
+        types = [f'{name}: {type(value).__name__}' for name, value in parameters.items()]
+    else:
+        types = [type(value).__name__ for value in parameters or ()]
+    return _shorten(f'{len(types)} ({", ".join(types)})')
+
+
+def _shorten(text: str) -> str:
+    return text if len(text) <= MAX_PARAMETERS_LENGTH else text[:MAX_PARAMETERS_LENGTH - 3] + '...'
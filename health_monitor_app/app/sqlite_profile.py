@@ -0,0 +1,101 @@
+"""
+SQLite engine profile for the Health Monitor application.
+
+SQLite's defaults suit a single short-lived process: a rollback journal
+that blocks readers while a write commits, an fsync on every commit and a
+2 MB page cache. ``configure_engine_options`` gives SQLite file databases
+a connection pool, so connections (and their page cache and memory map)
+outlive a request, and ``install_profile`` applies the ``SQLITE_*``
+pragmas to every new connection: WAL lets readers run alongside the one
+writer, ``synchronous=NORMAL`` only syncs at checkpoints in WAL mode, and
+``busy_timeout`` makes a writer wait for the lock instead of failing with
+``database is locked``.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# Config key and pragma name of each setting, in the order they are applied
+PROFILE_PRAGMAS = (
+    ('SQLITE_BUSY_TIMEOUT', 'busy_timeout'),
+    ('SQLITE_JOURNAL_MODE', 'journal_mode'),
+    ('SQLITE_SYNCHRONOUS', 'synchronous'),
+    ('SQLITE_CACHE_SIZE', 'cache_size'),
+    ('SQLITE_MMAP_SIZE', 'mmap_size'),
+    ('SQLITE_TEMP_STORE', 'temp_store')
+)
+
+
+def is_sqlite_file(uri: str) -> bool:
+    """
+    Check whether a database URI names an SQLite database file.
+
+    Args:
+        uri: SQLAlchemy database URI
+
+    Returns:
+        True for SQLite URIs other than in-memory databases
+    """
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') != 'sqlite:'
+
+
+def configure_engine_options(app: Flask) -> None:
+    """
+    Pool connections to an SQLite database file.
+
+    SQLAlchemy opens a new connection per checkout for SQLite files by
+    default, which throws away the page cache and memory map each time.
+    Must run before the database extension is initialised; explicit
+    SQLALCHEMY_ENGINE_OPTIONS take precedence.
+
+    Args:
+        app: Flask application instance
+    """
+    if not is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']) or not app.config.get('SQLITE_POOL_SIZE'):
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('poolclass', QueuePool)
+    options.setdefault('pool_size', app.config['SQLITE_POOL_SIZE'])
+    # Pooled connections move between request threads, one at a time
+    options.setdefault('connect_args', {}).setdefault('check_same_thread', False)
+
+
+def profile_pragmas(config: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """
+    Return the pragmas to apply for a configuration.
+
+    Args:
+        config: Application configuration
+
+    Returns:
+        (pragma, value) pairs for every SQLITE_* setting that is not None
+    """
+    return [(pragma, config[key]) for key, pragma in PROFILE_PRAGMAS if config.get(key) is not None]
+
+
+def install_profile(engine: Engine, config: Dict[str, Any]) -> None:
+    """
+    Apply the configured pragmas to each new connection of an engine.
+
+    Does nothing for engines that are not SQLite.
+
+    Args:
+        engine: SQLAlchemy engine
+        config: Application configuration with the SQLITE_* settings
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    statements = [f'PRAGMA {pragma}={value}' for pragma, value in profile_pragmas(config)]
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
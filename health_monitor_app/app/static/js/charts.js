@@ -0,0 +1,102 @@
+/**
+ * Health Monitor App - Client-side charts
+ * Draws graphs with Chart.js from the /api/series JSON endpoint and tidies
+ * up server-rendered chart images that have nothing to show
+ */
+
+function formatChartDate(timestamp, compact) {
+    const date = new Date(timestamp);
+    return compact
+        ? date.toLocaleDateString(undefined, { month: 'short', day: 'numeric', timeZone: 'UTC' })
+        : date.toLocaleString(undefined, { month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit', timeZone: 'UTC' });
+}
+
+function showChartFallback(canvas) {
+    canvas.classList.add('d-none');
+    const fallback = canvas.parentElement.querySelector('.chart-fallback');
+    if (fallback) {
+        fallback.classList.remove('d-none');
+    }
+}
+
+function renderSeriesChart(canvas) {
+    const compact = canvas.dataset.compact === 'true';
+
+    fetch(canvas.dataset.seriesUrl, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Series request failed: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            const hasValues = data.styles.some(style => data.series[style.column].some(v => v !== null));
+
+            // Previews are hidden entirely when there is nothing to draw
+            if (compact && (data.t.length < 2 || !hasValues)) {
+                removeChartCard(canvas);
+                return;
+            }
+
+            const datasets = data.styles.map(style => ({
+                label: style.label || data.ylabel,
+                data: data.series[style.column],
+                borderColor: style.color,
+                backgroundColor: style.color,
+                borderWidth: compact ? 1.5 : 2,
+                pointRadius: compact ? 0 : 3,
+                spanGaps: true
+            }));
+
+            new Chart(canvas, {
+                type: data.kind === 'bar' ? 'bar' : 'line',
+                data: {
+                    labels: data.t.map(t => formatChartDate(t, compact)),
+                    datasets: datasets
+                },
+                options: {
+                    animation: false,
+                    aspectRatio: compact ? 2 : 10 / 6,
+                    plugins: {
+                        legend: { display: !compact && datasets.length > 1 },
+                        title: { display: compact, text: canvas.dataset.title || '', font: { size: 11 } }
+                    },
+                    scales: {
+                        x: { ticks: { maxTicksLimit: compact ? 4 : 10, font: { size: compact ? 9 : 12 } } },
+                        y: {
+                            title: { display: !compact, text: data.ylabel },
+                            ticks: { maxTicksLimit: compact ? 4 : 8, font: { size: compact ? 9 : 12 } }
+                        }
+                    }
+                }
+            });
+        })
+        .catch(error => {
+            console.error(error);
+            showChartFallback(canvas);
+        });
+}
+
+function removeChartCard(element) {
+    const card = element.closest('[data-chart-card]');
+    if (card) {
+        card.remove();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Chart image routes answer 404 when there is nothing to draw
+    document.querySelectorAll('img[data-chart-image]').forEach(img => {
+        if (img.complete && img.naturalWidth === 0) {
+            removeChartCard(img);
+        } else {
+            img.addEventListener('error', () => removeChartCard(img));
+        }
+    });
+
+    if (typeof Chart === 'undefined') {
+        document.querySelectorAll('canvas[data-series-url]').forEach(showChartFallback);
+        return;
+    }
+    document.querySelectorAll('canvas[data-series-url]').forEach(renderSeriesChart);
+});
@@ -0,0 +1,240 @@
+"""
+In-process write queue for the Health Monitor application.
+
+SQLite allows one writer at a time. When request threads each commit on
+their own, they queue up on the database lock with a commit (and an
+fsync) apiece. The write queue hands writes to a single writer thread
+instead, which runs whatever has queued up since its last commit in one
+transaction, each write in its own savepoint so a failing write does not
+take the others down, and then commits once. While writes keep arriving
+concurrently it also waits up to WRITE_QUEUE_WINDOW_MS for more to join
+the transaction. Callers block on a future and get their own result or
+exception back.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+logger = logging.getLogger(__name__)
+
+# A queued write: the function, its arguments and the caller's future
+Job = Tuple[Callable[..., Any], tuple, Dict[str, Any], Future]
+
+
+class WriteQueueTimeout(Exception):
+    """Raised when a queued write is not committed within WRITE_QUEUE_TIMEOUT."""
+
+
+class WriteQueue:
+    """
+    Serializes database writes on one thread and commits them in groups.
+
+    Write functions run inside an application context on the writer
+    thread, use ``db.session`` and must not commit. When the queue is
+    disabled, run() executes the write and commits in the calling thread.
+
+    Args:
+        db: Database extension whose session the writes use
+        app: Flask application instance (optional)
+
+    Attributes:
+        enabled: Whether writes go through the writer thread
+        max_batch: Most writes committed in one transaction
+        window: Seconds a transaction waits for more writes under load
+        timeout: Seconds a caller waits for its write to be committed
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+        self.enabled = False
+        self.max_batch = 64
+        self.window = 0.005
+        self.timeout = 10.0
+        self._app: Optional[Flask] = None
+        self._queue: 'queue.Queue[Optional[Job]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        self.commits = 0
+        self.writes = 0
+        self.failures = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Configure the queue from application settings.
+
+        Uses WRITE_QUEUE_ENABLED, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_WINDOW_MS
+        and WRITE_QUEUE_TIMEOUT.
+
+        Args:
+            app: Flask application instance
+        """
+        self.shutdown()
+        self.enabled = app.config.get('WRITE_QUEUE_ENABLED', False)
+        self.max_batch = app.config.get('WRITE_QUEUE_MAX_BATCH', 64)
+        self.window = app.config.get('WRITE_QUEUE_WINDOW_MS', 5) / 1000
+        self.timeout = app.config.get('WRITE_QUEUE_TIMEOUT', 10.0)
+        self.commits = self.writes = self.failures = 0
+        self._app = app
+        app.extensions['write_queue'] = self
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a write and wait until it is committed.
+
+        Args:
+            fn: Write function; uses db.session and does not commit
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            fn's return value
+
+        Raises:
+            WriteQueueTimeout: If the write is not committed in time
+            Exception: Whatever fn or the commit raised
+        """
+        if not self.enabled:
+            session = self.db.session
+            try:
+                result = fn(*args, **kwargs)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            return result
+
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Still queued writes are skipped; one already running commits
+            future.cancel()
+            raise WriteQueueTimeout(f"Write not committed within {self.timeout}s")
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        Queue a write without waiting for it.
+
+        Args:
+            fn: Write function; uses db.session and does not commit
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            Future resolved with fn's result once the write is committed
+        """
+        future: Future = Future()
+        self._ensure_writer()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return queue counters.
+
+        Returns:
+            Dictionary with commits, writes, failures and queued
+        """
+        return {
+            'commits': self.commits,
+            'writes': self.writes,
+            'failures': self.failures,
+            'queued': self._queue.qsize()
+        }
+
+    def shutdown(self) -> None:
+        """Stop the writer thread once the writes queued so far are committed."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._write_loop, args=(self._queue,), name='write-queue', daemon=True
+                )
+                self._thread.start()
+                if not self._atexit_registered:
+                    atexit.register(self.shutdown)
+                    self._atexit_registered = True
+
+    def _write_loop(self, jobs: 'queue.Queue[Optional[Job]]') -> None:
+        previous = 0
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            # Under load (the last commit was shared) keep the transaction
+            # open for up to the window after its first write, running writes
+            # as they arrive; a lone writer commits straight away
+            deadline = time.monotonic() + (self.window if previous > 1 else 0.0)
+            previous, stop = self._commit(job, jobs, deadline)
+            if stop:
+                return
+
+    def _commit(self, job: Job, jobs: 'queue.Queue[Optional[Job]]', deadline: float) -> Tuple[int, bool]:
+        # Run job and whatever follows it until the deadline or max_batch in
+        # one transaction; return the number of jobs taken and whether the
+        # queue was shut down meanwhile
+        batch: List[Job] = []
+        done: List[Tuple[Future, Any]] = []
+        stop = False
+        with self._app.app_context():
+            session = self.db.session
+            try:
+                if self.db.engine.dialect.name == 'sqlite':
+                    # Take the write lock up front rather than failing to
+                    # upgrade a read lock halfway through the batch
+                    session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+                while True:
+                    batch.append(job)
+                    fn, args, kwargs, future = job
+                    if future.set_running_or_notify_cancel():
+                        try:
+                            with session.begin_nested():
+                                result = fn(*args, **kwargs)
+                        except Exception as e:
+                            self.failures += 1
+                            future.set_exception(e)
+                        else:
+                            done.append((future, result))
+                    if len(batch) >= self.max_batch:
+                        break
+                    remaining = deadline - time.monotonic()
+                    try:
+                        job = jobs.get(timeout=remaining) if remaining > 0 else jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stop = True
+                        break
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Write queue commit of {len(batch)} writes failed: {e}")
+                self.failures += len(done)
+                # Writes that already failed keep their own exception
+                for fn, args, kwargs, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return len(batch), stop
+        self.commits += 1
+        self.writes += len(done)
+        for future, result in done:
+            future.set_result(result)
+        return len(batch), stop
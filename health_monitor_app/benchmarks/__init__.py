@@ -0,0 +1,7 @@
+"""
+Benchmarks for the Health Monitor application.
+
+Each module can be run from the ``health_monitor_app`` directory, e.g.
+``python -m benchmarks.bench_graph_window``. Benchmarks use throwaway
+SQLite databases and never touch the instance database.
+"""
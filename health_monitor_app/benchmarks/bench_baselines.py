@@ -0,0 +1,114 @@
+"""
+Benchmark demographic baseline lookups.
+
+The MetadataBaseline table is seeded the way db_setup.py does (two
+genders, six age groups, five metrics, with metadata JSON), and the cost
+of one call is measured for:
+
+* query: a filtered query and ``json.loads`` per call, as get_baseline
+  used to do
+* index get: ``baseline_index.get`` for one metric
+* index batch: ``baseline_index.for_demographic`` for all of a user's
+  metrics at once
+
+plus the dashboard's three lookups done each way.
+
+Usage:
+    python -m benchmarks.bench_baselines [--calls 2000]
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.extensions import baseline_index, db
+from app.models import MetadataBaseline
+
+from .common import create_bench_app, print_table
+
+GENDERS = ('male', 'female')
+METRICS = ('weight', 'heart_rate', 'blood_pressure', 'steps', 'sleep_duration')
+DASHBOARD_METRICS = ('weight', 'heart_rate', 'steps')
+
+
+def seed_baselines() -> int:
+    """Insert a baseline for every gender, age group and metric; return how many."""
+    age_groups = [age_group for _, age_group in MetadataBaseline.AGE_GROUPS] + ['70+']
+    rows = []
+    for metric_index, metric in enumerate(METRICS):
+        for gender in GENDERS:
+            for group_index, age_group in enumerate(age_groups):
+                low, high = 50.0 + metric_index + group_index, 90.0 + metric_index + group_index
+                rows.append(MetadataBaseline(
+                    gender=gender, age_group=age_group, metric_type=metric,
+                    avg_value=(low + high) / 2, min_value=low, max_value=high,
+                    metadata_json=json.dumps({
+                        'percentile_25': low + (high - low) * 0.25,
+                        'percentile_75': low + (high - low) * 0.75,
+                        'standard_deviation': (high - low) / 4.0,
+                        'sample_size': 1000,
+                        'last_updated': '2024-01-01T00:00:00'
+                    })
+                ))
+    db.session.add_all(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def query_baseline(gender: str, age: int, metric_type: str) -> Optional[Dict[str, Any]]:
+    """Look up a baseline with a query per call, as get_baseline did before the index."""
+    baseline = MetadataBaseline.query.filter_by(
+        gender=gender, age_group=MetadataBaseline.age_group_for(age), metric_type=metric_type
+    ).first()
+    if not baseline:
+        return None
+    result = {'avg': baseline.avg_value, 'min': baseline.min_value, 'max': baseline.max_value}
+    if baseline.metadata_json:
+        result.update(json.loads(baseline.metadata_json))
+    return result
+
+
+def per_call_us(fn: Callable[[], Any], calls: int) -> float:
+    """Return the mean microseconds per call of ``fn`` over ``calls`` calls."""
+    fn()
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_bench_app(CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        count = seed_baselines()
+        gender, age = 'female', 42
+        assert dict(baseline_index.get(gender, age, 'weight')) == query_baseline(gender, age, 'weight')
+
+        def dashboard_query() -> None:
+            for metric in DASHBOARD_METRICS:
+                query_baseline(gender, age, metric)
+
+        def dashboard_index() -> None:
+            demographic = baseline_index.for_demographic(gender, age)
+            for metric in DASHBOARD_METRICS:
+                demographic.get(metric)
+
+        lookups = [
+            ('query', 1, lambda: query_baseline(gender, age, 'weight')),
+            ('index get', 1, lambda: baseline_index.get(gender, age, 'weight')),
+            ('index batch', len(METRICS), lambda: baseline_index.for_demographic(gender, age)),
+            ('dashboard, query', len(DASHBOARD_METRICS), dashboard_query),
+            ('dashboard, index', len(DASHBOARD_METRICS), dashboard_index)
+        ]
+        timings = [(name, metrics, per_call_us(fn, args.calls)) for name, metrics, fn in lookups]
+        print(f'{count} baselines, {args.calls} calls each; index loaded {baseline_index.stats()["loads"]} time(s)')
+        print_table(['lookup', 'metrics', 'us/call'], [(name, metrics, round(us, 2)) for name, metrics, us in timings])
+
+
+if __name__ == '__main__':
+    main()
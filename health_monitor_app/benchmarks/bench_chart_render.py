@@ -0,0 +1,61 @@
+"""
+Benchmark drawing the four history previews inline and in the render pool.
+
+Inline renders the previews one after another in the calling thread, as
+history() used to. The pool submits all four at once and waits for them,
+so they are drawn concurrently by the worker processes; the pool is
+warmed up first, so process start-up is not counted. The speed-up is
+bounded by the number of CPU cores available.
+
+Usage:
+    python -m benchmarks.bench_chart_render [--workers 2 4] [--days 90]
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from app.chart_render import ChartRenderer, ChartSpec, SeriesSpec, draw_chart
+
+from .common import create_bench_app, print_table, time_call
+
+PREVIEW_COLORS = {'weight': 'blue', 'heart_rate': 'green', 'steps': 'orange', 'sleep_duration': 'purple'}
+
+
+def preview_specs(days: int) -> list:
+    """Build mini chart specs like mini_chart_spec() for synthetic daily data."""
+    rng = np.random.default_rng(0)
+    x = np.arange(np.datetime64('2024-01-01'), np.datetime64('2024-01-01') + days).astype('datetime64[ns]')
+    return [
+        ChartSpec(series=(SeriesSpec(x, rng.normal(70, 2, days), color),), figsize=(3, 1.5), dpi=80,
+                  title=param.replace('_', ' ').title(), title_size=8, tick_size=6)
+        for param, color in PREVIEW_COLORS.items()
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    specs = preview_specs(args.days)
+    inline = time_call(lambda: [draw_chart(spec) for spec in specs], repeat=args.repeat)
+    results = [('inline', '-', inline['median_ms'], 1.0)]
+
+    for workers in args.workers:
+        app = create_bench_app(CHART_RENDER_WORKERS=workers, CHART_RENDER_TIMEOUT=60.0)
+        renderer = ChartRenderer(app)
+        renderer.render_many(specs * workers)  # start and warm every worker
+        pooled = time_call(lambda: renderer.render_many(specs), repeat=args.repeat)
+        results.append(('pool', workers, pooled['median_ms'], inline['median_ms'] / pooled['median_ms']))
+        renderer.shutdown()
+
+    print(f'{os.cpu_count()} CPU cores')
+    print_table(['renderer', 'workers', 'four previews ms', 'speed-up'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark concurrent readers and writers against one SQLite file.
+
+Several worker processes (like WSGI workers) each run writer threads
+posting the add form and reader threads loading the dashboard and
+history pages, all against the same database for a fixed time. Three
+profiles are compared:
+
+* default: SQLite's defaults, a connection per checkout and commits in
+  the request (the original setup)
+* profile: the SQLITE_* pragmas (WAL, synchronous=NORMAL, ...) and a
+  connection pool
+* profile+queue: the same with the in-process write queue enabled
+
+Failed writes are add requests that did not redirect; lock errors are
+the ones whose logged cause was ``database is locked``.
+
+Usage:
+    python -m benchmarks.bench_concurrency [--processes 2] [--writers 4] [--readers 4] [--seconds 10]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.extensions import db
+from app.health_data import rollups, snapshots
+
+from .common import create_bench_app, create_user, logged_in_client, print_table, seed_health_data
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {
+        'SQLITE_JOURNAL_MODE': None, 'SQLITE_SYNCHRONOUS': None, 'SQLITE_CACHE_SIZE': None,
+        'SQLITE_MMAP_SIZE': None, 'SQLITE_BUSY_TIMEOUT': None, 'SQLITE_TEMP_STORE': None,
+        'SQLITE_POOL_SIZE': 0, 'WRITE_QUEUE_ENABLED': False
+    },
+    'profile': {'WRITE_QUEUE_ENABLED': False},
+    'profile+queue': {}
+}
+
+READ_PATHS = ('/dashboard', '/history')
+
+
+class LockErrorCounter(logging.Handler):
+    """Counts logged errors caused by a locked database."""
+
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if 'database is locked' in record.getMessage():
+            self.count += 1
+
+
+def run_worker(db_path: str, profile: str, user_id: int, writers: int, readers: int,
+               start_at: float, seconds: float) -> Tuple[List[float], List[float], int, int, int]:
+    """Run one worker process; return write and read latencies (ms), failures and lock errors."""
+    app = create_bench_app(db_path, CHART_RENDER_WORKERS=0, **PROFILES[profile])
+    counter = LockErrorCounter()
+    app.logger.addHandler(counter)
+    write_ms: List[float] = []
+    read_ms: List[float] = []
+    failures = {'write': 0, 'read': 0}
+    lock = threading.Lock()
+
+    def writer(index: int) -> None:
+        client = logged_in_client(app, user_id)
+        i = 0
+        while time.time() < start_at + seconds:
+            form = {'weight': str(70 + (index + i) % 10), 'heart_rate': str(60 + i % 30), 'steps': str(1000 * index + i)}
+            started = time.perf_counter()
+            response = client.post('/add', data=form)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                write_ms.append(elapsed)
+                if response.status_code != 302:
+                    failures['write'] += 1
+            i += 1
+
+    def reader(index: int) -> None:
+        client = logged_in_client(app, user_id)
+        i = index
+        while time.time() < start_at + seconds:
+            started = time.perf_counter()
+            response = client.get(READ_PATHS[i % len(READ_PATHS)])
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                read_ms.append(elapsed)
+                if response.status_code != 200:
+                    failures['read'] += 1
+            i += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    time.sleep(max(0.0, start_at - time.time()))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    app.extensions['write_queue'].shutdown()
+    return write_ms, read_ms, failures['write'], failures['read'], counter.count
+
+
+def percentiles(values: List[float]) -> Tuple[float, float]:
+    """Return the p50 and p99 of a list of latencies."""
+    if not values:
+        return float('nan'), float('nan')
+    return float(np.percentile(values, 50)), float(np.percentile(values, 99))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--writers', type=int, default=4, help='writer threads per process')
+    parser.add_argument('--readers', type=int, default=4, help='reader threads per process')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--history', type=int, default=10000, help='seeded records per user')
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for profile in args.profiles:
+        app = create_bench_app(CHART_RENDER_WORKERS=0, **PROFILES[profile])
+        db_path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+        with app.app_context():
+            user_ids = [create_user(f'bench{i}') for i in range(args.processes)]
+            for user_id in user_ids:
+                seed_health_data(user_id, args.history)
+            rollups.rebuild()
+            snapshots.rebuild()
+            db.session.commit()
+            db.session.remove()
+            db.engine.dispose()
+
+        with context.Pool(args.processes) as pool:
+            # Start all workers together, after they have imported the app
+            start_at = time.time() + 5.0
+            outcomes = pool.starmap(run_worker, [
+                (db_path, profile, user_id, args.writers, args.readers, start_at, args.seconds)
+                for user_id in user_ids
+            ])
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+        write_ms = [ms for outcome in outcomes for ms in outcome[0]]
+        read_ms = [ms for outcome in outcomes for ms in outcome[1]]
+        write_p50, write_p99 = percentiles(write_ms)
+        read_p50, read_p99 = percentiles(read_ms)
+        results.append((
+            profile,
+            round(len(write_ms) / args.seconds, 1), round(write_p50, 1), round(write_p99, 1),
+            round(len(read_ms) / args.seconds, 1), round(read_p50, 1), round(read_p99, 1),
+            sum(outcome[2] for outcome in outcomes) + sum(outcome[3] for outcome in outcomes),
+            sum(outcome[4] for outcome in outcomes)
+        ))
+
+    print_table(['profile', 'writes/s', 'write p50 ms', 'write p99 ms', 'reads/s', 'read p50 ms',
+                 'read p99 ms', 'failed', 'lock errors'], results)
+
+
+if __name__ == '__main__':
+    main()
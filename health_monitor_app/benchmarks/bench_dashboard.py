@@ -0,0 +1,87 @@
+"""
+Benchmark the dashboard's data loading as a user's history grows.
+
+The legacy path is the old dashboard() query set: the five latest
+records, a count() of all records and an ``ORDER BY date DESC LIMIT 1``
+lookup per displayed metric. The snapshot path is the single
+``fetch_snapshot`` lookup. Statements are counted with an engine event.
+
+Usage:
+    python -m benchmarks.bench_dashboard [--sizes 1000 100000 1000000]
+"""
+
+import argparse
+from typing import Any, List
+
+from sqlalchemy import event
+
+from app.extensions import db
+from app.health_data.snapshots import fetch_snapshot, rebuild
+from app.models import HealthData
+
+from .common import create_bench_app, create_user, print_table, seed_health_data, time_call
+
+
+def legacy_dashboard(user_id: int) -> Any:
+    """Reproduce the original dashboard() queries for comparison."""
+    latest_records = HealthData.query.filter_by(user_id=user_id)\
+        .order_by(HealthData.date.desc()).limit(5).all()
+    record_count = HealthData.query.filter_by(user_id=user_id).count()
+    latest = {
+        metric: HealthData.query.filter(HealthData.user_id == user_id, getattr(HealthData, metric).isnot(None))
+        .order_by(HealthData.date.desc()).first()
+        for metric in ('weight', 'steps', 'heart_rate')
+    }
+    return latest_records, record_count, latest
+
+
+def count_statements(fn) -> int:
+    """Run a callable and return the number of SQL statements it executed."""
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, *args) -> None:
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        app = create_bench_app(CHART_RENDER_WORKERS=0)
+        with app.app_context():
+            user_id = create_user('bench')
+            seed_health_data(user_id, size)
+            rebuild(user_id)
+            db.session.commit()
+
+            def legacy() -> None:
+                legacy_dashboard(user_id)
+                db.session.expire_all()
+
+            def snapshot() -> None:
+                fetch_snapshot(user_id)
+                db.session.expire_all()
+
+            legacy_time = time_call(legacy, repeat=args.repeat)
+            snapshot_time = time_call(snapshot, repeat=args.repeat)
+            results.append((size, count_statements(legacy), legacy_time['median_ms'],
+                            count_statements(snapshot), snapshot_time['median_ms']))
+            db.session.remove()
+            db.engine.dispose()
+
+    print_table(['history rows', 'legacy queries', 'legacy ms', 'snapshot queries', 'snapshot ms'], results)
+
+
+if __name__ == '__main__':
+    main()
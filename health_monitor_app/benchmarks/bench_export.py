@@ -0,0 +1,93 @@
+"""
+Benchmark exporting a user's full history.
+
+Each export runs in a fresh process against a seeded database and
+consumes ``/export/<format>`` chunk by chunk through the test client,
+sampling the process's resident set size after every chunk. The
+``naive`` path is the obvious alternative: ``.all()`` into a DataFrame
+and ``to_csv``. Streamed exports should show the same RSS growth at
+every history size; the naive one grows with the number of rows.
+
+Usage:
+    python -m benchmarks.bench_export [--sizes 100000 1000000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from typing import Tuple
+
+import pandas as pd
+
+from app.extensions import db
+from app.health_data.export import EXPORT_COLUMNS, available_formats
+from app.models import HealthData
+
+from .common import create_bench_app, create_user, logged_in_client, print_table, seed_health_data
+
+
+def current_rss_mib() -> float:
+    """Return the current resident set size of this process in MiB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # No procfs: fall back to the peak, which is an upper bound
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_export(db_path: str, user_id: int, fmt: str) -> Tuple[float, float, float, float]:
+    """Export in this process and return (seconds, MiB written, RSS before, peak RSS during)."""
+    app = create_bench_app(db_path, CHART_RENDER_WORKERS=0)
+    client = logged_in_client(app, user_id)
+    baseline = peak = current_rss_mib()
+    written = 0
+    started = time.perf_counter()
+    if fmt == 'naive':
+        with app.app_context():
+            records = HealthData.query.filter_by(user_id=user_id).order_by(HealthData.date.asc()).all()
+            frame = pd.DataFrame([{name: getattr(record, name) for name in EXPORT_COLUMNS} for record in records])
+            peak = max(peak, current_rss_mib())
+            written = len(frame.to_csv(index=False).encode('utf-8'))
+            peak = max(peak, current_rss_mib())
+    else:
+        response = client.get(f'/export/{fmt}', buffered=False)
+        assert response.status_code == 200, response.status
+        for chunk in response.response:
+            written += len(chunk)
+            peak = max(peak, current_rss_mib())
+        response.close()
+    return time.perf_counter() - started, written / 2 ** 20, baseline, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+
+    # One process per export, so each starts from the same baseline RSS
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in args.sizes:
+        app = create_bench_app(CHART_RENDER_WORKERS=0)
+        db_path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+        with app.app_context():
+            user_id = create_user('bench')
+            seed_health_data(user_id, size)
+            db.session.remove()
+            db.engine.dispose()
+
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for fmt in [*available_formats(), 'naive']:
+                seconds, mib, baseline, peak = pool.apply(run_export, (db_path, user_id, fmt))
+                results.append((size, fmt, round(seconds, 2), round(mib, 1), round(baseline, 1),
+                                round(peak, 1), round(peak - baseline, 1)))
+        os.unlink(db_path)
+
+    print_table(['rows', 'format', 'seconds', 'MiB out', 'RSS before', 'RSS peak', 'RSS growth'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark graph statistics: per-parameter pandas vs one NumPy pass.
+
+The legacy path is the old calculate_graph_stats() chain: for the
+requested parameter it calls pandas mean/min/max/iloc[-1] on its column
+and fits np.polyfit to the last three values, so summarizing every
+metric costs one call per parameter. The engine summarizes all metric
+columns with summarize_frame() in one pass and formats each parameter
+with graph_stats(). Both are given the same in-memory DataFrame.
+
+Usage:
+    python -m benchmarks.bench_graph_stats [--sizes 100 10000 1000000]
+"""
+
+import argparse
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from app.health_data.routes import VALID_PARAMETERS
+from app.health_data.stats import TREND_THRESHOLDS, graph_stats, summarize_frame
+
+from .common import print_table, time_call
+
+COLUMNS = ['weight', 'systolic', 'diastolic', 'heart_rate', 'steps',
+           'sleep_duration', 'water_intake', 'calorie_intake', 'stress_level']
+
+
+def synthetic_frame(n_rows: int) -> pd.DataFrame:
+    """Build a DataFrame shaped like fetch_window() output with some gaps."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'date': pd.date_range('2020-01-01', periods=n_rows, freq='h')})
+    for column, (mean, sd) in zip(COLUMNS, [(75, 2), (120, 8), (80, 6), (70, 6), (8000, 2000),
+                                           (7, 1), (2, 0.5), (2200, 300), (5, 2)]):
+        values = rng.normal(mean, sd, n_rows)
+        values[rng.random(n_rows) < 0.1] = np.nan
+        values[-3:] = mean  # the legacy trend fit fails on missing values
+        df[column] = values
+    return df
+
+
+def legacy_column_stats(series: pd.Series, threshold: float) -> Dict[str, Any]:
+    """Reproduce one branch of the legacy if/elif chain."""
+    stats = {
+        'average': round(float(series.mean()), 1),
+        'minimum': round(float(series.min()), 1),
+        'maximum': round(float(series.max()), 1),
+        'latest': round(float(series.iloc[-1]), 1)
+    }
+    recent = series.tail(3)
+    slope = np.polyfit(np.arange(len(recent)), recent.astype(float).values, 1)[0]
+    stats['trend'] = 'up' if slope > threshold else 'down' if slope < -threshold else 'neutral'
+    return stats
+
+
+def legacy_all(df: pd.DataFrame) -> Dict[str, Any]:
+    """Summarize every parameter with one legacy branch call each."""
+    results = {}
+    for parameter in VALID_PARAMETERS:
+        if parameter == 'blood_pressure':
+            results[parameter] = (legacy_column_stats(df['systolic'], TREND_THRESHOLDS['systolic']),
+                                  legacy_column_stats(df['diastolic'], TREND_THRESHOLDS['diastolic']))
+        else:
+            results[parameter] = legacy_column_stats(df[parameter], TREND_THRESHOLDS[parameter])
+    return results
+
+
+def engine_all(df: pd.DataFrame) -> Dict[str, Any]:
+    """Summarize every parameter with one engine pass."""
+    summaries = summarize_frame(df)
+    return {parameter: graph_stats(summaries, parameter) for parameter in VALID_PARAMETERS}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 1000000])
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        df = synthetic_frame(size)
+        legacy = time_call(lambda: legacy_all(df), repeat=args.repeat)
+        engine = time_call(lambda: engine_all(df), repeat=args.repeat)
+        results.append((size, legacy['median_ms'], engine['median_ms'], legacy['median_ms'] / engine['median_ms']))
+
+    print_table(['rows', 'per-parameter pandas ms', 'single pass ms', 'speed-up'], results)
+
+
+if __name__ == '__main__':
+    main()
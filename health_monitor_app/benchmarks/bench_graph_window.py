@@ -0,0 +1,83 @@
+"""
+Benchmark the graph window query as a user's history grows.
+
+Compares the original graph data path (load every record as an ORM
+object, build a DataFrame, then filter to the window in pandas) with the
+range-scoped ``fetch_window`` query backed by the ``(user_id, date)``
+index. Records are seeded one hour apart, so every history size has the
+same number of rows inside the 30-day window.
+
+Usage:
+    python -m benchmarks.bench_graph_window [--sizes 1000 10000 100000 1000000]
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.extensions import db
+from app.health_data.queries import PARAMETER_COLUMNS, fetch_window
+from app.models import HealthData
+
+from .common import create_bench_app, create_user, print_table, seed_health_data, time_call
+
+
+def legacy_window(user_id: int, start_date: datetime, end_date: datetime) -> pd.DataFrame:
+    """Reproduce the original view_graph data path for comparison."""
+    records = HealthData.query.filter_by(user_id=user_id)\
+        .order_by(HealthData.date.asc()).all()
+    df = pd.DataFrame([{
+        'date': record.date,
+        'weight': record.weight,
+        'systolic': record.blood_pressure_systolic,
+        'diastolic': record.blood_pressure_diastolic,
+        'heart_rate': record.heart_rate,
+        'steps': record.steps,
+        'sleep_duration': record.sleep_duration,
+        'water_intake': record.water_intake,
+        'calorie_intake': record.calorie_intake,
+        'stress_level': record.stress_level
+    } for record in records])
+    return df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='skip the legacy path above this many rows')
+    args = parser.parse_args()
+
+    end = datetime.now()
+    start_date = end - timedelta(days=30)
+    results = []
+
+    for size in args.sizes:
+        app = create_bench_app()
+        with app.app_context():
+            user_id = create_user('bench')
+            seed_health_data(user_id, size, end=end)
+            db.session.remove()
+
+            windowed = time_call(
+                lambda: fetch_window(user_id, PARAMETER_COLUMNS['weight'], start_date, end),
+                repeat=args.repeat)
+            rows = len(fetch_window(user_id, PARAMETER_COLUMNS['weight'], start_date, end))
+
+            legacy_ms = 'skipped'
+            if size <= args.legacy_max:
+                legacy = time_call(lambda: legacy_window(user_id, start_date, end),
+                                   repeat=args.repeat)
+                legacy_ms = legacy['median_ms']
+
+            results.append((size, rows, legacy_ms, windowed['median_ms']))
+            db.session.remove()
+            db.engine.dispose()
+
+    print_table(['history rows', 'window rows', 'legacy ms', 'windowed ms'], results)
+
+
+if __name__ == '__main__':
+    main()
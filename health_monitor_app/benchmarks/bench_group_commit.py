@@ -0,0 +1,127 @@
+"""
+Benchmark inserting health records from concurrent writers.
+
+Writer threads in one process each add records through the same write
+path as the add form (``write_queue.run(add_record, ...)``) for a fixed
+time. Three modes are compared at each number of writers:
+
+* commit: the write queue disabled, every insert commits in its own thread
+* queue: the write queue without a window, committing whatever queued up
+  while the previous commit ran
+* group: the write queue holding transactions open for WRITE_QUEUE_WINDOW_MS
+
+Each mode runs with ``synchronous=NORMAL`` (the default profile) and
+``synchronous=FULL``, where every commit is an fsync. Writers here wait
+for each insert before sending the next, so once they are all in a batch
+the window can only add latency; it pays off when inserts arrive
+independently, as from many clients.
+
+Usage:
+    python -m benchmarks.bench_group_commit [--writers 1 8 64] [--seconds 5] [--window-ms 5]
+"""
+
+import argparse
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.extensions import db
+from app.health_data.writes import add_record
+
+from .bench_concurrency import percentiles
+from .common import create_bench_app, create_user, print_table
+
+SYNCHRONOUS_MODES = ('normal', 'full')
+
+
+def mode_config(mode: str, window_ms: float) -> Dict[str, Any]:
+    """Return the app configuration for a benchmark mode."""
+    if mode == 'commit':
+        return {'WRITE_QUEUE_ENABLED': False}
+    return {'WRITE_QUEUE_ENABLED': True, 'WRITE_QUEUE_WINDOW_MS': window_ms if mode == 'group' else 0}
+
+
+def run_writers(mode: str, synchronous: str, writers: int, seconds: float,
+                window_ms: float) -> Tuple[List[float], int, int]:
+    """Run writer threads against a fresh database; return latencies (ms), failures and commits."""
+    app = create_bench_app(CHART_RENDER_WORKERS=0, SQLITE_SYNCHRONOUS=synchronous,
+                           SQLITE_POOL_SIZE=min(writers, 16), **mode_config(mode, window_ms))
+    queue = app.extensions['write_queue']
+    db_path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    with app.app_context():
+        user_ids = [create_user(f'bench{i}') for i in range(writers)]
+
+    latencies: List[float] = []
+    failures = [0]
+    lock = threading.Lock()
+    start = threading.Barrier(writers + 1)
+    stop_at = [0.0]
+
+    def writer(index: int) -> None:
+        with app.app_context():
+            start.wait()
+            i = 0
+            while time.perf_counter() < stop_at[0]:
+                values = {'weight': 70.0 + i % 10, 'heart_rate': 60 + i % 30, 'steps': 1000 * index + i}
+                started = time.perf_counter()
+                try:
+                    queue.run(add_record, user_ids[index], values)
+                    ok = True
+                except Exception:
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    failures[0] += not ok
+                i += 1
+            db.session.remove()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    stop_at[0] = time.perf_counter() + seconds
+    start.wait()
+    for thread in threads:
+        thread.join()
+
+    # Without the queue every successful insert was its own commit
+    commits = queue.commits if queue.enabled else len(latencies) - failures[0]
+    queue.shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+    return latencies, failures[0], commits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--window-ms', type=float, default=5.0)
+    parser.add_argument('--modes', nargs='+', default=['commit', 'queue', 'group'],
+                        choices=['commit', 'queue', 'group'])
+    parser.add_argument('--synchronous', nargs='+', default=list(SYNCHRONOUS_MODES), choices=SYNCHRONOUS_MODES)
+    args = parser.parse_args()
+
+    results = []
+    for synchronous in args.synchronous:
+        for writers in args.writers:
+            for mode in args.modes:
+                latencies, failures, commits = run_writers(mode, synchronous, writers, args.seconds,
+                                                           args.window_ms)
+                inserts = len(latencies) - failures
+                p50, p99 = percentiles(latencies)
+                results.append((
+                    synchronous, writers, mode, round(inserts / args.seconds, 1),
+                    round(inserts / commits, 1) if commits else 0.0, round(p50, 1), round(p99, 1), failures
+                ))
+
+    print_table(['synchronous', 'writers', 'mode', 'inserts/s', 'per commit', 'p50 ms', 'p99 ms', 'failed'],
+                results)
+
+
+if __name__ == '__main__':
+    main()
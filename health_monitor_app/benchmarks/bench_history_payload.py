@@ -0,0 +1,93 @@
+"""
+Benchmark the history page payload with inline and linked preview charts.
+
+Before charts were served from their own routes, history() rendered the
+four preview PNGs while building the page and inlined them as base64
+data URIs. The inline figures reproduce that: the page's server time
+plus rendering every preview, and the HTML size with each image URL
+replaced by its data URI. The linked figures are the page as served now,
+with the previews fetched afterwards as separate (parallelisable,
+browser-cacheable) requests, shown cold and as 304 revalidations.
+
+Usage:
+    python -m benchmarks.bench_history_payload [--sizes 1000 100000]
+"""
+
+import argparse
+import base64
+import re
+from datetime import datetime
+from typing import List
+
+from flask.testing import FlaskClient
+
+from app.extensions import chart_cache, db
+
+from .common import create_bench_app, create_user, logged_in_client, print_table, seed_health_data, time_call
+
+HISTORY_URL = '/history?render=server'
+
+
+def preview_urls(html: str) -> List[str]:
+    """Extract the preview image URLs from a rendered history page."""
+    return [url.replace('&amp;', '&') for url in re.findall(r'<img src="(/chart/preview/[^"]+)"', html)]
+
+
+def inline_page(client: FlaskClient) -> int:
+    """Render the page and every preview cold, returning the inline HTML size."""
+    chart_cache.clear()
+    html = client.get(HISTORY_URL).get_data(as_text=True)
+    for url in preview_urls(html):
+        png = client.get(url).data
+        html = html.replace(url.replace('&', '&amp;'), 'data:image/png;base64,' + base64.b64encode(png).decode())
+    return len(html.encode('utf-8'))
+
+
+def fetch_previews(client: FlaskClient, urls: List[str], etags: List[str]) -> None:
+    """Fetch the preview images, revalidating where an ETag is given."""
+    for url, etag in zip(urls, etags):
+        headers = {'If-None-Match': etag} if etag else {}
+        client.get(url, headers=headers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        app = create_bench_app()
+        with app.app_context():
+            user_id = create_user('bench')
+            seed_health_data(user_id, size, end=datetime.now())
+            db.session.remove()
+        client = logged_in_client(app, user_id)
+
+        html = client.get(HISTORY_URL).get_data(as_text=True)
+        urls = preview_urls(html)
+        etags = [client.get(url).headers.get('ETag', '') for url in urls]
+        no_etags = [''] * len(urls)
+
+        def cold_images() -> None:
+            chart_cache.clear()
+            fetch_previews(client, urls, no_etags)
+
+        inline = time_call(lambda: inline_page(client), repeat=args.repeat)
+        linked = time_call(lambda: client.get(HISTORY_URL), repeat=args.repeat)
+        images_cold = time_call(cold_images, repeat=args.repeat)
+        images_304 = time_call(lambda: fetch_previews(client, urls, etags), repeat=args.repeat)
+
+        results.append((size, 'inline base64', inline_page(client) / 1024, inline['median_ms'], '-'))
+        results.append((size, 'linked images', len(html.encode('utf-8')) / 1024, linked['median_ms'],
+                        f"{images_cold['median_ms']:.2f} cold / {images_304['median_ms']:.2f} 304"))
+
+        with app.app_context():
+            db.engine.dispose()
+
+    print_table(['history rows', 'previews', 'HTML KiB', 'page ms (TTFB)', 'image requests ms'], results)
+
+
+if __name__ == '__main__':
+    main()
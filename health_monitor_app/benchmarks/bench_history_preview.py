@@ -0,0 +1,88 @@
+"""
+Benchmark the history page preview sparklines before and after bounding.
+
+The legacy path loads every record for the user, builds a DataFrame and
+plots all of it; the bounded path plots per-day averages for the last
+HISTORY_PREVIEW_DAYS days. Both render the same four mini charts. Peak
+memory is measured with tracemalloc around the whole pipeline.
+
+Usage:
+    python -m benchmarks.bench_history_preview [--sizes 10000 100000]
+"""
+
+import argparse
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict
+
+import pandas as pd
+
+from app.extensions import db
+from app.health_data.queries import PREVIEW_COLUMNS, fetch_daily_series
+from app.health_data.routes import create_mini_chart
+from app.models import HealthData
+
+from .common import create_bench_app, create_user, print_table, seed_health_data, time_call
+
+PREVIEW_COLORS = {'weight': 'blue', 'heart_rate': 'green', 'steps': 'orange', 'sleep_duration': 'purple'}
+
+
+def legacy_previews(user_id: int) -> Dict[str, str]:
+    """Reproduce the original history() preview pipeline."""
+    records = HealthData.query.filter_by(user_id=user_id)\
+        .order_by(HealthData.date.asc()).all()
+    df = pd.DataFrame([{
+        'date': record.date,
+        'weight': record.weight,
+        'systolic': record.blood_pressure_systolic,
+        'diastolic': record.blood_pressure_diastolic,
+        'heart_rate': record.heart_rate,
+        'steps': record.steps,
+        'sleep_duration': record.sleep_duration
+    } for record in records])
+    return {param: create_mini_chart(df, param, color) for param, color in PREVIEW_COLORS.items()}
+
+
+def bounded_previews(user_id: int, days: int) -> Dict[str, str]:
+    """Run the bounded preview pipeline used by history()."""
+    df = fetch_daily_series(user_id, PREVIEW_COLUMNS, days)
+    return {param: create_mini_chart(df, param, color) for param, color in PREVIEW_COLORS.items()}
+
+
+def peak_memory_mb(fn: Callable[[], object]) -> float:
+    """Return the peak traced allocation while running fn, in MiB."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        app = create_bench_app()
+        with app.app_context(), app.test_request_context():
+            days = app.config['HISTORY_PREVIEW_DAYS']
+            user_id = create_user('bench')
+            seed_health_data(user_id, size, end=datetime.now())
+            db.session.remove()
+
+            for label, fn in [('legacy', lambda: legacy_previews(user_id)),
+                              ('bounded', lambda: bounded_previews(user_id, days))]:
+                timing = time_call(fn, repeat=args.repeat)
+                results.append((size, label, timing['median_ms'], peak_memory_mb(fn)))
+                db.session.remove()
+            db.engine.dispose()
+
+    print_table(['history rows', 'pipeline', 'median ms', 'peak MiB'], results)
+
+
+if __name__ == '__main__':
+    main()
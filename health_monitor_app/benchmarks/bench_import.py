@@ -0,0 +1,112 @@
+"""
+Benchmark bulk importing health data.
+
+Synthetic CSV and NDJSON files (one record per minute, the nine
+dashboard metrics plus mood) are imported into a fresh database with
+``import_file``. For comparison, the per-record path of the add form
+(an ORM insert, the write hooks and a commit per record) is timed on a
+smaller sample. Rows per second include parsing, validation, inserting
+and maintaining the rollups and snapshot.
+
+Usage:
+    python -m benchmarks.bench_import [--rows 1000000] [--form-rows 2000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.extensions import db
+from app.health_data.importer import import_file
+from app.health_data.writes import add_record
+
+from .common import create_bench_app, create_user, print_table
+
+MOODS = np.array(['happy', 'calm', 'neutral', 'tired', 'stressed'])
+
+
+def synthetic_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Build ``n_rows`` records spaced one minute apart, ending now."""
+    rng = np.random.default_rng(seed)
+    end = datetime.now().replace(microsecond=0)
+    return pd.DataFrame({
+        'date': pd.date_range(end=end, periods=n_rows, freq='min').strftime('%Y-%m-%d %H:%M:%S'),
+        'weight': np.round(rng.normal(72.0, 3.0, n_rows), 1),
+        'blood_pressure_systolic': rng.integers(105, 145, n_rows),
+        'blood_pressure_diastolic': rng.integers(65, 95, n_rows),
+        'heart_rate': rng.integers(55, 95, n_rows),
+        'steps': rng.integers(2000, 15000, n_rows),
+        'sleep_duration': np.round(rng.uniform(5.0, 9.0, n_rows), 1),
+        'water_intake': np.round(rng.uniform(1.0, 3.0, n_rows), 1),
+        'calorie_intake': rng.integers(1600, 2800, n_rows),
+        'stress_level': rng.integers(1, 11, n_rows),
+        'mood': MOODS[rng.integers(0, len(MOODS), n_rows)]
+    })
+
+
+def time_import(path: str, fmt: str, n_rows: int) -> float:
+    """Import a file into a fresh database and return the elapsed seconds."""
+    app = create_bench_app(CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        user_id = create_user('bench')
+        with open(path, encoding='utf-8', newline='') as stream:
+            started = time.perf_counter()
+            result = import_file(user_id, stream, fmt)
+            elapsed = time.perf_counter() - started
+        assert result.imported == n_rows and not result.rejected, result
+        db.session.remove()
+        db.engine.dispose()
+    return elapsed
+
+
+def time_form_path(frame: pd.DataFrame) -> float:
+    """Insert records one at a time like add_health_data and return the elapsed seconds."""
+    app = create_bench_app(CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        user_id = create_user('bench')
+        records = frame.assign(date=pd.to_datetime(frame['date'])).to_dict('records')
+        started = time.perf_counter()
+        for values in records:
+            add_record(user_id, {
+                name: value.to_pydatetime() if name == 'date' else getattr(value, 'item', lambda: value)()
+                for name, value in values.items()
+            })
+            db.session.commit()
+        elapsed = time.perf_counter() - started
+        db.session.remove()
+        db.engine.dispose()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--form-rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    frame = synthetic_frame(args.rows)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='hm-import-') as directory:
+        csv_path = os.path.join(directory, 'data.csv')
+        ndjson_path = os.path.join(directory, 'data.ndjson')
+        frame.to_csv(csv_path, index=False)
+        frame.to_json(ndjson_path, orient='records', lines=True)
+
+        for fmt, path in (('csv', csv_path), ('ndjson', ndjson_path)):
+            seconds = time_import(path, fmt, args.rows)
+            results.append((fmt, args.rows, round(seconds, 2), round(args.rows / seconds)))
+
+    sample = frame.head(args.form_rows)
+    seconds = time_form_path(sample)
+    results.append(('form (per record)', len(sample), round(seconds, 2), round(len(sample) / seconds)))
+
+    print_table(['path', 'rows', 'seconds', 'rows/s'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark loading a window of health data into analysis-ready form.
+
+Three paths load the same rows and columns:
+
+* orm: ORM objects, then a list of dicts, then a DataFrame (the original
+  view_graph / dashboard chart path)
+* tuples: ``session.query`` of the columns, then
+  ``DataFrame.from_records`` (the previous ``fetch_window``)
+* arrays: ``load_series`` streaming a Core ``select()`` into typed NumPy
+  arrays
+
+Time and peak traced memory are reported per 100k rows.
+
+Usage:
+    python -m benchmarks.bench_load_series [--sizes 10000 100000 500000]
+"""
+
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict
+
+import pandas as pd
+
+from app.extensions import db
+from app.health_data.queries import PARAMETER_COLUMNS, load_series
+from app.models import HealthData
+
+from .common import create_bench_app, create_user, print_table, seed_health_data, time_call
+
+COLUMNS = {**PARAMETER_COLUMNS['weight'], **PARAMETER_COLUMNS['blood_pressure'],
+           **PARAMETER_COLUMNS['heart_rate'], **PARAMETER_COLUMNS['steps']}
+
+
+def load_orm(user_id: int, start: datetime, end: datetime) -> pd.DataFrame:
+    """Reproduce the original ORM-object data path."""
+    records = HealthData.query.filter(
+        HealthData.user_id == user_id, HealthData.date >= start, HealthData.date <= end
+    ).order_by(HealthData.date.asc()).all()
+    return pd.DataFrame([{
+        'date': record.date,
+        **{name: getattr(record, column.key) for name, column in COLUMNS.items()}
+    } for record in records])
+
+
+def load_tuples(user_id: int, start: datetime, end: datetime) -> pd.DataFrame:
+    """Reproduce the previous row-tuple fetch_window."""
+    rows = db.session.query(
+        HealthData.date, *(column.label(name) for name, column in COLUMNS.items())
+    ).filter(
+        HealthData.user_id == user_id, HealthData.date >= start, HealthData.date <= end
+    ).order_by(HealthData.date.asc()).all()
+    return pd.DataFrame.from_records(rows, columns=['date', *COLUMNS])
+
+
+def load_arrays(user_id: int, start: datetime, end: datetime) -> Any:
+    """Load through the columnar loader."""
+    return load_series(user_id, COLUMNS, start, end)
+
+
+def peak_memory(fn: Callable[[], Any]) -> float:
+    """Return the peak traced allocation of a call in MiB, result included."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak / 2 ** 20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths: Dict[str, Callable[[int, datetime, datetime], Any]] = {
+        'orm': load_orm, 'tuples': load_tuples, 'arrays': load_arrays
+    }
+    results = []
+    for size in args.sizes:
+        app = create_bench_app(CHART_RENDER_WORKERS=0)
+        with app.app_context():
+            user_id = create_user('bench')
+            end = datetime.now()
+            seed_health_data(user_id, size, end=end, interval=timedelta(minutes=1))
+            start = end - timedelta(minutes=size)
+            per_100k = 100000 / size
+
+            for name, load in paths.items():
+                def run() -> Any:
+                    result = load(user_id, start, end)
+                    db.session.expire_all()
+                    return result
+                timing = time_call(run, repeat=args.repeat)
+                memory = peak_memory(run)
+                results.append((size, name, timing['median_ms'] * per_100k, memory * per_100k))
+            db.session.remove()
+            db.engine.dispose()
+
+    print_table(['rows', 'path', 'ms per 100k', 'peak MiB per 100k'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark the latency of a log call under load.
+
+Writer threads each log records as fast as they can from inside a
+request context, and the time every ``logger.info`` call takes on the
+calling thread is recorded. Three setups are compared:
+
+* sync 10 KB: a RotatingFileHandler with maxBytes=10240 and the text
+  format, called on the logging thread (the original setup)
+* sync 10 MB: the same with the new rotation size, to separate the cost
+  of rotating from the cost of writing
+* queue: the log pipeline, where the call only enqueues the record and
+  the JSON line is written by the listener thread
+
+For the queue the time the listener then needs to write what is still
+queued is reported too, along with any records dropped because the
+queue was full.
+
+Usage:
+    python -m benchmarks.bench_logging [--threads 1 4 8] [--records 5000]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Sequence, Tuple
+
+from flask import Flask, g
+
+from app.log_pipeline import TEXT_FORMAT, JsonFormatter, LogPipeline
+
+from .common import print_table
+
+
+def run_writers(app: Flask, logger: logging.Logger, threads: int, records: int) -> List[float]:
+    """Log ``records`` records on each of ``threads`` threads; return microseconds per call."""
+    latencies: List[List[float]] = [[] for _ in range(threads)]
+    start = threading.Barrier(threads)
+
+    def writer(index: int) -> None:
+        times = latencies[index]
+        with app.test_request_context('/history', method='GET'):
+            g.request_id = f'bench-{index}'
+            g.request_started = time.perf_counter()
+            start.wait()
+            for number in range(records):
+                started = time.perf_counter()
+                logger.info('Record %d written by thread %d', number, index)
+                times.append((time.perf_counter() - started) * 1e6)
+
+    workers = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [latency for times in latencies for latency in times]
+
+
+def summarize(latencies: Sequence[float]) -> Tuple[float, float, float, float]:
+    """Return the median, p99, p99.9 and maximum of the latencies."""
+    ordered = sorted(latencies)
+    return (statistics.median(ordered), ordered[int(len(ordered) * 0.99)],
+            ordered[int(len(ordered) * 0.999)], ordered[-1])
+
+
+def bench_sync(app: Flask, directory: str, max_bytes: int, threads: int, records: int) -> Dict[str, float]:
+    """Time log calls through a RotatingFileHandler on the calling thread."""
+    handler = RotatingFileHandler(os.path.join(directory, f'sync-{max_bytes}.log'),
+                                  maxBytes=max_bytes, backupCount=10)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logger = logging.getLogger(f'bench.sync.{max_bytes}.{threads}')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    started = time.perf_counter()
+    latencies = run_writers(app, logger, threads, records)
+    elapsed = time.perf_counter() - started
+    logger.removeHandler(handler)
+    handler.close()
+    return {'latencies': latencies, 'seconds': elapsed, 'drain_ms': 0.0, 'dropped': 0}
+
+
+def bench_queue(app: Flask, directory: str, threads: int, records: int) -> Dict[str, float]:
+    """Time log calls through the queue pipeline, then wait for the writer."""
+    pipeline = LogPipeline(os.path.join(directory, f'queue-{threads}.log'), 10 * 1024 * 1024, 10,
+                           JsonFormatter(), 10000)
+    # The benchmark's own output stays off the console
+    pipeline.console_handler.setLevel(logging.CRITICAL + 1)
+    logger = logging.getLogger(f'bench.queue.{threads}')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(pipeline.handler)
+    started = time.perf_counter()
+    latencies = run_writers(app, logger, threads, records)
+    elapsed = time.perf_counter() - started
+    drain_started = time.perf_counter()
+    dropped = pipeline.handler.dropped
+    pipeline.stop()
+    drain_ms = (time.perf_counter() - drain_started) * 1000
+    logger.removeHandler(pipeline.handler)
+    return {'latencies': latencies, 'seconds': elapsed, 'drain_ms': drain_ms, 'dropped': dropped}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--records', type=int, default=5000, help='records logged per thread')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='hm-logging-') as directory:
+        for threads in args.threads:
+            setups = [
+                ('sync 10 KB', lambda: bench_sync(app, directory, 10240, threads, args.records)),
+                ('sync 10 MB', lambda: bench_sync(app, directory, 10 * 1024 * 1024, threads, args.records)),
+                ('queue', lambda: bench_queue(app, directory, threads, args.records))
+            ]
+            for name, run in setups:
+                result = run()
+                p50, p99, p999, worst = summarize(result['latencies'])
+                rows.append((name, threads, round(p50, 1), round(p99, 1), round(p999, 1), round(worst, 1),
+                             round(len(result['latencies']) / result['seconds']),
+                             round(result['drain_ms'], 1), result['dropped']))
+    print(f'{args.records} records per thread; latency of one logger.info call on the calling thread')
+    print_table(['setup', 'threads', 'p50 us', 'p99 us', 'p99.9 us', 'max us', 'calls/s', 'drain ms', 'dropped'],
+                rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark the overhead of request instrumentation.
+
+Two apps over the same seeded database, one with METRICS_ENABLED off and
+one with it on, serve the same pages, alternating request by request so
+both see the same machine noise; the median latencies are compared.
+Since whole-request differences are within that noise, the fixed costs
+are also timed on their own:
+
+* bookkeeping: the before, after and teardown hooks plus recording the
+  request in the histograms, per request
+* cursor hooks: a trivial ``SELECT 1`` with and without a request being
+  instrumented, per statement
+
+and the /metrics text is rendered once every route has been recorded.
+
+Usage:
+    python -m benchmarks.bench_metrics [--rows 5000] [--requests 200]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence
+
+from flask import Flask, Response
+from sqlalchemy import text
+
+from app.extensions import db, request_metrics
+from app.health_data.rollups import rebuild as rebuild_rollups
+from app.health_data.snapshots import rebuild as rebuild_snapshots
+from app.metrics import RequestStats, _current
+
+from .common import create_bench_app, create_user, logged_in_client, print_table, seed_health_data
+
+PATHS = ('/dashboard', '/history', '/api/series/weight?days=30', '/graph/weight')
+
+
+def page_latencies(apps: Sequence[Flask], user_id: int, paths: Sequence[str],
+                   requests: int) -> List[Dict[str, float]]:
+    """Return the median milliseconds per request of each path, for each app."""
+    clients = [logged_in_client(app, user_id) for app in apps]
+    medians: List[Dict[str, float]] = [{} for _ in apps]
+    for path in paths:
+        samples: List[List[float]] = [[] for _ in apps]
+        for client in clients:
+            client.get(path)
+        for _ in range(requests):
+            for client, times in zip(clients, samples):
+                started = time.perf_counter()
+                response = client.get(path)
+                times.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, (path, response.status_code)
+        for result, times in zip(medians, samples):
+            result[path] = statistics.median(times)
+    return medians
+
+
+def best_us(fn: Callable[[], None], calls: int, repeat: int = 5) -> float:
+    """Return the best of ``repeat`` runs of the mean microseconds per call."""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        runs.append((time.perf_counter() - started) / calls * 1e6)
+    return min(runs)
+
+
+def bookkeeping_us(app: Flask, calls: int = 20000) -> float:
+    """Return the microseconds the request hooks and recording add to a request."""
+    response = Response()
+
+    def one_request() -> None:
+        request_metrics._before_request()
+        request_metrics._after_request(response)
+        request_metrics._teardown_request(None)
+
+    with app.test_request_context('/dashboard'):
+        return best_us(one_request, calls)
+
+
+def cursor_hook_us(app: Flask, statements: int = 5000) -> Dict[str, float]:
+    """Return microseconds per ``SELECT 1`` outside and inside an instrumented request."""
+    results = {}
+    with app.app_context():
+        connection = db.session.connection()
+        for label, stats in (('outside request', None), ('inside request', RequestStats(time.perf_counter()))):
+            token = _current.set(stats)
+            try:
+                results[label] = best_us(lambda: connection.execute(text('SELECT 1')).scalar(), statements)
+            finally:
+                _current.reset(token)
+        db.session.remove()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='hm-metrics-') as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        app = create_bench_app(db_path, CHART_RENDER_WORKERS=0)
+        with app.app_context():
+            user_id = create_user('bench')
+            seed_health_data(user_id, args.rows)
+            rebuild_rollups()
+            rebuild_snapshots()
+            db.session.commit()
+            db.session.remove()
+            db.engine.dispose()
+
+        plain_app = create_bench_app(db_path, METRICS_ENABLED=False, CHART_RENDER_WORKERS=0)
+        metrics_app = create_bench_app(db_path, METRICS_ENABLED=True, CHART_RENDER_WORKERS=0)
+        plain, instrumented = page_latencies([plain_app, metrics_app], user_id, PATHS, args.requests)
+        print_table(['path', 'plain ms', 'metrics ms', 'difference us'], [
+            (path, round(plain[path], 3), round(instrumented[path], 3),
+             round((instrumented[path] - plain[path]) * 1000, 1))
+            for path in PATHS
+        ])
+        print()
+
+        hooks = cursor_hook_us(metrics_app)
+        print_table(['fixed cost', 'us'], [
+            ('bookkeeping per request', round(bookkeeping_us(metrics_app), 2)),
+            *((f'SELECT 1 {label}', round(us, 2)) for label, us in hooks.items())
+        ])
+        print()
+
+        started = time.perf_counter()
+        exposition = request_metrics.expose()
+        print(f'/metrics: {exposition.count(chr(10))} lines, {len(exposition)} bytes, '
+              f'rendered in {(time.perf_counter() - started) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark quarter graphs from raw records vs the daily rollups.
+
+For each logging density (records per day) a user is seeded with 90 days
+of history and the rollups are rebuilt. The raw path loads the window
+with ``fetch_window`` and summarizes it with ``summarize_frame``; the
+rollup path reads at most 90 rows with ``fetch_rollup_series`` and
+summarizes them with ``summarize_rollups``. The cost of keeping the
+rollups current is reported as the time of one add through the write
+hook, and of a full rebuild.
+
+Usage:
+    python -m benchmarks.bench_rollups [--per-day 1 24 288 1440]
+"""
+
+import argparse
+import itertools
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.health_data import rollups
+from app.health_data.queries import PARAMETER_COLUMNS, fetch_window
+from app.health_data.stats import summarize_frame, summarize_rollups
+from app.health_data.writes import add_record
+
+from .common import create_bench_app, create_user, print_table, seed_health_data, time_call
+
+DAYS = 90
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--per-day', type=int, nargs='+', default=[1, 24, 288, 1440])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    columns = PARAMETER_COLUMNS['blood_pressure']
+    metrics = list(columns)
+    end = datetime.now()
+    start_date = datetime.combine((end - timedelta(days=DAYS - 1)).date(), datetime.min.time())
+    results = []
+
+    for per_day in args.per_day:
+        app = create_bench_app(CHART_RENDER_WORKERS=0)
+        with app.app_context():
+            user_id = create_user('bench')
+            seed_health_data(user_id, DAYS * per_day, end=end, interval=timedelta(days=1) / per_day)
+            rebuild = time_call(lambda: rollups.rebuild(user_id), repeat=1, warmup=0)
+            db.session.commit()
+            db.session.remove()
+
+            raw = time_call(lambda: summarize_frame(
+                fetch_window(user_id, columns, start_date, end), metrics), repeat=args.repeat)
+            rolled = time_call(lambda: summarize_rollups(
+                rollups.fetch_rollup_series(user_id, metrics, start_date.date(), end.date()), metrics),
+                repeat=args.repeat)
+            rollup_rows = len(rollups.fetch_rollup_series(user_id, metrics, start_date.date(), end.date()))
+
+            added = itertools.count(1)
+
+            def add_one() -> None:
+                # A new timestamp each time, or the upsert would find the reading already stored
+                add_record(user_id, {'date': end + timedelta(seconds=next(added)),
+                                     'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80})
+                db.session.commit()
+            add = time_call(add_one, repeat=args.repeat)
+
+            results.append((per_day, DAYS * per_day, rollup_rows, raw['median_ms'], rolled['median_ms'],
+                            raw['median_ms'] / rolled['median_ms'], add['median_ms'], rebuild['median_ms']))
+            db.session.remove()
+            db.engine.dispose()
+
+    print_table(['per day', 'window rows', 'rollup rows', 'raw ms', 'rollup ms', 'speed-up',
+                 'add ms', 'rebuild ms'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Benchmark the hot routes at several database sizes.
+
+For each size a database is seeded with that many hourly health records
+spread over ``--users`` users, with rollups and snapshots built as the
+app keeps them. In a fresh process per size, one user's requests are
+timed through the test client:
+
+* the dashboard, and the history page (first page and page 2)
+* the graph page and the series API it draws from, for every graph
+  parameter and time period
+* the add, edit and delete forms (GET and POST); each delete removes a
+  different record
+
+For each route the p50, p95 and p99 latency and the peak RSS while it
+was requested are reported (where the peak can be reset, as on Linux;
+elsewhere it is the process's peak so far). Results are also written as
+JSON together with the commit and machine they came from, and
+``--compare`` prints the p50 and p95 change against an earlier file.
+
+Usage:
+    python -m benchmarks.bench_routes [--sizes 1000 100000 1000000] [--users 50]
+        [--requests 50] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.extensions import db
+from app.health_data import rollups, snapshots
+from app.health_data.routes import VALID_PARAMETERS, VALID_TIME_PERIODS
+from app.models import HealthData
+
+from .common import create_bench_app, create_user, logged_in_client, print_table, seed_health_data
+
+# Requests per route before timing starts
+WARMUP = 2
+
+# Form posted by the add and edit routes
+FORM_DATA = {'weight': 71.5, 'blood_pressure_systolic': 118, 'blood_pressure_diastolic': 76,
+             'heart_rate': 64, 'steps': 8000, 'sleep_duration': 7.5, 'stress_level': 4}
+
+
+@dataclass(frozen=True)
+class RouteCase:
+    """A request to time; {record} in the path is replaced by a record ID."""
+    name: str
+    path: str
+    method: str = 'GET'
+    data: Optional[Dict[str, Any]] = None
+    # Whether every request needs a record of its own (it deletes it)
+    consumes_record: bool = False
+
+    @property
+    def expected_status(self) -> int:
+        # Forms redirect once saved and render again when rejected
+        return 302 if self.method == 'POST' else 200
+
+
+@dataclass
+class RouteResult:
+    """Latencies of one route at one database size; errors are responses with an unexpected status."""
+    rows: int
+    route: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    max_ms: float
+    peak_rss_mib: float
+
+
+def route_cases() -> List[RouteCase]:
+    """Return the routes to time, in the order they are requested."""
+    cases = [
+        RouteCase('dashboard', '/dashboard'),
+        RouteCase('history', '/history'),
+        RouteCase('history page 2', '/history?page=2'),
+    ]
+    for parameter in VALID_PARAMETERS:
+        for period in VALID_TIME_PERIODS:
+            cases.append(RouteCase(f'graph {parameter} {period}', f'/graph/{parameter}/{period}'))
+            cases.append(RouteCase(f'series {parameter} {period}', f'/api/series/{parameter}?period={period}'))
+    cases += [
+        RouteCase('add form', '/add'),
+        RouteCase('add', '/add', 'POST', FORM_DATA),
+        RouteCase('edit form', '/edit/{record}'),
+        RouteCase('edit', '/edit/{record}', 'POST', FORM_DATA),
+        RouteCase('delete', '/delete/{record}', 'POST', consumes_record=True),
+    ]
+    return cases
+
+
+def reset_peak_rss() -> bool:
+    """Reset the process's peak RSS to its current RSS; False where that is unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mib() -> float:
+    """Return the process's peak RSS in MiB since it started or was last reset."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed_dataset(db_path: str, rows: int, users: int) -> Tuple[int, float]:
+    """Seed ``rows`` records over ``users`` users; return the timed user's ID and seconds taken."""
+    started = time.perf_counter()
+    app = create_bench_app(db_path, CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        per_user = [rows // users + (1 if index < rows % users else 0) for index in range(users)]
+        user_ids = [create_user(f'bench{index}') for index in range(users)]
+        for seed, (user_id, count) in enumerate(zip(user_ids, per_user)):
+            seed_health_data(user_id, count, seed=seed)
+        rollups.rebuild()
+        snapshots.rebuild()
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+    return user_ids[0], time.perf_counter() - started
+
+
+def time_routes(db_path: str, rows: int, user_id: int, requests: int) -> List[Dict[str, Any]]:
+    """Time every route in a fresh process; return RouteResults as dicts."""
+    app = create_bench_app(db_path, CHART_RENDER_WORKERS=0)
+    client = logged_in_client(app, user_id)
+    cases = route_cases()
+    with app.app_context():
+        # Oldest records first, so deletes leave the graphed windows alone
+        needed = 1 + sum(WARMUP + requests for case in cases if case.consumes_record)
+        record_ids: Iterator[int] = iter([record_id for (record_id,) in db.session.query(HealthData.id)
+                                          .filter_by(user_id=user_id).order_by(HealthData.date)
+                                          .limit(needed).all()])
+        db.session.remove()
+    edited = next(record_ids, None)
+
+    results = []
+    for case in cases:
+        if '{record}' in case.path and edited is None:
+            continue
+        reset_peak_rss()
+        latencies = []
+        errors = 0
+        for number in range(WARMUP + requests):
+            record = next(record_ids, None) if case.consumes_record else edited
+            if record is None:
+                break
+            path = case.path.format(record=record)
+            started = time.perf_counter()
+            response = client.open(path, method=case.method, data=case.data)
+            response.get_data()
+            elapsed = (time.perf_counter() - started) * 1000
+            response.close()
+            if number < WARMUP:
+                continue
+            latencies.append(elapsed)
+            errors += response.status_code != case.expected_status
+        if not latencies:
+            continue
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        results.append(asdict(RouteResult(
+            rows, case.name, len(latencies), errors, round(float(p50), 3), round(float(p95), 3),
+            round(float(p99), 3), round(float(np.mean(latencies)), 3), round(max(latencies), 3),
+            round(peak_rss_mib(), 1)
+        )))
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the commit and machine the results come from."""
+    def git(*args: str) -> Optional[str]:
+        try:
+            return subprocess.run(['git', *args], capture_output=True, text=True, check=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Print the p50 and p95 change of each route against an earlier results file."""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(result['rows'], result['route']): result for result in baseline['results']}
+    rows = []
+    for result in results:
+        before = previous.get((result['rows'], result['route']))
+        if before is None:
+            continue
+        rows.append((result['rows'], result['route'], before['p50_ms'], result['p50_ms'],
+                     f'{(result["p50_ms"] / before["p50_ms"] - 1) * 100:+.1f}%' if before['p50_ms'] else '-',
+                     before['p95_ms'], result['p95_ms'],
+                     f'{(result["p95_ms"] / before["p95_ms"] - 1) * 100:+.1f}%' if before['p95_ms'] else '-'))
+    commit = (baseline.get('environment', {}).get('commit') or 'unknown')[:10]
+    print(f'Compared with {baseline_path} (commit {commit})')
+    if not rows:
+        print('No database size and route in common')
+        return
+    print_table(['rows', 'route', 'p50 before', 'p50 now', 'p50 change',
+                 'p95 before', 'p95 now', 'p95 change'], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--output', default=None,
+                        help='results file (default: bench_routes-<commit>.json in the current directory)')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare with')
+    args = parser.parse_args()
+
+    env = environment()
+    datasets = []
+    results: List[Dict[str, Any]] = []
+    # Seeding and timing each run in a fresh process, so every size starts
+    # from the same interpreter and its RSS is not inflated by the last
+    context = multiprocessing.get_context('spawn')
+    for rows in args.sizes:
+        app = create_bench_app(CHART_RENDER_WORKERS=0)
+        db_path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+        with app.app_context():
+            db.engine.dispose()
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            user_id, seed_seconds = pool.apply(seed_dataset, (db_path, rows, min(args.users, rows)))
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            size_results = pool.apply(time_routes, (db_path, rows, user_id, args.requests))
+        datasets.append({'rows': rows, 'users': min(args.users, rows), 'seed_seconds': round(seed_seconds, 1),
+                         'db_mib': round(sum(os.path.getsize(db_path + suffix) for suffix in ('', '-wal')
+                                             if os.path.exists(db_path + suffix)) / 2 ** 20, 1)})
+        results.extend(size_results)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        print(f'{rows} rows over {datasets[-1]["users"]} users: seeded in {seed_seconds:.1f} s, '
+              f'{datasets[-1]["db_mib"]} MiB', file=sys.stderr)
+
+    print_table(['rows', 'route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'peak RSS MiB'], [
+        (result['rows'], result['route'], result['requests'], result['errors'], result['p50_ms'],
+         result['p95_ms'], result['p99_ms'], result['peak_rss_mib'])
+        for result in results
+    ])
+
+    output = args.output or f'bench_routes-{(env["commit"] or "unknown")[:10]}.json'
+    with open(output, 'w') as output_file:
+        json.dump({'benchmark': 'routes', 'environment': env,
+                   'config': {'users': args.users, 'requests': args.requests, 'warmup': WARMUP},
+                   'datasets': datasets, 'results': results}, output_file, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        print()
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
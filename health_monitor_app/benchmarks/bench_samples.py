@@ -0,0 +1,122 @@
+"""
+Benchmark storing intraday samples as chunks versus wide health records.
+
+The same per-minute heart rate series is stored twice in one database:
+as HealthData rows with only heart_rate set (one wide row per sample),
+for one user, and through ``append_samples`` into SampleChunk rows, for
+another. Reported are the bytes each layout takes on disk (table plus
+indexes, from SQLite's dbstat) per sample, the time to store the series,
+and the latency of reading windows of it back:
+
+* wide: ``load_series`` of the heart_rate column
+* samples: ``read_samples`` decoding every sample in the window
+* downsampled: ``downsample`` to at most SAMPLE_GRAPH_POINTS buckets, as
+  the graph view does
+
+Usage:
+    python -m benchmarks.bench_samples [--days 90] [--interval 60] [--windows 1 7 30 90]
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Sequence
+
+import numpy as np
+
+from app.extensions import db
+from app.health_data.queries import load_series
+from app.health_data.samples import append_samples, downsample, graph_bucket, read_samples
+from app.models import HealthData, SampleChunk
+
+from .common import SEED_BATCH_SIZE, create_bench_app, create_user, print_table, time_call
+
+
+def heart_rate_series(start: datetime, days: int, interval: int, seed: int = 0):
+    """Return sample times and a random-walk heart rate every ``interval`` seconds."""
+    rng = np.random.default_rng(seed)
+    times = np.datetime64(start, 's') + np.arange(0, days * 86400, interval).astype('timedelta64[s]')
+    values = np.clip(70 + np.cumsum(rng.integers(-2, 3, len(times))), 45, 180).astype(np.float64)
+    return times, values
+
+
+def store_wide(user_id: int, times: np.ndarray, values: np.ndarray) -> None:
+    """Insert one HealthData row per sample."""
+    table = HealthData.__table__
+    for offset in range(0, len(times), SEED_BATCH_SIZE):
+        db.session.execute(table.insert(), [
+            {'user_id': user_id, 'date': moment, 'heart_rate': int(value)}
+            for moment, value in zip(times[offset:offset + SEED_BATCH_SIZE].astype(datetime),
+                                     values[offset:offset + SEED_BATCH_SIZE])
+        ])
+    db.session.commit()
+
+
+def store_samples(user_id: int, times: np.ndarray, values: np.ndarray) -> None:
+    """Append the samples a day at a time, as a syncing wearable would."""
+    per_day = int(np.count_nonzero(times < times[0] + np.timedelta64(1, 'D')))
+    for offset in range(0, len(times), per_day):
+        append_samples(user_id, 'heart_rate', times[offset:offset + per_day], values[offset:offset + per_day])
+    db.session.commit()
+
+
+def stored_bytes(names: Sequence[str]) -> int:
+    """Return the bytes of the pages used by the given tables and indexes."""
+    placeholders = ', '.join('?' * len(names))
+    return db.session.connection().exec_driver_sql(
+        f'SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name IN ({placeholders})', tuple(names)
+    ).scalar()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--interval', type=int, default=60, help='seconds between samples')
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 7, 30, 90], help='days read back')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_bench_app(CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        wide_user, samples_user = create_user('wide'), create_user('samples')
+        start = datetime(2024, 1, 1)
+        times, values = heart_rate_series(start, args.days, args.interval)
+
+        started = time.perf_counter()
+        store_wide(wide_user, times, values)
+        wide_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        store_samples(samples_user, times, values)
+        samples_seconds = time.perf_counter() - started
+
+        db.session.connection().exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+        wide_bytes = stored_bytes(['health_data', *(index.name for index in HealthData.__table__.indexes)])
+        samples_bytes = stored_bytes(['sample_chunk', 'sqlite_autoindex_sample_chunk_1'])
+        print(f'{len(times)} samples over {args.days} days, every {args.interval}s')
+        print_table(['layout', 'rows', 'bytes', 'bytes/sample', 'store s'], [
+            ('wide', HealthData.query.count(), wide_bytes, round(wide_bytes / len(times), 2),
+             round(wide_seconds, 2)),
+            ('samples', SampleChunk.query.count(), samples_bytes, round(samples_bytes / len(times), 2),
+             round(samples_seconds, 2))
+        ])
+        print()
+
+        end = start + timedelta(days=args.days) - timedelta(seconds=1)
+        points = app.config['SAMPLE_GRAPH_POINTS']
+        results = []
+        for days in args.windows:
+            window_start = end - timedelta(days=days) + timedelta(seconds=1)
+            bucket = graph_bucket(window_start, end, points)
+            wide = time_call(lambda: load_series(wide_user, {'heart_rate': HealthData.heart_rate},
+                                                 window_start, end), args.repeat)
+            samples = time_call(lambda: read_samples(samples_user, 'heart_rate', window_start, end), args.repeat)
+            downsampled = time_call(lambda: downsample(samples_user, 'heart_rate', window_start, end, bucket),
+                                    args.repeat)
+            rows = len(read_samples(samples_user, 'heart_rate', window_start, end))
+            results.append((days, rows, round(wide['median_ms'], 2), round(samples['median_ms'], 2),
+                            str(bucket), round(downsampled['median_ms'], 2)))
+        print_table(['days', 'samples', 'wide ms', 'samples ms', 'bucket', 'downsampled ms'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark importing a large Apple Health export.
+
+A synthetic export.xml of about the requested size is written to a
+temporary file: heart rate from a watch every few minutes, steps from a
+phone and a watch (overlapping sources), hourly oxygen saturation, a
+daily weight and a night of sleep stages, each record with the metadata
+and attributes a real export carries. It is then imported with
+``import_wearable`` into a fresh database, with and without keeping the
+heart rate and oxygen readings as samples. Reported are the elapsed
+time, throughput and the peak resident set size of the process, which
+should stay flat however large the file is.
+
+Usage:
+    python -m benchmarks.bench_wearable_import [--size 100] [--no-samples-run]
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import IO, Iterator
+
+import numpy as np
+
+from app.extensions import db
+from app.health_data.wearables import import_wearable
+
+from .common import create_bench_app, create_user, print_table
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary)*)>
+<!ATTLIST HealthData locale CDATA #REQUIRED>
+]>
+<HealthData locale="en_US">
+ <ExportDate value="2024-01-01 00:00:00 +0100"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth="1980-01-01" HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexFemale"/>
+'''
+RECORD = (' <Record type="HKQuantityTypeIdentifier{kind}" sourceName="{source}" sourceVersion="10.1" '
+          'device="&lt;&lt;HKDevice: 0x28267a5d0&gt;, name:{source}&gt;" unit="{unit}" '
+          'creationDate="{end}" startDate="{start}" endDate="{end}" value="{value}"/>\n')
+HEART_RATE = (' <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Watch" sourceVersion="10.1" '
+              'unit="count/min" creationDate="{end}" startDate="{start}" endDate="{end}" value="{value}">\n'
+              '  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>\n </Record>\n')
+SLEEP = (' <Record type="HKCategoryTypeIdentifierSleepAnalysis" sourceName="Watch" sourceVersion="10.1" '
+         'creationDate="{end}" startDate="{start}" endDate="{end}" value="HKCategoryValueSleepAnalysis{stage}"/>\n')
+FOOTER = '</HealthData>\n'
+
+
+def _stamp(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%d %H:%M:%S +0100')
+
+
+def synthetic_day(day: datetime, rng: np.random.Generator) -> Iterator[str]:
+    """Yield the records of one day of a synthetic export."""
+    for minute in range(0, 1440, 4):
+        moment = _stamp(day + timedelta(minutes=minute))
+        yield HEART_RATE.format(start=moment, end=moment, value=int(rng.integers(55, 110)))
+    for minute in range(420, 1320, 10):
+        start, end = _stamp(day + timedelta(minutes=minute)), _stamp(day + timedelta(minutes=minute + 10))
+        steps = int(rng.integers(0, 1200))
+        yield RECORD.format(kind='StepCount', source='iPhone', unit='count', start=start, end=end, value=steps)
+        yield RECORD.format(kind='StepCount', source='Watch', unit='count', start=start, end=end,
+                            value=max(steps - int(rng.integers(0, 100)), 0))
+    for hour in range(24):
+        moment = _stamp(day + timedelta(hours=hour))
+        yield RECORD.format(kind='OxygenSaturation', source='Watch', unit='%', start=moment, end=moment,
+                            value=round(float(rng.uniform(0.94, 0.99)), 2))
+    moment = _stamp(day + timedelta(hours=7))
+    yield RECORD.format(kind='BodyMass', source='Scale', unit='kg', start=moment, end=moment,
+                        value=round(float(rng.normal(72.0, 1.0)), 1))
+    start = day + timedelta(hours=23)
+    for stage in ('Core', 'Deep', 'REM', 'Core', 'Awake', 'Core'):
+        end = start + timedelta(minutes=int(rng.integers(30, 100)))
+        yield SLEEP.format(start=_stamp(start), end=_stamp(end), stage=stage)
+        start = end
+
+
+def write_export(stream: IO[str], size_mb: float, seed: int = 0) -> int:
+    """Write a synthetic export of about ``size_mb`` megabytes and return the number of days."""
+    rng = np.random.default_rng(seed)
+    stream.write(HEADER)
+    day, days, written = datetime(2018, 1, 1), 0, 0
+    while written < size_mb * 1e6:
+        text = ''.join(synthetic_day(day, rng))
+        stream.write(text)
+        written += len(text)
+        day += timedelta(days=1)
+        days += 1
+    stream.write(FOOTER)
+    return days
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_import(path: str, samples: bool) -> tuple:
+    """Import the export into a fresh database and return (result, seconds)."""
+    app = create_bench_app(CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        user_id = create_user('bench')
+        with open(path, 'rb') as stream:
+            started = time.perf_counter()
+            result = import_wearable(user_id, stream, 'apple_health', 'export.xml', samples=samples)
+            elapsed = time.perf_counter() - started
+        assert result.imported and not result.rejected, result
+        db.session.remove()
+        db.engine.dispose()
+    return result, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=float, default=100, help='size of the export in MB')
+    parser.add_argument('--no-samples-run', action='store_true', help='also import without keeping samples')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='hm-wearable-') as directory:
+        path = os.path.join(directory, 'export.xml')
+        with open(path, 'w', encoding='utf-8') as stream:
+            days = write_export(stream, args.size)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f'{size_mb:.0f} MB export over {days} days, peak RSS before importing {peak_rss_mb():.0f} MB')
+
+        results = []
+        for samples in ((True, False) if args.no_samples_run else (True,)):
+            result, seconds = time_import(path, samples)
+            results.append(('yes' if samples else 'no', result.readings, result.imported, result.samples,
+                            round(seconds, 1), round(size_mb / seconds, 1), round(result.readings / seconds),
+                            round(peak_rss_mb())))
+    print_table(['samples', 'readings', 'days', 'stored samples', 'seconds', 'MB/s', 'readings/s',
+                 'peak RSS MB'], results)
+
+
+if __name__ == '__main__':
+    main()
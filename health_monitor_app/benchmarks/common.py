@@ -0,0 +1,180 @@
+"""
+Shared helpers for the Health Monitor benchmarks.
+
+Provides a throwaway application/database, fast synthetic data seeding
+and small timing utilities so individual benchmarks stay short.
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app import create_app
+from app.extensions import db
+from app.models import HealthData, User
+
+# Rows inserted per executemany() call while seeding
+SEED_BATCH_SIZE = 10000
+
+
+def create_bench_app(db_path: Optional[str] = None, **config: Any) -> Flask:
+    """
+    Create an application bound to a scratch SQLite database.
+
+    Args:
+        db_path: Path of the database file (a temporary file if omitted)
+        **config: Extra configuration values for the app
+
+    Returns:
+        Flask application instance with all tables created
+    """
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(prefix='hm-bench-', suffix='.db')
+        os.close(fd)
+        os.unlink(db_path)
+
+    test_config = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        'WTF_CSRF_ENABLED': False,
+        'TESTING': True,
+        # Keep request logs of benchmark runs out of logs/
+        'LOG_FILE': os.path.join(tempfile.gettempdir(), 'health_monitor_bench.log')
+    }
+    test_config.update(config)
+    return create_app(test_config)
+
+
+def create_user(username: str) -> int:
+    """
+    Create a benchmark user inside the current app context.
+
+    Args:
+        username: Username (also used to derive the email address)
+
+    Returns:
+        ID of the new user
+    """
+    user = User(username=username, email=f'{username}@bench.local')
+    user.set_password('bench-password')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def seed_health_data(user_id: int, n_rows: int, end: Optional[datetime] = None,
+                     interval: timedelta = timedelta(hours=1), seed: int = 0) -> None:
+    """
+    Insert synthetic health records for a user, newest at ``end``.
+
+    Records are spaced ``interval`` apart going back in time, so the
+    number of rows in any fixed window stays the same as ``n_rows`` grows.
+
+    Args:
+        user_id: ID of the user to seed
+        n_rows: Number of records to insert
+        end: Timestamp of the most recent record (defaults to now)
+        interval: Spacing between consecutive records
+        seed: Random seed for reproducible values
+    """
+    end = end or datetime.now()
+    rng = np.random.default_rng(seed)
+    table = HealthData.__table__
+
+    for offset in range(0, n_rows, SEED_BATCH_SIZE):
+        size = min(SEED_BATCH_SIZE, n_rows - offset)
+        weight = np.round(rng.normal(72.0, 3.0, size), 1)
+        systolic = rng.integers(105, 145, size)
+        diastolic = rng.integers(65, 95, size)
+        heart_rate = rng.integers(55, 95, size)
+        steps = rng.integers(2000, 15000, size)
+        sleep = np.round(rng.uniform(5.0, 9.0, size), 1)
+        water = np.round(rng.uniform(1.0, 3.0, size), 1)
+        calories = rng.integers(1600, 2800, size)
+        stress = rng.integers(1, 11, size)
+
+        rows = [{
+            'user_id': user_id,
+            'date': end - interval * (offset + i),
+            'weight': float(weight[i]),
+            'blood_pressure_systolic': int(systolic[i]),
+            'blood_pressure_diastolic': int(diastolic[i]),
+            'heart_rate': int(heart_rate[i]),
+            'steps': int(steps[i]),
+            'sleep_duration': float(sleep[i]),
+            'water_intake': float(water[i]),
+            'calorie_intake': int(calories[i]),
+            'stress_level': int(stress[i])
+        } for i in range(size)]
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+
+def logged_in_client(app: Flask, user_id: int) -> FlaskClient:
+    """
+    Create a test client whose session is logged in as a user.
+
+    Args:
+        app: Flask application instance
+        user_id: ID of the user to log in as
+
+    Returns:
+        Test client carrying the login session cookie
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def time_call(fn: Callable[[], Any], repeat: int = 5, warmup: int = 1) -> Dict[str, float]:
+    """
+    Time a callable over several runs.
+
+    Args:
+        fn: Zero-argument callable to time
+        repeat: Number of timed runs
+        warmup: Number of untimed runs before measuring
+
+    Returns:
+        Dictionary with ``median_ms``, ``min_ms`` and ``max_ms``
+    """
+    for _ in range(warmup):
+        fn()
+
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'median_ms': statistics.median(samples),
+        'min_ms': min(samples),
+        'max_ms': max(samples)
+    }
+
+
+def print_table(headers: Sequence[str], rows: Sequence[Sequence[Any]]) -> None:
+    """
+    Print rows as a fixed-width text table.
+
+    Args:
+        headers: Column headers
+        rows: Table rows; floats are printed with two decimals
+    """
+    def fmt(value: Any) -> str:
+        return f'{value:.2f}' if isinstance(value, float) else str(value)
+
+    cells = [[fmt(v) for v in row] for row in rows]
+    widths = [max(len(str(h)), *(len(r[i]) for r in cells)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in cells:
+        print('  '.join(v.rjust(w) for v, w in zip(row, widths)))
@@ -0,0 +1,268 @@
+"""
+Per-route SQL statement budgets with N+1 detection.
+
+Every route in ROUTE_BUDGETS is requested once, logged in, against a
+seeded database (health records with rollups and snapshots, baselines,
+intraday samples and a profile with gender and date of birth), and the
+SQL statements it executes are recorded with an engine event. A route
+fails its check when it executes more statements than its budget, or
+when one statement runs REPEAT_LIMIT or more times: the same SQL with
+different parameters, run once per item of something, is the signature
+of an N+1 query. Failures are reported with the statements the route ran.
+
+The budgets are the current statement counts, so any added query fails
+the check until its budget is raised on purpose. Statements run by the
+write queue's thread are recorded too, as they are part of the route.
+
+``assert_query_budget`` raises AssertionError with the same report, so
+the check can also be called from a test; tests/test_query_budget.py
+checks every route in ROUTE_BUDGETS that way.
+
+Usage:
+    python -m benchmarks.query_budget [--rows 2000] [--verbose]
+"""
+
+import argparse
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from flask.testing import FlaskClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.extensions import db
+from app.health_data.rollups import rebuild as rebuild_rollups
+from app.health_data.samples import append_samples
+from app.health_data.snapshots import rebuild as rebuild_snapshots
+from app.models import HealthData, User
+
+from .bench_baselines import seed_baselines
+from .common import create_bench_app, create_user, logged_in_client, seed_health_data
+
+# A statement run this many times in one request is reported as N+1
+REPEAT_LIMIT = 3
+
+# Transaction control is not counted against budgets
+TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT')
+
+# Statements in reports are cut to this many characters
+REPORT_WIDTH = 200
+
+
+@dataclass(frozen=True)
+class RouteBudget:
+    """A request and the most SQL statements it may execute."""
+    path: str
+    budget: int
+    method: str = 'GET'
+    data: Optional[Dict[str, Any]] = None
+
+
+# {record} is replaced by the ID of one of the seeded records. The
+# dashboard's third statement loads the baseline index, once per process
+ROUTE_BUDGETS = (
+    RouteBudget('/dashboard', 3),
+    RouteBudget('/history', 3),
+    RouteBudget('/history?page=2', 3),
+    RouteBudget('/add', 1),
+    RouteBudget('/edit/{record}', 2),
+    RouteBudget('/graph/weight', 3),
+    RouteBudget('/graph/heart_rate/week', 4),
+    RouteBudget('/api/series/weight?days=30', 2),
+    RouteBudget('/api/series/steps?days=365&resolution=week', 2),
+    RouteBudget('/api/sync?limit=100', 2),
+    RouteBudget('/api/samples/heart_rate?start=2024-01-01&end=2024-01-02&bucket=3600', 2),
+    RouteBudget('/chart/dashboard/weight.png', 3),
+    RouteBudget('/export/csv', 2),
+    RouteBudget('/import', 1),
+    RouteBudget('/profile', 1),
+    RouteBudget('/settings', 2),
+    RouteBudget('/add', 10, 'POST', {'weight': 71.5, 'heart_rate': 64}),
+)
+
+
+@dataclass
+class QueryLog:
+    """SQL statements executed while recording, in order."""
+    statements: List[str] = field(default_factory=list)
+
+    def repeats(self, limit: int = REPEAT_LIMIT) -> List[Tuple[str, int]]:
+        """
+        Find statements executed at least ``limit`` times.
+
+        Args:
+            limit: Executions from which a statement counts as repeated
+
+        Returns:
+            (statement, count) pairs, most repeated first
+        """
+        return [(statement, count) for statement, count in Counter(self.statements).most_common()
+                if count >= limit]
+
+
+@contextmanager
+def record_queries(engine: Engine) -> Iterator[QueryLog]:
+    """
+    Record the statements executed on an engine inside the block.
+
+    Args:
+        engine: Engine to listen on
+
+    Yields:
+        QueryLog filled in as statements run
+    """
+    log = QueryLog()
+    lock = threading.Lock()
+
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any,
+                              context: Any, executemany: bool) -> None:
+        statement = ' '.join(statement.split())
+        if not statement.upper().startswith(TRANSACTION_CONTROL):
+            with lock:
+                log.statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield log
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@dataclass
+class BudgetResult:
+    """Outcome of checking one route."""
+    route: RouteBudget
+    path: str
+    status: int
+    log: QueryLog
+
+    @property
+    def count(self) -> int:
+        return len(self.log.statements)
+
+    @property
+    def failed(self) -> bool:
+        return self.status >= 400 or self.count > self.route.budget or bool(self.log.repeats())
+
+    def report(self) -> str:
+        """Describe what the route ran and why it failed, if it did."""
+        lines = [f'{self.route.method} {self.path}: {self.count} statements '
+                 f'(budget {self.route.budget}), status {self.status}']
+        for statement, count in self.log.repeats():
+            lines.append(f'  N+1: {count}x {_shorten(statement)}')
+        for number, statement in enumerate(self.log.statements, 1):
+            lines.append(f'  {number:3}. {_shorten(statement)}')
+        return '\n'.join(lines)
+
+
+def _shorten(statement: str) -> str:
+    return statement if len(statement) <= REPORT_WIDTH else statement[:REPORT_WIDTH - 3] + '...'
+
+
+def check_route(client: FlaskClient, engine: Engine, route: RouteBudget,
+                substitutions: Optional[Dict[str, Any]] = None) -> BudgetResult:
+    """
+    Request a route and record the statements it executes.
+
+    Args:
+        client: Logged-in test client
+        engine: Engine the app uses
+        route: Route and budget to check
+        substitutions: Values for placeholders such as {record} in the path
+
+    Returns:
+        BudgetResult of the request
+    """
+    path = route.path.format(**(substitutions or {}))
+    with record_queries(engine) as log:
+        response = client.open(path, method=route.method, data=route.data)
+        # Streamed responses run their queries while being read
+        response.get_data()
+        response.close()
+    return BudgetResult(route, path, response.status_code, log)
+
+
+def assert_query_budget(client: FlaskClient, engine: Engine, path: str, budget: int,
+                        method: str = 'GET', data: Optional[Dict[str, Any]] = None) -> QueryLog:
+    """
+    Fail if a request executes more statements than its budget or repeats one.
+
+    Args:
+        client: Logged-in test client
+        engine: Engine the app uses
+        path: Path to request
+        budget: Most statements the request may execute
+        method: HTTP method
+        data: Form data to send
+
+    Returns:
+        QueryLog of the request
+
+    Raises:
+        AssertionError: With the statements the request ran, if it failed
+    """
+    result = check_route(client, engine, RouteBudget(path, budget, method, data))
+    assert not result.failed, result.report()
+    return result.log
+
+
+def seed_budget_database(rows: int) -> Dict[str, int]:
+    """
+    Seed the current app's database for the budget checks.
+
+    Args:
+        rows: Number of hourly health records
+
+    Returns:
+        IDs to log in with and to substitute into paths: user and record
+    """
+    user_id = create_user('budget')
+    user = db.session.get(User, user_id)
+    user.gender = 'female'
+    user.date_of_birth = date(1985, 6, 1)
+    user.initialize_settings()
+    db.session.commit()
+    seed_health_data(user_id, rows)
+    rebuild_rollups()
+    rebuild_snapshots()
+    seed_baselines()
+    times = np.datetime64(datetime(2024, 1, 1), 's') + np.arange(0, 2 * 86400, 60).astype('timedelta64[s]')
+    append_samples(user_id, 'heart_rate', times, np.full(len(times), 70.0))
+    db.session.commit()
+    record_id = db.session.query(HealthData.id).filter_by(user_id=user_id).order_by(HealthData.id).limit(1).scalar()
+    return {'user': user_id, 'record': record_id}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--verbose', action='store_true', help='list the statements of every route')
+    args = parser.parse_args()
+
+    app = create_bench_app(CHART_RENDER_WORKERS=0)
+    with app.app_context():
+        ids = seed_budget_database(args.rows)
+        engine = db.engine
+        db.session.remove()
+    client = logged_in_client(app, ids['user'])
+
+    failures = 0
+    for route in ROUTE_BUDGETS:
+        result = check_route(client, engine, route, ids)
+        failures += result.failed
+        print(f'{"FAIL" if result.failed else "ok  "} {route.method:4} {result.path:70} '
+              f'{result.count:3} / {route.budget}')
+        if result.failed or args.verbose:
+            print(result.report())
+    print(f'{len(ROUTE_BUDGETS) - failures} of {len(ROUTE_BUDGETS)} routes within budget')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,18 @@
 from app import create_app
 
-app = create_app()
+# The app is only built here when run directly, or when a WSGI server asks
+# for run:app (wsgi:app is the preferred entry point), so chart render
+# workers, which re-import this module when started with 'spawn', do not
+# each build one too. 'flask --app run' finds create_app and calls it
+
+
+def __getattr__(name):
+    if name == 'app':
+        from wsgi import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    app = create_app()
+    app.run(debug=True)
@@ -0,0 +1,58 @@
+"""
+Shared fixtures for the Health Monitor tests.
+
+The tests run against one application per session, bound to a scratch
+SQLite database seeded as ``benchmarks.query_budget`` seeds it.
+"""
+
+from typing import Any, Callable, Dict, Optional
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.extensions import db
+from benchmarks.common import create_bench_app, logged_in_client
+from benchmarks.query_budget import QueryLog, assert_query_budget, seed_budget_database
+
+# Hourly health records seeded for the test user
+SEED_ROWS = 2000
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory: pytest.TempPathFactory) -> Flask:
+    """Application bound to a scratch database, with charts rendered inline."""
+    return create_bench_app(str(tmp_path_factory.mktemp('db') / 'health_monitor.db'), CHART_RENDER_WORKERS=0)
+
+
+@pytest.fixture(scope='session')
+def seed(app: Flask) -> Dict[str, int]:
+    """IDs of the seeded user and one of their records."""
+    with app.app_context():
+        ids = seed_budget_database(SEED_ROWS)
+        db.session.remove()
+    return ids
+
+
+@pytest.fixture
+def client(app: Flask, seed: Dict[str, int]) -> FlaskClient:
+    """Test client logged in as the seeded user."""
+    return logged_in_client(app, seed['user'])
+
+
+@pytest.fixture
+def query_budget(app: Flask, client: FlaskClient,
+                 seed: Dict[str, int]) -> Callable[..., QueryLog]:
+    """
+    Check a request against a statement budget, as assert_query_budget does.
+
+    {record} in the path is replaced by the seeded record's ID.
+    """
+    with app.app_context():
+        engine = db.engine
+
+    def check(path: str, budget: int, method: str = 'GET',
+              data: Optional[Dict[str, Any]] = None) -> QueryLog:
+        return assert_query_budget(client, engine, path.format(**seed), budget, method, data)
+
+    return check
@@ -0,0 +1,58 @@
+"""The about page and account deletion."""
+
+from datetime import datetime
+
+import numpy as np
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.extensions import db
+from app.health_data.samples import append_samples
+from app.health_data.writes import add_record, on_record_deleted
+from app.models import (
+    HealthData, HealthDataDailyRollup, HealthDataTombstone, HealthDataWeeklyRollup, IdempotencyKey,
+    SampleChunk, User, UserDataVersion, UserLatestSnapshot, UserSettings
+)
+from benchmarks.common import create_user, logged_in_client
+
+# Meets the password rules the deletion form checks
+PASSWORD = 'Leaving-Pass1!'
+
+# Every table holding rows of one user
+USER_MODELS = (HealthData, HealthDataDailyRollup, HealthDataWeeklyRollup, UserLatestSnapshot,
+               HealthDataTombstone, IdempotencyKey, SampleChunk, UserDataVersion, UserSettings)
+
+
+def test_about(client: FlaskClient) -> None:
+    response = client.get('/about')
+    assert response.status_code == 200
+    assert b'About Health Monitor' in response.data
+
+
+def test_delete_account_removes_all_user_data(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id = create_user('leaving')
+        user = db.session.get(User, user_id)
+        user.set_password(PASSWORD)
+        user.initialize_settings()
+        add_record(user_id, {'date': datetime(2024, 3, 1, 8), 'weight': 70.0}, 'key-1')
+        record_id = add_record(user_id, {'date': datetime(2024, 3, 2, 8), 'heart_rate': 60})
+        db.session.delete(db.session.get(HealthData, record_id))
+        on_record_deleted(user_id, record_id, datetime(2024, 3, 2, 8))
+        append_samples(user_id, 'heart_rate', np.array(['2024-03-01T08:00'], 'datetime64[s]'), [65.0])
+        db.session.commit()
+        assert all(model.query.filter_by(user_id=user_id).count() for model in USER_MODELS)
+        db.session.remove()
+
+    client = logged_in_client(app, user_id)
+    response = client.post('/delete-account', data={
+        'confirm_text': 'DELETE', 'password': PASSWORD, 'accept_terms': 'y'
+    })
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert db.session.get(User, user_id) is None
+        assert not [model.__name__ for model in USER_MODELS if model.query.filter_by(user_id=user_id).count()]
+        # Other users keep their data
+        assert HealthData.query.filter_by(user_id=seed['user']).count()
+        db.session.remove()
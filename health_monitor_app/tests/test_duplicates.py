@@ -0,0 +1,61 @@
+"""Duplicate health records: the startup check and ``flask db dedupe``."""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+from app import SchemaUpgradeError
+from app.extensions import chart_cache, chart_renderer, db, write_queue
+from app.models import HealthData, HealthDataTombstone
+from benchmarks.common import create_bench_app, create_user
+
+DUPLICATED_DATE = datetime(2024, 3, 1, 8)
+
+
+@pytest.fixture
+def legacy_db(app: Flask, tmp_path: Path) -> Iterator[str]:
+    """Path of a database from before (user_id, date) was unique, with one duplicate."""
+    path = str(tmp_path / 'legacy.db')
+    with create_bench_app(path).app_context():
+        user_id = create_user('legacy')
+        db.session.execute(text('DROP INDEX ux_health_data_user_date'))
+        db.session.execute(text('CREATE INDEX ix_health_data_user_date ON health_data (user_id, date)'))
+        for weight in (70.0, 71.0):
+            db.session.add(HealthData(user_id=user_id, date=DUPLICATED_DATE, weight=weight))
+        db.session.commit()
+        db.session.remove()
+    yield path
+    # Every create_app() binds the shared extensions to the new app; give
+    # the writer thread and the chart services back to the session's app
+    for extension in (chart_cache, chart_renderer, write_queue):
+        extension.init_app(app)
+
+
+def test_startup_refuses_while_duplicates_remain(legacy_db: str) -> None:
+    with pytest.raises(SchemaUpgradeError, match='1 duplicate health records of 1 users'):
+        create_bench_app(legacy_db)
+
+
+def test_dedupe_lists_and_removes_duplicates(legacy_db: str) -> None:
+    app = create_bench_app(legacy_db, ALLOW_DUPLICATE_RECORDS=True)
+    runner = app.test_cli_runner()
+
+    dry_run = runner.invoke(args=['db', 'dedupe', '--dry-run'])
+    assert dry_run.exit_code == 0
+    assert f'record 1 at {DUPLICATED_DATE}' in dry_run.output
+    with app.app_context():
+        assert db.session.query(HealthData).count() == 2
+
+    result = runner.invoke(args=['db', 'dedupe'])
+    assert result.exit_code == 0
+    assert '1 duplicate records of 1 users' in result.output
+    with app.app_context():
+        assert [(record.id, record.weight) for record in db.session.query(HealthData)] == [(2, 71.0)]
+        assert [tombstone.health_data_id for tombstone in db.session.query(HealthDataTombstone)] == [1]
+        db.session.remove()
+
+    create_bench_app(legacy_db)
@@ -0,0 +1,42 @@
+"""Full-history exports stream every seeded record in each format."""
+
+import io
+import json
+
+import pytest
+from flask.testing import FlaskClient
+
+from app.health_data.export import EXPORT_COLUMNS
+
+# Other tests may add records, so exports hold at least this many
+from .conftest import SEED_ROWS
+
+
+def test_export_ndjson(client: FlaskClient) -> None:
+    response = client.get('/export/ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) >= SEED_ROWS
+    assert all('date' in row for row in rows)
+
+
+def test_export_parquet(client: FlaskClient) -> None:
+    pq = pytest.importorskip('pyarrow.parquet')
+    response = client.get('/export/parquet')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.apache.parquet'
+    assert 'attachment' in response.headers['Content-Disposition']
+    table = pq.read_table(io.BytesIO(response.get_data()))
+    assert table.column_names == list(EXPORT_COLUMNS)
+    assert table.num_rows >= SEED_ROWS
+    ndjson = client.get('/export/ndjson').get_data(as_text=True).splitlines()
+    assert table.num_rows == len(ndjson)
+
+
+def test_export_parquet_unavailable(client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Servers without pyarrow send the user back to the history page
+    monkeypatch.setattr('app.health_data.export.pq', None)
+    response = client.get('/export/parquet')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/history')
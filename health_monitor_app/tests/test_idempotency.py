@@ -0,0 +1,63 @@
+"""Idempotent record submission and upserts."""
+
+from datetime import datetime
+from typing import Any, Dict
+
+import pytest
+from flask import Flask
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.health_data import writes
+from app.health_data.writes import add_record
+from app.models import HealthData, IdempotencyKey
+from benchmarks.common import create_user
+
+
+def _records(user_id: int) -> list:
+    return [(record.date, record.weight)
+            for record in db.session.query(HealthData).filter_by(user_id=user_id).order_by(HealthData.date)]
+
+
+def test_same_date_replaces_the_record(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id = create_user(f'upserter-{seed["user"]}')
+        first = add_record(user_id, {'date': datetime(2024, 3, 1, 8), 'weight': 70.0})
+        second = add_record(user_id, {'date': datetime(2024, 3, 1, 8), 'weight': 71.0})
+        db.session.commit()
+        assert first == second
+        assert _records(user_id) == [(datetime(2024, 3, 1, 8), 71.0)]
+
+
+def test_repeated_key_returns_the_original_record(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id = create_user(f'retrier-{seed["user"]}')
+        first = add_record(user_id, {'date': datetime(2024, 3, 1, 8), 'weight': 70.0}, 'retry-1')
+        db.session.commit()
+        again = add_record(user_id, {'date': datetime(2024, 3, 2, 8), 'weight': 72.0}, 'retry-1')
+        db.session.commit()
+        assert again == first
+        assert _records(user_id) == [(datetime(2024, 3, 1, 8), 70.0)]
+
+
+def test_key_taken_by_a_concurrent_submission(app: Flask, seed: dict,
+                                              monkeypatch: pytest.MonkeyPatch) -> None:
+    with app.app_context():
+        user_id = create_user(f'racer-{seed["user"]}')
+        winner = add_record(user_id, {'date': datetime(2024, 3, 1, 8), 'weight': 70.0})
+        db.session.commit()
+        upsert_record = writes.upsert_record
+
+        def commit_competing_key(user: int, values: Dict[str, Any]) -> int:
+            # The other submission commits its key after this one's lookup
+            with db.engine.begin() as connection:
+                connection.execute(insert(IdempotencyKey), {
+                    'user_id': user, 'key': 'race-1', 'health_data_id': winner,
+                    'created_at': datetime.utcnow()
+                })
+            return upsert_record(user, values)
+
+        monkeypatch.setattr(writes, 'upsert_record', commit_competing_key)
+        assert add_record(user_id, {'date': datetime(2024, 3, 2, 8), 'weight': 72.0}, 'race-1') == winner
+        db.session.commit()
+        assert _records(user_id) == [(datetime(2024, 3, 1, 8), 70.0)]
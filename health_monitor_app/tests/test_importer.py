@@ -0,0 +1,97 @@
+"""Bulk import: values land in their own columns and invalid rows are rejected."""
+
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+import pytest
+from flask import Flask
+
+from app.extensions import db, write_queue
+from app.health_data import importer
+from app.health_data.importer import IMPORT_FIELDS, import_file
+from app.models import HealthData
+from benchmarks.common import create_user
+
+# A value for every imported column, each different from the others, so
+# a value written to the wrong column is noticed
+RECORD: Dict[str, Any] = {
+    'weight': 71.5, 'blood_pressure_systolic': 121, 'blood_pressure_diastolic': 79, 'heart_rate': 63,
+    'temperature': 36.6, 'oxygen_saturation': 97.5, 'steps': 8432, 'exercise_duration': 45,
+    'calories_burned': 512, 'sleep_duration': 7.25, 'sleep_quality': 8, 'water_intake': 2.2,
+    'calorie_intake': 2150, 'stress_level': 3, 'mood': 'calm', 'notes': 'after a run'
+}
+
+
+def _import(app: Flask, username: str, text: str, fmt: str):
+    with app.app_context():
+        user_id = create_user(username)
+        result = import_file(user_id, io.StringIO(text), fmt)
+        records = HealthData.query.filter_by(user_id=user_id).order_by(HealthData.date).all()
+        db.session.remove()
+    return result, records
+
+
+def _csv(rows) -> str:
+    header = ['date', *RECORD]
+    lines = [','.join(header)]
+    lines.extend(','.join(str(row.get(name, '')) for name in header) for row in rows)
+    return '\n'.join(lines) + '\n'
+
+
+def test_every_column_is_mapped() -> None:
+    assert set(RECORD) == set(IMPORT_FIELDS)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson'])
+def test_values_land_in_their_columns(app: Flask, fmt: str) -> None:
+    row = {'date': '2024-02-01T07:30:00', **RECORD}
+    text = _csv([row]) if fmt == 'csv' else json.dumps(row) + '\n'
+    result, records = _import(app, f'mapping-{fmt}', text, fmt)
+    assert (result.imported, result.rejected) == (1, 0)
+    assert records[0].date == datetime(2024, 2, 1, 7, 30)
+    assert {name: getattr(records[0], name) for name in RECORD} == RECORD
+
+
+def test_column_order_does_not_matter(app: Flask, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Reordering the form's fields must not move values between columns
+    monkeypatch.setattr(importer, 'IMPORT_FIELDS', dict(reversed(list(IMPORT_FIELDS.items()))))
+    result, records = _import(app, 'mapping-reversed', _csv([{'date': '2024-02-01', **RECORD}]), 'csv')
+    assert result.imported == 1
+    assert {name: getattr(records[0], name) for name in RECORD} == RECORD
+
+
+def test_invalid_rows_are_rejected_with_their_line(app: Flask) -> None:
+    text = _csv([
+        {'date': '2024-02-01', 'heart_rate': 64},
+        {'date': 'not a date', 'heart_rate': 64},
+        {'date': '2024-02-03', 'heart_rate': 400},
+        {'date': '2024-02-04', 'mood': 'ecstatic'},
+        {'date': '2024-02-05', 'steps': 'many'},
+        {'date': '2024-02-06', 'weight': 80.5},
+    ])
+    result, records = _import(app, 'validation', text, 'csv')
+    assert (result.imported, result.rejected) == (2, 4)
+    assert [line for line, _ in result.errors] == [3, 4, 5, 6]
+    assert [record.date.day for record in records] == [1, 6]
+
+
+def test_later_rows_replace_earlier_ones(app: Flask) -> None:
+    text = _csv([{'date': '2024-02-01', 'weight': 70}, {'date': '2024-02-01', 'weight': 71}])
+    _, records = _import(app, 'replace', text, 'csv')
+    assert [record.weight for record in records] == [71]
+
+
+def test_missing_date_column(app: Flask) -> None:
+    with app.app_context(), pytest.raises(ValueError):
+        import_file(create_user('no-date'), io.StringIO('weight\n70\n'), 'csv')
+
+
+def test_each_chunk_is_one_queued_write(app: Flask, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(importer, 'IMPORT_BATCH_SIZE', 2)
+    rows = [{'date': f'2024-04-0{day}', 'weight': 70 + day} for day in range(1, 6)]
+    writes = write_queue.stats()['writes']
+    result, records = _import(app, 'chunked', _csv(rows), 'csv')
+    assert result.imported == len(records) == 5
+    assert write_queue.stats()['writes'] - writes == 3
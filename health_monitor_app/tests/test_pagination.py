@@ -0,0 +1,109 @@
+"""Keyset pagination of the history page."""
+
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import pytest
+from flask import Flask
+from itsdangerous import URLSafeSerializer
+
+from app.extensions import db
+from app.health_data.pagination import NEXT, encode_cursor, paginate_history
+from app.health_data.writes import add_record, on_record_deleted
+from app.models import HealthData
+from benchmarks.common import create_user, logged_in_client
+
+# Seven daily records paged three at a time: pages of 3, 3 and 1
+RECORDS = 7
+PER_PAGE = 3
+
+
+@pytest.fixture(scope='module')
+def pager(app: Flask, seed: dict) -> int:
+    """ID of a user with one record a day on the first RECORDS days of March."""
+    with app.app_context():
+        user_id = create_user(f'pager-{seed["user"]}')
+        for day in range(RECORDS):
+            add_record(user_id, {'date': datetime(2024, 3, 1, 8) + timedelta(days=day), 'weight': 70.0 + day})
+        db.session.commit()
+        db.session.remove()
+    return user_id
+
+
+def _days(page) -> List[int]:
+    return [record.date.day for record in page.items]
+
+
+def _page(user_id: int, cursor: Optional[str] = None):
+    return paginate_history(user_id, cursor, PER_PAGE)
+
+
+def test_pages_meet_without_gaps_or_overlaps(app: Flask, pager: int) -> None:
+    with app.app_context():
+        first = _page(pager)
+        second = _page(pager, first.next_cursor)
+        last = _page(pager, second.next_cursor)
+        assert [_days(first), _days(second), _days(last)] == [[7, 6, 5], [4, 3, 2], [1]]
+        assert (first.has_prev, first.has_next) == (False, True)
+        assert (second.has_prev, second.has_next) == (True, True)
+        assert (last.has_prev, last.has_next) == (True, False)
+
+
+def test_previous_cursors_lead_back_to_the_same_pages(app: Flask, pager: int) -> None:
+    with app.app_context():
+        second = _page(pager, _page(pager).next_cursor)
+        last = _page(pager, second.next_cursor)
+        back = _page(pager, last.prev_cursor)
+        assert _days(back) == _days(second)
+        first = _page(pager, back.prev_cursor)
+        assert _days(first) == [7, 6, 5]
+        assert not first.has_prev
+
+
+def test_full_last_page_has_no_next_page(app: Flask, pager: int) -> None:
+    with app.app_context():
+        page = paginate_history(pager, None, RECORDS)
+        assert len(page.items) == RECORDS
+        assert page.next_cursor is None
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    URLSafeSerializer('another-secret', salt='history-cursor').dumps([NEXT, '2024-03-04T08:00:00', 1]),
+])
+def test_invalid_cursors_show_the_first_page(app: Flask, pager: int, cursor: str) -> None:
+    with app.app_context():
+        assert _days(_page(pager, cursor)) == [7, 6, 5]
+
+
+def test_tampered_cursor_shows_the_first_page(app: Flask, pager: int) -> None:
+    with app.app_context():
+        cursor = _page(pager).next_cursor
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        assert _days(_page(pager, tampered)) == [7, 6, 5]
+        # A validly signed cursor with an unknown direction is no better
+        forged = URLSafeSerializer(app.config['SECRET_KEY'], salt='history-cursor').dumps(
+            ['x', '2024-03-04T08:00:00', 1])
+        assert _days(_page(pager, forged)) == [7, 6, 5]
+
+
+def test_cursor_of_a_deleted_record_keeps_its_place(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id = create_user(f'pager-deleting-{seed["user"]}')
+        for day in range(RECORDS):
+            add_record(user_id, {'date': datetime(2024, 3, 1, 8) + timedelta(days=day), 'weight': 70.0})
+        db.session.commit()
+        cursor = _page(user_id).next_cursor
+        edge = HealthData.query.filter_by(user_id=user_id, date=datetime(2024, 3, 5, 8)).one()
+        record_id = edge.id
+        assert cursor == encode_cursor(NEXT, edge)
+        db.session.delete(edge)
+        on_record_deleted(user_id, record_id, datetime(2024, 3, 5, 8))
+        db.session.commit()
+        assert _days(_page(user_id, cursor)) == [4, 3, 2]
+        db.session.remove()
+
+
+def test_history_route_ignores_a_bad_cursor(app: Flask, pager: int) -> None:
+    response = logged_in_client(app, pager).get('/history?cursor=garbage')
+    assert response.status_code == 200
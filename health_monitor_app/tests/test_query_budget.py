@@ -0,0 +1,12 @@
+"""Every route in ROUTE_BUDGETS stays within its SQL statement budget, without N+1 queries."""
+
+from typing import Callable
+
+import pytest
+
+from benchmarks.query_budget import ROUTE_BUDGETS, QueryLog, RouteBudget
+
+
+@pytest.mark.parametrize('route', ROUTE_BUDGETS, ids=lambda route: f'{route.method} {route.path}')
+def test_route_within_budget(query_budget: Callable[..., QueryLog], route: RouteBudget) -> None:
+    query_budget(route.path, route.budget, route.method, route.data)
@@ -0,0 +1,69 @@
+"""The sample store's append API and graphs of sampled metrics."""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.extensions import db
+from app.health_data.samples import append_samples, fetch_graph_series
+from app.health_data.stats import summarize_window
+from app.health_data.writes import add_record
+from benchmarks.common import create_user, logged_in_client
+
+# Ten minutes of samples, one a minute, on the second of three logged days
+SAMPLE_TIMES = np.arange('2024-03-02T10:00', '2024-03-02T10:10', dtype='datetime64[m]')
+WINDOW = (datetime(2024, 3, 1), datetime(2024, 3, 7, 23, 59, 59))
+
+
+@pytest.fixture
+def sampler(app: Flask, seed: dict) -> FlaskClient:
+    """Test client logged in as a user of their own, so samples stay out of other tests."""
+    with app.app_context():
+        user_id = create_user(f'sampler-{seed["user"]}')
+    return logged_in_client(app, user_id)
+
+
+@pytest.fixture(scope='module')
+def sampled_user(app: Flask, seed: dict) -> int:
+    """ID of a user with records on March 1st and 3rd and samples on the 2nd."""
+    with app.app_context():
+        user_id = create_user(f'sampled-{seed["user"]}')
+        add_record(user_id, {'date': datetime(2024, 3, 1, 8), 'steps': 5000, 'heart_rate': 80})
+        add_record(user_id, {'date': datetime(2024, 3, 3, 8), 'steps': 7000, 'heart_rate': 90})
+        append_samples(user_id, 'steps', SAMPLE_TIMES, np.full(10, 100.0))
+        append_samples(user_id, 'heart_rate', SAMPLE_TIMES, np.full(10, 60.0))
+        db.session.commit()
+    return user_id
+
+
+def test_append_rejects_a_body_that_is_not_an_object(client: FlaskClient) -> None:
+    response = client.post('/api/samples/heart_rate', json=[[1700000000000], [60]])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Expected a JSON object.'}
+
+
+def test_append_stores_samples(sampler: FlaskClient) -> None:
+    response = sampler.post('/api/samples/heart_rate',
+                            json={'t': [1700000000000, 1700000060000], 'v': [60, None]})
+    assert response.status_code == 200
+    assert response.get_json() == {'stored': 1}
+
+
+def test_graphs_merge_samples_with_records(app: Flask, sampled_user: int) -> None:
+    with app.app_context():
+        df = fetch_graph_series(sampled_user, 'heart_rate', *WINDOW)
+        summary = summarize_window(df, ['heart_rate'])['heart_rate']
+    assert df['date'].is_monotonic_increasing
+    assert (summary.count, summary.minimum, summary.maximum) == (12, 60.0, 90.0)
+    assert summary.mean == pytest.approx((80 + 90 + 10 * 60) / 12)
+
+
+def test_step_samples_count_as_one_daily_total(app: Flask, sampled_user: int) -> None:
+    with app.app_context():
+        df = fetch_graph_series(sampled_user, 'steps', *WINDOW)
+        summary = summarize_window(df, ['steps'])['steps']
+    assert df['steps'].tolist() == [5000.0, 1000.0, 7000.0]
+    assert (summary.count, summary.mean, summary.latest) == (3, pytest.approx(13000 / 3), 7000.0)
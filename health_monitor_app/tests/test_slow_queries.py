@@ -0,0 +1,45 @@
+"""The slow-query log keeps parameter values out of the log by default."""
+
+import logging
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from app.slow_queries import SlowQueryLog
+
+
+@pytest.fixture
+def messages() -> Iterator[List[str]]:
+    """Messages the slow-query log writes while the test runs."""
+    logged: List[str] = []
+
+    class Collect(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            logged.append(record.getMessage())
+
+    handler = Collect()
+    logger = logging.getLogger('app.slow_queries')
+    logger.addHandler(handler)
+    yield logged
+    logger.removeHandler(handler)
+
+
+def _run_slowly(slow_log: SlowQueryLog) -> None:
+    # Every statement counts as slow with a zero threshold
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', slow_log.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', slow_log.after_cursor_execute)
+    with engine.connect() as connection:
+        connection.execute(text('SELECT :user_id, :weight'), {'user_id': 4217, 'weight': 83.25})
+
+
+def test_parameters_are_redacted(messages: List[str]) -> None:
+    _run_slowly(SlowQueryLog(0.0, 60, explain=False))
+    assert 'Parameters: 2 (int, float)' in messages[0]
+    assert '4217' not in messages[0] and '83.25' not in messages[0]
+
+
+def test_parameter_values_when_enabled(messages: List[str]) -> None:
+    _run_slowly(SlowQueryLog(0.0, 60, explain=False, log_parameters=True))
+    assert 'Parameters: (4217, 83.25)' in messages[0]
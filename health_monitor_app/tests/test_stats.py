@@ -0,0 +1,13 @@
+"""Display formatting of the graph statistics."""
+
+from app.health_data.stats import MetricSummary, graph_stats
+
+
+def test_whole_number_metrics_are_rounded() -> None:
+    # Daily means from the rollups are not whole numbers
+    summary = MetricSummary(count=4, mean=71.6, minimum=60.4, maximum=88.6, latest=72.8, slope=None,
+                            trend='neutral')
+    stats = graph_stats({'heart_rate': summary}, 'heart_rate')
+    assert stats['latest']['heart_rate'] == 73
+    assert stats['averages']['heart_rate'] == 72
+    assert (stats['minimums']['heart_rate'], stats['maximums']['heart_rate']) == (60, 89)
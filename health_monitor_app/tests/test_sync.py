@@ -0,0 +1,124 @@
+"""Delta sync: paging through a user's changes by change_seq, with tombstones."""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from flask import Flask
+from itsdangerous import URLSafeSerializer
+
+from app.extensions import db
+from app.health_data.sync import fetch_changes
+from app.health_data.writes import add_record, on_record_deleted, on_record_updated
+from app.models import HealthData
+from benchmarks.common import create_user, logged_in_client
+
+
+def _day(day: int) -> datetime:
+    return datetime(2024, 3, 1, 8) + timedelta(days=day - 1)
+
+
+def _new_user(name: str, days: int) -> Tuple[int, List[int]]:
+    # A user with a weight record on each of the first `days` days of March
+    user_id = create_user(name)
+    ids = [add_record(user_id, {'date': _day(day), 'weight': 70.0 + day}) for day in range(1, days + 1)]
+    db.session.commit()
+    return user_id, ids
+
+
+def _update(record_id: int, weight: float) -> None:
+    record = db.session.get(HealthData, record_id)
+    record.weight = weight
+    on_record_updated(record, record.date)
+    db.session.commit()
+
+
+def _delete(record_id: int) -> None:
+    record = db.session.get(HealthData, record_id)
+    user_id, record_date = record.user_id, record.date
+    db.session.delete(record)
+    on_record_deleted(user_id, record_id, record_date)
+    db.session.commit()
+
+
+def _sync_all(user_id: int, token: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], str, int]:
+    # Follow has_more to the end; returns every change, the final token
+    # and the number of pages
+    changes: List[Dict[str, Any]] = []
+    pages = 0
+    while True:
+        page = fetch_changes(user_id, token, limit)
+        changes.extend(page.changes)
+        token = page.token
+        pages += 1
+        if not page.has_more:
+            return changes, token, pages
+
+
+def _ops(changes: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    return [(change['op'], change['id']) for change in changes]
+
+
+def test_full_sync_pages_through_every_record(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id, ids = _new_user(f'syncer-{seed["user"]}', 5)
+        changes, _, pages = _sync_all(user_id, None, 2)
+        assert _ops(changes) == [('upsert', record_id) for record_id in ids]
+        assert pages == 3
+        db.session.remove()
+
+
+def test_full_sync_leaves_out_deleted_records(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id, ids = _new_user(f'syncer-fresh-{seed["user"]}', 3)
+        _delete(ids[1])
+        changes, _, _ = _sync_all(user_id, None, 10)
+        assert _ops(changes) == [('upsert', ids[0]), ('upsert', ids[2])]
+        db.session.remove()
+
+
+def test_incremental_sync_pages_across_tombstones(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id, ids = _new_user(f'syncer-delta-{seed["user"]}', 5)
+        _, token, _ = _sync_all(user_id, None, 10)
+
+        # Changes interleave updates and deletes in change_seq order
+        _delete(ids[0])
+        _update(ids[3], 90.0)
+        _delete(ids[2])
+        _update(ids[1], 80.0)
+        _update(ids[3], 91.0)
+
+        changes, token, pages = _sync_all(user_id, token, 1)
+        assert _ops(changes) == [('delete', ids[0]), ('delete', ids[2]), ('upsert', ids[1]), ('upsert', ids[3])]
+        assert pages == 4
+        # A record changed twice is sent once, in its current state
+        assert changes[-1]['weight'] == 91.0
+        assert changes[0]['date'] == _day(1).isoformat()
+
+        # Caught up: nothing more until the next change
+        page = fetch_changes(user_id, token, 10)
+        assert (page.changes, page.has_more, page.token) == ([], False, token)
+        db.session.remove()
+
+
+def test_invalid_tokens_are_rejected(app: Flask, seed: dict) -> None:
+    client = logged_in_client(app, seed['user'])
+    forged = URLSafeSerializer('another-secret', salt='sync-token').dumps([0, 0])
+    for token in ('garbage', forged):
+        response = client.get(f'/api/sync?token={token}')
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'Invalid sync token.'}
+    with app.app_context(), pytest.raises(ValueError):
+        fetch_changes(seed['user'], 'garbage', 10)
+
+
+def test_api_follows_the_token(app: Flask, seed: dict) -> None:
+    with app.app_context():
+        user_id, ids = _new_user(f'syncer-api-{seed["user"]}', 3)
+        db.session.remove()
+    client = logged_in_client(app, user_id)
+    first = client.get('/api/sync?limit=2').get_json()
+    second = client.get(f'/api/sync?limit=2&token={first["token"]}').get_json()
+    assert (first['has_more'], second['has_more']) == (True, False)
+    assert [change['id'] for change in first['changes'] + second['changes']] == ids
@@ -0,0 +1,6 @@
+from app import create_app
+
+# WSGI entry point for production servers, e.g. 'gunicorn wsgi:app'.
+# Chart render workers only re-import the server's main module, never this
+# one, so they do not build an app of their own
+app = create_app()